@@ -0,0 +1,43 @@
+"""Add class capacity and class_waitlist table
+
+Revision ID: 0a9e3c7f5b41
+Revises: f7b1c5d3e892
+Create Date: 2026-10-19 20:14:58.660371
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0a9e3c7f5b41'
+down_revision: Union[str, Sequence[str], None] = 'f7b1c5d3e892'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('classes', sa.Column('capacity', sa.Integer(), nullable=True))
+    op.create_table(
+        'class_waitlist',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('class_id', sa.Integer(), nullable=False),
+        sa.Column('student_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['class_id'], ['classes.id'], ),
+        sa.ForeignKeyConstraint(['student_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_class_waitlist_id'), 'class_waitlist', ['id'], unique=False)
+    op.create_index('uq_class_waitlist_class_id_student_id', 'class_waitlist', ['class_id', 'student_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_class_waitlist_class_id_student_id', table_name='class_waitlist')
+    op.drop_index(op.f('ix_class_waitlist_id'), table_name='class_waitlist')
+    op.drop_table('class_waitlist')
+    op.drop_column('classes', 'capacity')
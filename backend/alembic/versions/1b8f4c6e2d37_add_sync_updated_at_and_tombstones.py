@@ -0,0 +1,53 @@
+"""Add updated_at for delta sync, enrollment created_at and sync_tombstones table
+
+Revision ID: 1b8f4c6e2d37
+Revises: 0a9e3c7f5b41
+Create Date: 2026-10-19 21:03:12.418560
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1b8f4c6e2d37'
+down_revision: Union[str, Sequence[str], None] = '0a9e3c7f5b41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in ('assignments', 'submissions', 'announcements'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+        op.create_index(op.f(f'ix_{table}_updated_at'), table, ['updated_at'], unique=False)
+    op.add_column('enrollments', sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+    op.create_table(
+        'sync_tombstones',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('entity', sa.String(), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('class_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('deleted_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_sync_tombstones_id'), 'sync_tombstones', ['id'], unique=False)
+    op.create_index(op.f('ix_sync_tombstones_class_id'), 'sync_tombstones', ['class_id'], unique=False)
+    op.create_index(op.f('ix_sync_tombstones_user_id'), 'sync_tombstones', ['user_id'], unique=False)
+    op.create_index(op.f('ix_sync_tombstones_deleted_at'), 'sync_tombstones', ['deleted_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_sync_tombstones_deleted_at'), table_name='sync_tombstones')
+    op.drop_index(op.f('ix_sync_tombstones_user_id'), table_name='sync_tombstones')
+    op.drop_index(op.f('ix_sync_tombstones_class_id'), table_name='sync_tombstones')
+    op.drop_index(op.f('ix_sync_tombstones_id'), table_name='sync_tombstones')
+    op.drop_table('sync_tombstones')
+    op.drop_column('enrollments', 'created_at')
+    for table in ('announcements', 'submissions', 'assignments'):
+        op.drop_index(op.f(f'ix_{table}_updated_at'), table_name=table)
+        op.drop_column(table, 'updated_at')
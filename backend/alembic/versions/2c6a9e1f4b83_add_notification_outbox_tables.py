@@ -0,0 +1,63 @@
+"""Add notification_outbox and notification_deliveries tables
+
+Revision ID: 2c6a9e1f4b83
+Revises: 1b8f4c6e2d37
+Create Date: 2026-10-19 22:37:05.106284
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2c6a9e1f4b83'
+down_revision: Union[str, Sequence[str], None] = '1b8f4c6e2d37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'notification_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('event', sa.String(), nullable=False),
+        sa.Column('announcement_id', sa.Integer(), nullable=True),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('fanned_out_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_notification_outbox_id'), 'notification_outbox', ['id'], unique=False)
+    op.create_index(op.f('ix_notification_outbox_fanned_out_at'), 'notification_outbox', ['fanned_out_at'], unique=False)
+    op.create_table(
+        'notification_deliveries',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('outbox_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('channel', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['outbox_id'], ['notification_outbox.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_notification_deliveries_id'), 'notification_deliveries', ['id'], unique=False)
+    op.create_index('uq_notification_deliveries_outbox_user_channel', 'notification_deliveries', ['outbox_id', 'user_id', 'channel'], unique=True)
+    op.create_index('ix_notification_deliveries_status_next_attempt_at', 'notification_deliveries', ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_notification_deliveries_status_next_attempt_at', table_name='notification_deliveries')
+    op.drop_index('uq_notification_deliveries_outbox_user_channel', table_name='notification_deliveries')
+    op.drop_index(op.f('ix_notification_deliveries_id'), table_name='notification_deliveries')
+    op.drop_table('notification_deliveries')
+    op.drop_index(op.f('ix_notification_outbox_fanned_out_at'), table_name='notification_outbox')
+    op.drop_index(op.f('ix_notification_outbox_id'), table_name='notification_outbox')
+    op.drop_table('notification_outbox')
@@ -0,0 +1,28 @@
+"""Add schedules (end_time, start_time) index
+
+Revision ID: 3d7b0a5e8c12
+Revises: 2c6a9e1f4b83
+Create Date: 2026-10-19 18:41:09.517203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d7b0a5e8c12'
+down_revision: Union[str, Sequence[str], None] = '2c6a9e1f4b83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_schedules_end_time_start_time', 'schedules', ['end_time', 'start_time'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_schedules_end_time_start_time', table_name='schedules')
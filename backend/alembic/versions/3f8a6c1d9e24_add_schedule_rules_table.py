@@ -0,0 +1,44 @@
+"""Add schedule_rules table
+
+Revision ID: 3f8a6c1d9e24
+Revises: 9d4c1e7b2f60
+Create Date: 2026-10-19 14:20:51.774903
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f8a6c1d9e24'
+down_revision: Union[str, Sequence[str], None] = '9d4c1e7b2f60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'schedule_rules',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('class_id', sa.Integer(), nullable=False),
+        sa.Column('start_time', sa.DateTime(), nullable=False),
+        sa.Column('end_time', sa.DateTime(), nullable=False),
+        sa.Column('room_number', sa.String(), nullable=False),
+        sa.Column('rrule', sa.String(), nullable=False),
+        sa.Column('exdates', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(['class_id'], ['classes.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_schedule_rules_id'), 'schedule_rules', ['id'], unique=False)
+    op.create_index(op.f('ix_schedule_rules_class_id'), 'schedule_rules', ['class_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_schedule_rules_class_id'), table_name='schedule_rules')
+    op.drop_index(op.f('ix_schedule_rules_id'), table_name='schedule_rules')
+    op.drop_table('schedule_rules')
@@ -0,0 +1,38 @@
+"""Add updated_at to schedules and schedule_rules, calendar indexes
+
+Revision ID: 4a7d2e9c6b15
+Revises: 6e2b8d4f1a73
+Create Date: 2026-10-19 16:21:44.593017
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4a7d2e9c6b15'
+down_revision: Union[str, Sequence[str], None] = '6e2b8d4f1a73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('schedules', sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+    op.create_index(op.f('ix_schedules_updated_at'), 'schedules', ['updated_at'], unique=False)
+    op.create_index('ix_schedules_class_id_start_time', 'schedules', ['class_id', 'start_time'], unique=False)
+    op.add_column('schedule_rules', sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+    op.create_index(op.f('ix_schedule_rules_updated_at'), 'schedule_rules', ['updated_at'], unique=False)
+    op.create_index('ix_enrollments_student_id_class_id', 'enrollments', ['student_id', 'class_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_enrollments_student_id_class_id', table_name='enrollments')
+    op.drop_index(op.f('ix_schedule_rules_updated_at'), table_name='schedule_rules')
+    op.drop_column('schedule_rules', 'updated_at')
+    op.drop_index('ix_schedules_class_id_start_time', table_name='schedules')
+    op.drop_index(op.f('ix_schedules_updated_at'), table_name='schedules')
+    op.drop_column('schedules', 'updated_at')
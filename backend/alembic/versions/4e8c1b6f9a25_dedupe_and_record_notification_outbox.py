@@ -0,0 +1,42 @@
+"""Dedupe notification_outbox per announcement and record skipped recipients
+
+Revision ID: 4e8c1b6f9a25
+Revises: 3d7b0a5e8c12
+Create Date: 2026-10-19 23:52:41.308176
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4e8c1b6f9a25'
+down_revision: Union[str, Sequence[str], None] = '3d7b0a5e8c12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Outbox rows repeating an earlier row for the same announcement
+DUPLICATE_OUTBOX_IDS = """
+    SELECT id FROM notification_outbox AS o
+    WHERE announcement_id IS NOT NULL
+      AND id > (
+          SELECT MIN(id) FROM notification_outbox AS first
+          WHERE first.event = o.event AND first.announcement_id = o.announcement_id
+      )
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('notification_outbox', sa.Column('skipped_recipients', sa.Integer(), nullable=True))
+    op.execute(f"DELETE FROM notification_deliveries WHERE outbox_id IN ({DUPLICATE_OUTBOX_IDS})")
+    op.execute(f"DELETE FROM notification_outbox WHERE id IN ({DUPLICATE_OUTBOX_IDS})")
+    op.create_index('uq_notification_outbox_event_announcement_id', 'notification_outbox', ['event', 'announcement_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_notification_outbox_event_announcement_id', table_name='notification_outbox')
+    op.drop_column('notification_outbox', 'skipped_recipients')
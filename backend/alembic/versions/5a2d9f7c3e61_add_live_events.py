@@ -0,0 +1,39 @@
+"""Add live_events table for relaying live display events between workers
+
+Revision ID: 5a2d9f7c3e61
+Revises: 4e8c1b6f9a25
+Create Date: 2026-10-20 00:41:17.264905
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a2d9f7c3e61'
+down_revision: Union[str, Sequence[str], None] = '4e8c1b6f9a25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'live_events',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('origin', sa.String(), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_live_events_id'), 'live_events', ['id'], unique=False)
+    op.create_index(op.f('ix_live_events_created_at'), 'live_events', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_live_events_created_at'), table_name='live_events')
+    op.drop_index(op.f('ix_live_events_id'), table_name='live_events')
+    op.drop_table('live_events')
@@ -0,0 +1,30 @@
+"""Add photo_hash to classroom_reports
+
+Revision ID: 5b7e0f3c2a91
+Revises: 1c9dd4a25e06
+Create Date: 2026-10-19 11:03:27.540112
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7e0f3c2a91'
+down_revision: Union[str, Sequence[str], None] = '1c9dd4a25e06'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('classroom_reports', sa.Column('photo_hash', sa.BigInteger(), nullable=True))
+    op.create_index(op.f('ix_classroom_reports_photo_hash'), 'classroom_reports', ['photo_hash'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_classroom_reports_photo_hash'), table_name='classroom_reports')
+    op.drop_column('classroom_reports', 'photo_hash')
@@ -0,0 +1,28 @@
+"""Add schedules (start_time, room_number) index
+
+Revision ID: 6e2b8d4f1a73
+Revises: 3f8a6c1d9e24
+Create Date: 2026-10-19 15:02:37.108842
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6e2b8d4f1a73'
+down_revision: Union[str, Sequence[str], None] = '3f8a6c1d9e24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_schedules_start_time_room_number', 'schedules', ['start_time', 'room_number'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_schedules_start_time_room_number', table_name='schedules')
@@ -0,0 +1,39 @@
+"""Add schedule room index and overlap exclusion constraint
+
+Revision ID: 9d4c1e7b2f60
+Revises: 5b7e0f3c2a91
+Create Date: 2026-10-19 13:42:08.316254
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4c1e7b2f60'
+down_revision: Union[str, Sequence[str], None] = '5b7e0f3c2a91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_schedules_room_number_start_time', 'schedules', ['room_number', 'start_time'], unique=False)
+
+    # Range-indexed double-booking guard; SQLite relies on the application's in-memory interval index.
+    # Fails if existing rows already overlap, which must be resolved before upgrading.
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        op.execute(
+            'ALTER TABLE schedules ADD CONSTRAINT schedules_room_no_overlap '
+            'EXCLUDE USING gist (room_number WITH =, tsrange(start_time, end_time) WITH &&)'
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('ALTER TABLE schedules DROP CONSTRAINT schedules_room_no_overlap')
+    op.drop_index('ix_schedules_room_number_start_time', table_name='schedules')
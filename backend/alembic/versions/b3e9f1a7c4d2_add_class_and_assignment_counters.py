@@ -0,0 +1,56 @@
+"""Add denormalized counters to classes and assignments
+
+Revision ID: b3e9f1a7c4d2
+Revises: 4a7d2e9c6b15
+Create Date: 2026-10-19 17:04:12.338190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e9f1a7c4d2'
+down_revision: Union[str, Sequence[str], None] = '4a7d2e9c6b15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('classes', sa.Column('student_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('classes', sa.Column('assignment_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('classes', sa.Column('submission_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('assignments', sa.Column('submission_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('assignments', sa.Column('graded_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill from the source tables
+    op.execute("""
+        UPDATE classes SET
+            student_count = (SELECT COUNT(*) FROM enrollments WHERE enrollments.class_id = classes.id),
+            assignment_count = (SELECT COUNT(*) FROM assignments WHERE assignments.class_id = classes.id),
+            submission_count = (
+                SELECT COUNT(*) FROM submissions
+                JOIN assignments ON assignments.id = submissions.assignment_id
+                WHERE assignments.class_id = classes.id
+            )
+    """)
+    op.execute("""
+        UPDATE assignments SET
+            submission_count = (SELECT COUNT(*) FROM submissions WHERE submissions.assignment_id = assignments.id),
+            graded_count = (
+                SELECT COUNT(*) FROM submissions
+                WHERE submissions.assignment_id = assignments.id AND submissions.grade IS NOT NULL
+            )
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('assignments', 'graded_count')
+    op.drop_column('assignments', 'submission_count')
+    op.drop_column('classes', 'submission_count')
+    op.drop_column('classes', 'assignment_count')
+    op.drop_column('classes', 'student_count')
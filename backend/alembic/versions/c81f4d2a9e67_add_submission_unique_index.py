@@ -0,0 +1,56 @@
+"""Add unique (assignment_id, student_id) index to submissions
+
+Revision ID: c81f4d2a9e67
+Revises: b3e9f1a7c4d2
+Create Date: 2026-10-19 17:46:30.871254
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c81f4d2a9e67'
+down_revision: Union[str, Sequence[str], None] = 'b3e9f1a7c4d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Of any duplicate submissions left by concurrent submits, keep a graded one,
+    # then the most recently submitted, so no teacher's grade is lost
+    op.execute("""
+        DELETE FROM submissions WHERE id NOT IN (
+            SELECT (
+                SELECT kept.id FROM submissions AS kept
+                WHERE kept.assignment_id = pairs.assignment_id AND kept.student_id = pairs.student_id
+                ORDER BY CASE WHEN kept.grade IS NULL THEN 1 ELSE 0 END, kept.submitted_at DESC, kept.id DESC
+                LIMIT 1
+            )
+            FROM (SELECT DISTINCT assignment_id, student_id FROM submissions) AS pairs
+        )
+    """)
+    op.execute("""
+        UPDATE assignments SET
+            submission_count = (SELECT COUNT(*) FROM submissions WHERE submissions.assignment_id = assignments.id),
+            graded_count = (
+                SELECT COUNT(*) FROM submissions
+                WHERE submissions.assignment_id = assignments.id AND submissions.grade IS NOT NULL
+            )
+    """)
+    op.execute("""
+        UPDATE classes SET submission_count = (
+            SELECT COUNT(*) FROM submissions
+            JOIN assignments ON assignments.id = submissions.assignment_id
+            WHERE assignments.class_id = classes.id
+        )
+    """)
+    op.create_index('uq_submissions_assignment_id_student_id', 'submissions', ['assignment_id', 'student_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_submissions_assignment_id_student_id', table_name='submissions')
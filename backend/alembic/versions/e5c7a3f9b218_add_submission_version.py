@@ -0,0 +1,28 @@
+"""Add version to submissions
+
+Revision ID: e5c7a3f9b218
+Revises: d2a6b8e4f150
+Create Date: 2026-10-19 18:52:41.027733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5c7a3f9b218'
+down_revision: Union[str, Sequence[str], None] = 'd2a6b8e4f150'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('submissions', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('submissions', 'version')
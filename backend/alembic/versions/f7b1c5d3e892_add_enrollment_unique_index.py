@@ -0,0 +1,39 @@
+"""Add unique (class_id, student_id) index to enrollments
+
+Revision ID: f7b1c5d3e892
+Revises: e5c7a3f9b218
+Create Date: 2026-10-19 19:31:16.402587
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7b1c5d3e892'
+down_revision: Union[str, Sequence[str], None] = 'e5c7a3f9b218'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Keep the earliest of any duplicate enrollments
+    op.execute("""
+        DELETE FROM enrollments WHERE id NOT IN (
+            SELECT MIN(id) FROM enrollments GROUP BY class_id, student_id
+        )
+    """)
+    op.execute("""
+        UPDATE classes SET student_count = (
+            SELECT COUNT(*) FROM enrollments WHERE enrollments.class_id = classes.id
+        )
+    """)
+    op.create_index('uq_enrollments_class_id_student_id', 'enrollments', ['class_id', 'student_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_enrollments_class_id_student_id', table_name='enrollments')
@@ -0,0 +1,158 @@
+"""
+In-process request batching.
+
+Pages that fan out one GET per item send them as one /batch call instead.
+The batch is authenticated once; each sub-request then runs through the
+ASGI app in-process, one after another, with the batch's user and database
+session placed in its scope, so get_current_user and get_db reuse them
+instead of verifying the token and opening a session again. Sub-requests
+run sequentially because a session must not be used concurrently.
+
+Only JSON responses are batched. A sub-request is cut off with 415 as soon
+as it starts any other response (event streams, ZIP downloads, images),
+with 413 once its body passes MAX_SUB_RESPONSE_BYTES, and with 504 after
+SUB_REQUEST_TIMEOUT_SECONDS. A timed-out sub-request may still hold the
+shared session, so the rest of the batch is not run.
+"""
+import asyncio
+import json
+from typing import List, Optional
+from urllib.parse import urlsplit
+
+from sqlalchemy.orm import Session
+
+from database import SHARED_SESSION_SCOPE_KEY
+from models import User
+
+# Scope key under which /batch hands its authenticated user to sub-requests
+SHARED_USER_SCOPE_KEY = "classtrack.user"
+
+MAX_BATCH_REQUESTS = 50
+BATCH_PATH_PREFIX = "/batch"
+SUB_REQUEST_TIMEOUT_SECONDS = 10
+MAX_SUB_RESPONSE_BYTES = 1024 * 1024
+
+# Headers a sub-request inherits from the batch request
+FORWARDED_HEADERS = (b"authorization", b"accept-language", b"user-agent", b"x-forwarded-for")
+
+
+class _SubRequestRejected(Exception):
+    """Raised from send() to stop a sub-request whose response cannot be batched"""
+
+    def __init__(self, status: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def _error_result(status: int, detail: str) -> dict:
+    return {"status": status, "content_type": "application/json", "body": {"detail": detail}}
+
+
+def _is_json(content_type: Optional[str]) -> bool:
+    return content_type is not None and content_type.split(";")[0].strip() == "application/json"
+
+
+async def _run_sub_request(app, parent_scope, path: str, user: User, db: Session) -> dict:
+    url = urlsplit(path)
+    scope = {
+        "type": "http",
+        "asgi": parent_scope.get("asgi", {"version": "3.0"}),
+        "http_version": parent_scope.get("http_version", "1.1"),
+        "method": "GET",
+        "scheme": parent_scope.get("scheme", "http"),
+        "path": url.path,
+        "raw_path": url.path.encode(),
+        "root_path": parent_scope.get("root_path", ""),
+        "query_string": url.query.encode(),
+        "headers": [(name, value) for name, value in parent_scope["headers"] if name in FORWARDED_HEADERS],
+        "client": parent_scope.get("client"),
+        "server": parent_scope.get("server"),
+        "state": dict(parent_scope.get("state", {})),
+        SHARED_USER_SCOPE_KEY: user,
+        SHARED_SESSION_SCOPE_KEY: db,
+    }
+    response = {"status": 500, "content_type": None, "chunks": [], "size": 0}
+    request_sent = False
+    response_done = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Apps that listen for the client going away hear it once the response is complete
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            for name, value in message.get("headers", []):
+                if name.lower() == b"content-type":
+                    response["content_type"] = value.decode("latin-1")
+            if response["content_type"] is not None and not _is_json(response["content_type"]):
+                raise _SubRequestRejected(415, f"Only JSON responses can be batched, not {response['content_type']}")
+        elif message["type"] == "http.response.body":
+            chunk = message.get("body", b"")
+            if chunk and response["content_type"] is None:
+                raise _SubRequestRejected(415, "Only JSON responses can be batched")
+            response["size"] += len(chunk)
+            if response["size"] > MAX_SUB_RESPONSE_BYTES:
+                raise _SubRequestRejected(413, f"Sub-request responses are limited to {MAX_SUB_RESPONSE_BYTES} bytes")
+            response["chunks"].append(chunk)
+            if not message.get("more_body", False):
+                response_done.set()
+
+    try:
+        await asyncio.wait_for(app(scope, receive, send), SUB_REQUEST_TIMEOUT_SECONDS)
+    except _SubRequestRejected as e:
+        return _error_result(e.status, e.detail)
+    finally:
+        response_done.set()
+
+    body = b"".join(response["chunks"])
+    payload = json.loads(body) if body else None
+    return {"status": response["status"], "content_type": response["content_type"], "body": payload}
+
+
+async def run_batch(app, parent_scope, requests: List[dict], user: User, db: Session) -> List[dict]:
+    """
+    Run GET sub-requests in-process with a shared user and session.
+
+    Args:
+        app: ASGI application to dispatch to
+        parent_scope: Scope of the /batch request, for connection details and credentials
+        requests: Sub-requests as {"id", "path"} dictionaries, paths already validated
+        user: Authenticated user of the batch
+        db: Session of the batch
+
+    Returns:
+        List[dict]: One {"id", "status", "content_type", "body"} result per sub-request, in order
+    """
+    results = []
+    for position, sub_request in enumerate(requests):
+        try:
+            result = await _run_sub_request(app, parent_scope, sub_request["path"], user, db)
+        except asyncio.TimeoutError:
+            results.append({"id": sub_request.get("id"), **_error_result(504, f"Sub-request took longer than {SUB_REQUEST_TIMEOUT_SECONDS} seconds")})
+            results.extend(
+                {"id": skipped.get("id"), **_error_result(503, "Not run: an earlier sub-request timed out")}
+                for skipped in requests[position + 1:]
+            )
+            break
+        if result["status"] >= 400:
+            # Leave the shared session clean for the next sub-request
+            db.rollback()
+        results.append({"id": sub_request.get("id"), **result})
+    return results
+
+
+def validate_batch_path(path: str) -> Optional[str]:
+    """Error message for a sub-request path that cannot be batched, or None"""
+    url = urlsplit(path)
+    if url.scheme or url.netloc or not url.path.startswith("/"):
+        return "Sub-request paths must be absolute paths on this API, e.g. /classes/1"
+    if url.path == BATCH_PATH_PREFIX or url.path.startswith(BATCH_PATH_PREFIX + "/"):
+        return "Batches cannot be nested"
+    return None
@@ -0,0 +1,152 @@
+"""
+iCalendar (ICS) feed rendering and caching.
+
+Calendar apps poll subscribed feeds every few minutes, so rendered feeds are
+kept as bytes with their ETag and only rebuilt when their own schedule data
+changes. Each feed records the change-tracking keys it was built from (its
+room, or its user and their classes), so a write elsewhere leaves it cached.
+The body depends only on the data, with each event's DTSTAMP taken from its
+row's updated_at, so a rebuild without changes keeps the same ETag.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Callable, Hashable, Iterable, List, NamedTuple, Optional, Tuple
+
+import change_tracking
+
+FEED_CACHE_SIZE = 2048
+FEED_CACHE_MAX_AGE_SECONDS = 300  # Bounds staleness from writes made by other worker processes
+FEED_PRODUCT_ID = "-//ClassTrack//Timetable//EN"
+
+
+# ICS rendering
+
+class CalendarEvent(NamedTuple):
+    uid: str
+    stamp: datetime  # Last modification, written as DTSTAMP
+    start: datetime
+    end: datetime
+    summary: str
+    location: str
+    description: str
+    rrule: Optional[str] = None
+    exdates: Tuple[datetime, ...] = ()
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _format_utc(value: datetime) -> str:
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+
+def _fold(line: str) -> bytes:
+    """Fold a content line at 75 octets without splitting a UTF-8 character"""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return encoded + b"\r\n"
+    folded, current, limit = [], b"", 75
+    for char in line:
+        char_bytes = char.encode("utf-8")
+        if len(current) + len(char_bytes) > limit:
+            folded.append(current)
+            current, limit = b" ", 75
+        current += char_bytes
+    folded.append(current)
+    return b"\r\n".join(folded) + b"\r\n"
+
+
+def render_calendar(name: str, events: Iterable[CalendarEvent]) -> bytes:
+    """Render events as an iCalendar document; all times are naive UTC"""
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{FEED_PRODUCT_ID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_escape(name)}",
+    ]
+    for calendar_event in events:
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:{calendar_event.uid}",
+            f"DTSTAMP:{_format_utc(calendar_event.stamp)}",
+            f"DTSTART:{_format_utc(calendar_event.start)}",
+            f"DTEND:{_format_utc(calendar_event.end)}",
+            f"SUMMARY:{_escape(calendar_event.summary)}",
+            f"LOCATION:{_escape(calendar_event.location)}",
+            f"DESCRIPTION:{_escape(calendar_event.description)}",
+        ]
+        if calendar_event.rrule:
+            lines.append(f"RRULE:{calendar_event.rrule}")
+        for exdate in calendar_event.exdates:
+            lines.append(f"EXDATE:{_format_utc(exdate)}")
+        lines.append("END:VEVENT")
+    lines.append("END:VCALENDAR")
+    return b"".join(_fold(line) for line in lines)
+
+
+# Rendered feed cache
+
+class CachedFeed(NamedTuple):
+    dependencies: Tuple[Tuple[Hashable, int], ...]  # Change-tracking keys and their generations at build time
+    day: date
+    built_at: float
+    etag: str
+    body: bytes
+
+
+class FeedCache:
+    """
+    Bounded LRU cache of rendered feeds.
+
+    An entry is reused while the generations of the keys it was built from
+    and the UTC day (feeds cover a window relative to today) are unchanged
+    and it is younger than FEED_CACHE_MAX_AGE_SECONDS.
+    """
+
+    def __init__(self, max_size: int = FEED_CACHE_SIZE):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], CachedFeed]" = OrderedDict()
+        self.max_size = max_size
+
+    def get_or_build(self, key: Tuple[str, str], build: Callable[[], Tuple[bytes, Iterable[Hashable]]], now: float) -> CachedFeed:
+        """
+        Cached feed for key, or a fresh one from build().
+
+        build returns the body and the change-tracking keys it depends on. A
+        feed built while schedule data changed is returned but not cached,
+        since it may predate the change.
+        """
+        today = datetime.utcnow().date()
+        with self._lock:
+            cached = self._entries.get(key)
+            if (
+                cached and cached.day == today and now - cached.built_at < FEED_CACHE_MAX_AGE_SECONDS
+                and all(change_tracking.key_generation(dependency) == seen for dependency, seen in cached.dependencies)
+            ):
+                self._entries.move_to_end(key)
+                return cached
+
+        generation = change_tracking.generation("schedules")
+        body, dependencies = build()
+        dependencies = tuple((dependency, change_tracking.key_generation(dependency)) for dependency in dependencies)
+        cached = CachedFeed(dependencies, today, now, f'"{hashlib.sha256(body).hexdigest()[:32]}"', body)
+        if change_tracking.generation("schedules") != generation:
+            return cached
+        with self._lock:
+            self._entries[key] = cached
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return cached
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+feed_cache = FeedCache()
@@ -0,0 +1,92 @@
+"""
+Process-wide change counters for cached, derived data.
+
+Each topic has a generation number that is bumped after any committed ORM
+change to one of its models. Caches store the generation they were built
+at and rebuild when it moves on, so they never need explicit invalidation.
+
+Caches that depend on only a slice of the schedule data (one room, class,
+student or teacher) use key generations instead, such as ("room", "A-101")
+or ("class", 12). A changed schedule or rule bumps its class and room,
+before and after the change; an enrollment its student; a class itself and
+its teacher.
+"""
+import threading
+from typing import Dict, Hashable, Iterable, Set
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import Class, ClassroomReport, Enrollment, Schedule, ScheduleRule
+
+TRACKED_MODELS = {
+    "schedules": (Schedule, ScheduleRule, Enrollment, Class),
+    "reports": (ClassroomReport,),
+    "classes": (Class,),
+}
+
+_lock = threading.Lock()
+_generations: Dict[str, int] = {topic: 0 for topic in TRACKED_MODELS}
+_key_generations: Dict[Hashable, int] = {}
+
+
+def generation(topic: str) -> int:
+    return _generations[topic]
+
+
+def key_generation(key: Hashable) -> int:
+    return _key_generations.get(key, 0)
+
+
+def bump_generation(topic: str, keys: Iterable[Hashable] = ()):
+    """Mark a topic and any of its keys changed; for writes that bypass the ORM unit of work"""
+    with _lock:
+        _generations[topic] += 1
+        for key in keys:
+            _key_generations[key] = _key_generations.get(key, 0) + 1
+
+
+def _values(instance, attribute: str) -> Set:
+    """Current and previous values of an attribute in this flush"""
+    history = inspect(instance).attrs[attribute].history
+    return {value for value in (*history.added, *history.unchanged, *history.deleted) if value is not None}
+
+
+def _changed_keys(instance) -> Set[Hashable]:
+    if isinstance(instance, (Schedule, ScheduleRule)):
+        return {("class", class_id) for class_id in _values(instance, "class_id")} | {("room", room) for room in _values(instance, "room_number")}
+    if isinstance(instance, Enrollment):
+        return {("student", student_id) for student_id in _values(instance, "student_id")}
+    if isinstance(instance, Class):
+        return {("class", instance.id)} | {("teacher", teacher_id) for teacher_id in _values(instance, "teacher_id")}
+    return set()
+
+
+@event.listens_for(Session, "before_flush")
+def _track_changes(session, flush_context, instances):
+    changed = session.info.setdefault("changed_topics", set())
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        for topic, models in TRACKED_MODELS.items():
+            if isinstance(instance, models):
+                changed.add(topic)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_changed_keys(session, flush_context):
+    # After the flush, so new rows have their IDs
+    keys = session.info.setdefault("changed_keys", set())
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        keys |= _changed_keys(instance)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_after_commit(session):
+    keys = session.info.pop("changed_keys", ())
+    for topic in session.info.pop("changed_topics", ()):
+        bump_generation(topic, keys if topic == "schedules" else ())
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_changes(session):
+    session.info.pop("changed_topics", None)
+    session.info.pop("changed_keys", None)
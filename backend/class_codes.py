@@ -0,0 +1,49 @@
+"""
+Cached class code lookups for self-enrollment.
+
+At the start of term every student resolves one of a few class codes within
+minutes. Lookups are cached per process, including codes that do not exist,
+and dropped whenever a committed ORM change touches a class (the "classes"
+change generation). Entries also expire after CLASS_CODE_CACHE_MAX_AGE_SECONDS
+so changes made by other processes are picked up.
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+import change_tracking
+
+CLASS_CODE_CACHE_SIZE = 4096
+CLASS_CODE_CACHE_MAX_AGE_SECONDS = 60
+
+
+class ClassCodeCache:
+    """Bounded LRU cache of class code -> class ID (None for unknown codes)"""
+
+    def __init__(self, max_size: int = CLASS_CODE_CACHE_SIZE):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[int, float, Optional[int]]]" = OrderedDict()
+        self.max_size = max_size
+
+    def lookup(self, code: str, load: Callable[[], Optional[int]], now: float) -> Optional[int]:
+        generation = change_tracking.generation("classes")
+        with self._lock:
+            cached = self._entries.get(code)
+            if cached and cached[0] == generation and now - cached[1] < CLASS_CODE_CACHE_MAX_AGE_SECONDS:
+                self._entries.move_to_end(code)
+                return cached[2]
+
+        class_id = load()
+        with self._lock:
+            self._entries[code] = (generation, now, class_id)
+            self._entries.move_to_end(code)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return class_id
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class_codes = ClassCodeCache()
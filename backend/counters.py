@@ -0,0 +1,151 @@
+"""
+Denormalized per-class and per-assignment counters.
+
+Class.student_count, assignment_count and submission_count and
+Assignment.submission_count and graded_count are adjusted in the same
+transaction as the ORM flush that adds or removes the rows they count. The
+adjustments are relative UPDATEs, so concurrent writers never lose an
+increment. Writes that bypass the ORM unit of work call adjust_counters
+themselves; reconcile_counters recomputes every counter from the source
+tables and can be run as `python counters.py`.
+"""
+from collections import Counter
+from typing import Dict
+
+from sqlalchemy import event, func, inspect, or_, select, update
+from sqlalchemy.orm import Session
+
+from models import Assignment, Class, Enrollment, Submission
+
+
+def adjust_counters(connection, class_deltas: Counter, assignment_deltas: Counter):
+    """
+    Apply counter deltas with relative UPDATEs.
+
+    Args:
+        connection: Connection of the transaction the counted rows were written in
+        class_deltas: Deltas keyed by (class_id, counter name)
+        assignment_deltas: Deltas keyed by (assignment_id, counter name)
+    """
+    for model, deltas in ((Class, class_deltas), (Assignment, assignment_deltas)):
+        for (row_id, counter), delta in deltas.items():
+            if delta and row_id is not None:
+                column = getattr(model, counter)
+                connection.execute(update(model).where(model.id == row_id).values({counter: column + delta}))
+
+
+def _submission_class_id(session: Session, submission: Submission):
+    if submission.assignment is not None:
+        return submission.assignment.class_id
+    return session.execute(select(Assignment.class_id).where(Assignment.id == submission.assignment_id)).scalar()
+
+
+def _count_submission(session: Session, submission: Submission, sign: int, graded: bool, deltas):
+    class_deltas, assignment_deltas = deltas
+    class_deltas[(_submission_class_id(session, submission), "submission_count")] += sign
+    assignment_deltas[(submission.assignment_id, "submission_count")] += sign
+    if graded:
+        assignment_deltas[(submission.assignment_id, "graded_count")] += sign
+
+
+def _count(session: Session, instance, sign: int, deltas):
+    class_deltas, assignment_deltas = deltas
+    if isinstance(instance, Enrollment):
+        class_deltas[(instance.class_id, "student_count")] += sign
+    elif isinstance(instance, Assignment):
+        class_deltas[(instance.class_id, "assignment_count")] += sign
+    elif isinstance(instance, Submission):
+        _count_submission(session, instance, sign, instance.grade is not None, deltas)
+
+
+@event.listens_for(Session, "before_flush")
+def _count_removals(session, flush_context, instances):
+    # Deleted rows are counted before the flush, while their parents still exist
+    deltas = session.info["counter_deltas"] = (Counter(), Counter())
+    for instance in session.deleted:
+        _count(session, instance, -1, deltas)
+    for instance in session.dirty:
+        if isinstance(instance, Submission) and instance not in session.deleted:
+            deltas[1][(instance.assignment_id, "graded_count")] += _grade_change(instance)
+
+
+def _grade_change(submission: Submission) -> int:
+    """+1 if the submission became graded, -1 if its grade was cleared"""
+    history = inspect(submission).attrs.grade.history
+    if not history.has_changes():
+        return 0
+    was_graded = bool(history.deleted) and history.deleted[0] is not None
+    is_graded = bool(history.added) and history.added[0] is not None
+    return int(is_graded) - int(was_graded)
+
+
+@event.listens_for(Session, "after_flush")
+def _count_additions(session, flush_context):
+    # New rows are counted after the flush, once their foreign keys are set
+    deltas = session.info.pop("counter_deltas", None) or (Counter(), Counter())
+    for instance in session.new:
+        _count(session, instance, 1, deltas)
+    adjust_counters(session.connection(), *deltas)
+    session.info["counters_touched"] = deltas
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _expire_counters(session, flush_context):
+    class_deltas, assignment_deltas = session.info.pop("counters_touched", (Counter(), Counter()))
+    for model, deltas in ((Class, class_deltas), (Assignment, assignment_deltas)):
+        for row_id, counter in deltas:
+            instance = session.identity_map.get(session.identity_key(model, row_id))
+            if instance is not None:
+                session.expire(instance, [counter])
+
+
+def reconcile_counters(db: Session) -> Dict[str, int]:
+    """
+    Recompute every counter from the source tables.
+
+    Args:
+        db: Database session
+
+    Returns:
+        Dict[str, int]: Number of classes and assignments whose counters were wrong
+    """
+    enrollments = select(func.count(Enrollment.id)).where(Enrollment.class_id == Class.id).scalar_subquery()
+    assignments = select(func.count(Assignment.id)).where(Assignment.class_id == Class.id).scalar_subquery()
+    class_submissions = (
+        select(func.count(Submission.id))
+        .join(Assignment, Assignment.id == Submission.assignment_id)
+        .where(Assignment.class_id == Class.id)
+        .scalar_subquery()
+    )
+    submissions = select(func.count(Submission.id)).where(Submission.assignment_id == Assignment.id).scalar_subquery()
+    graded = select(func.count(Submission.id)).where(Submission.assignment_id == Assignment.id, Submission.grade.isnot(None)).scalar_subquery()
+
+    try:
+        classes_fixed = db.execute(
+            update(Class)
+            .where(or_(Class.student_count != enrollments, Class.assignment_count != assignments, Class.submission_count != class_submissions))
+            .values(student_count=enrollments, assignment_count=assignments, submission_count=class_submissions)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        assignments_fixed = db.execute(
+            update(Assignment)
+            .where(or_(Assignment.submission_count != submissions, Assignment.graded_count != graded))
+            .values(submission_count=submissions, graded_count=graded)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return {"classes_fixed": classes_fixed, "assignments_fixed": assignments_fixed}
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print(reconcile_counters(db))
+    finally:
+        db.close()
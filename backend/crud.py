@@ -1,7 +1,13 @@
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from models import Class, ClassCreate, User, Assignment, AssignmentCreate, Submission, Enrollment, Schedule, ScheduleCreate, Announcement, AnnouncementCreate, ClassroomReport, ClassroomReportCreate
-from schemas import SubmissionCreate
-from typing import Optional, List
+from models import Class, ClassCreate, User, UserRole, Assignment, AssignmentCreate, Submission, Enrollment, Schedule, ScheduleCreate, ScheduleRule, ScheduleRuleCreate, Announcement, AnnouncementCreate, ClassroomReport, ClassroomReportCreate, UploadSession, IdempotencyKey, ClassWaitlistEntry
+from schemas import SubmissionCreate, SubmissionGradeItem
+from typing import Optional, List, Iterable, Iterator, Tuple
+from datetime import datetime, timedelta
+from bisect import bisect_right
+from schedule_index import room_index, to_naive_utc
+from recurrence import expand_occurrences
 
 
 def create_class(db: Session, class_in: ClassCreate) -> Class:
@@ -40,7 +46,8 @@ def create_class(db: Session, class_in: ClassCreate) -> Class:
     db_class = Class(
         name=class_in.name,
         code=class_in.code,
-        teacher_id=class_in.teacher_id
+        teacher_id=class_in.teacher_id,
+        capacity=class_in.capacity
     )
     
     db.add(db_class)
@@ -80,7 +87,7 @@ def get_classes(db: Session, skip: int = 0, limit: int = 100) -> List[Class]:
 
 def update_class(db: Session, class_id: int, class_in: ClassCreate) -> Optional[Class]:
     """
-    Update an existing class's name, code, or assigned teacher ID.
+    Update an existing class's name, code, assigned teacher ID, or capacity.
     
     Args:
         db: Database session
@@ -126,6 +133,7 @@ def update_class(db: Session, class_id: int, class_in: ClassCreate) -> Optional[
     db_class.name = class_in.name
     db_class.code = class_in.code
     db_class.teacher_id = class_in.teacher_id
+    db_class.capacity = class_in.capacity
     
     db.commit()
     db.refresh(db_class)
@@ -140,6 +148,7 @@ def delete_class(db: Session, class_id: int) -> bool:
     - Enrollments (students enrolled in the class)
     - Assignments (assignments for the class)
     - Schedules (schedules for the class)
+    - ScheduleRules (recurring schedules for the class)
     - ClassroomReports (reports for the class)
     
     Args:
@@ -164,9 +173,13 @@ def delete_class(db: Session, class_id: int) -> bool:
         # - All enrollments for this class
         # - All assignments for this class  
         # - All schedules for this class
+        # - All recurring schedule rules for this class
         # - All classroom reports for this class
+        schedule_ids = [schedule.id for schedule in db_class.schedules]
         db.delete(db_class)
         db.commit()
+        for schedule_id in schedule_ids:
+            room_index.discard(schedule_id)
         
         print(f"Successfully deleted class: {db_class.name} and all related records")
         return True
@@ -301,6 +314,108 @@ def get_all_users(db: Session) -> List[User]:
     return db.query(User).all()
 
 
+USER_BULK_CHUNK_SIZE = 1000
+MIN_USERNAME_LENGTH = 3
+MIN_PASSWORD_LENGTH = 6
+
+
+def create_users_bulk(db: Session, rows: Iterable[Tuple[int, dict]]) -> List[dict]:
+    """
+    Provision many users at once.
+    
+    Rows are validated, checked against existing usernames with one IN query
+    per chunk and inserted with one multi-row INSERT ... ON CONFLICT DO NOTHING
+    per chunk, so a username taken concurrently is reported instead of failing
+    the batch. Everything is committed together.
+    
+    Args:
+        db: Database session
+        rows: (row number, fields) pairs; fields are username, password, role and
+            optionally first_name and last_name
+        
+    Returns:
+        List[dict]: One result per row, in order, with status "created" and the new
+        user ID, or status "error" and the reason
+    """
+    from security import get_password_hash
+    
+    results = []
+    seen = set()
+    
+    def insert_chunk(chunk: List[Tuple[int, dict]]):
+        usernames = [fields["username"] for _, fields in chunk]
+        taken = {row.username for row in db.query(User.username).filter(User.username.in_(usernames))}
+        
+        values = []
+        for row_number, fields in chunk:
+            if fields["username"] in taken:
+                results.append({"row": row_number, "username": fields["username"], "status": "error", "error": "Username already registered"})
+            else:
+                values.append(fields)
+        if not values:
+            return
+        
+        inserted = dict(db.execute(
+            dialect_insert(db, User).values([
+                {
+                    "username": fields["username"],
+                    "hashed_password": get_password_hash(fields["password"]),
+                    "role": fields["role"],
+                    "first_name": fields.get("first_name"),
+                    "last_name": fields.get("last_name")
+                }
+                for fields in values
+            ]).on_conflict_do_nothing(index_elements=["username"]).returning(User.username, User.id)
+        ).all())
+        for row_number, fields in chunk:
+            if fields["username"] in taken:
+                continue
+            if fields["username"] in inserted:
+                results.append({"row": row_number, "username": fields["username"], "status": "created", "id": inserted[fields["username"]]})
+            else:
+                results.append({"row": row_number, "username": fields["username"], "status": "error", "error": "Username already registered"})
+    
+    try:
+        chunk = []
+        for row_number, fields in rows:
+            username = (fields.get("username") or "").strip()
+            password = fields.get("password") or ""
+            role = (fields.get("role") or "").strip().lower()
+            error = None
+            if len(username) < MIN_USERNAME_LENGTH:
+                error = f"Username must be at least {MIN_USERNAME_LENGTH} characters long"
+            elif len(password) < MIN_PASSWORD_LENGTH:
+                error = f"Password must be at least {MIN_PASSWORD_LENGTH} characters long"
+            elif role not in {member.value for member in UserRole}:
+                error = "Role must be 'admin', 'teacher' or 'student'"
+            elif username in seen:
+                error = "Duplicate username in this request"
+            if error:
+                results.append({"row": row_number, "username": username, "status": "error", "error": error})
+                continue
+            
+            seen.add(username)
+            chunk.append((row_number, {
+                "username": username,
+                "password": password,
+                "role": UserRole(role),
+                "first_name": (fields.get("first_name") or "").strip() or None,
+                "last_name": (fields.get("last_name") or "").strip() or None
+            }))
+            if len(chunk) >= USER_BULK_CHUNK_SIZE:
+                insert_chunk(chunk)
+                chunk = []
+        if chunk:
+            insert_chunk(chunk)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    
+    results.sort(key=lambda result: result["row"])
+    return results
+
+
 def get_all_classes(db: Session) -> List[dict]:
     """
     Fetch all classes from the classes table without pagination.
@@ -432,10 +547,24 @@ def create_assignment(db: Session, assignment_in: AssignmentCreate, creator_id:
         raise ValueError(f"Failed to create assignment: {str(e)}")
 
 
+def dialect_insert(db: Session, model):
+    """INSERT construct for the session's dialect, which supports ON CONFLICT"""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+
 def create_submission(db: Session, submission_in: SubmissionCreate, student_id: int = None) -> Submission:
     """
     Create a new submission and save it to the database.
     
+    The enrollment and duplicate checks are part of the INSERT itself: rows are
+    selected only for an existing assignment whose class the student is enrolled
+    in, and the unique (assignment_id, student_id) index turns a duplicate into a
+    no-op. Only when nothing was inserted is the reason looked up.
+    
     Args:
         db: Database session
         submission_in: SubmissionCreate object containing submission data
@@ -446,117 +575,167 @@ def create_submission(db: Session, submission_in: SubmissionCreate, student_id:
         
     Raises:
         ValueError: If assignment or student doesn't exist, or student is not enrolled in the class
+        HTTPException: 409 if the student has already submitted this assignment
     """
+    from collections import Counter
+    from fastapi import HTTPException
+    from sqlalchemy import literal, select
+    from counters import adjust_counters
+    
+    actual_student_id = student_id if student_id is not None else submission_in.student_id
+    
+    eligible = (
+        select(
+            Assignment.id,
+            literal(actual_student_id),
+            literal(submission_in.time_spent_minutes),
+            literal(datetime.utcnow())
+        )
+        .join(Enrollment, (Enrollment.class_id == Assignment.class_id) & (Enrollment.student_id == actual_student_id))
+        .join(User, (User.id == Enrollment.student_id) & (User.role == UserRole.STUDENT))
+        .where(Assignment.id == submission_in.assignment_id)
+        .limit(1)
+    )
+    statement = (
+        dialect_insert(db, Submission)
+        .from_select(["assignment_id", "student_id", "time_spent_minutes", "submitted_at"], eligible)
+        .on_conflict_do_nothing(index_elements=["assignment_id", "student_id"])
+        .returning(Submission)
+    )
+    
     try:
-        # Log the input data for debugging
-        print(f"Creating submission with data: assignment_id={submission_in.assignment_id}, student_id={student_id}, time_spent={submission_in.time_spent_minutes}")
-        
-        # Use explicit student_id if provided, otherwise use the one from submission_in
-        actual_student_id = student_id if student_id is not None else submission_in.student_id
-        
-        # Enhanced data validation
-        if not isinstance(submission_in.assignment_id, int) or submission_in.assignment_id <= 0:
-            raise ValueError("Assignment ID must be a positive integer")
-        
-        if not isinstance(actual_student_id, int) or actual_student_id <= 0:
-            raise ValueError("Student ID must be a positive integer")
-        
-        if not isinstance(submission_in.time_spent_minutes, int) or submission_in.time_spent_minutes < 0:
-            raise ValueError("Time spent must be a non-negative integer")
-        
-        # Verify the assignment exists
-        assignment = db.query(Assignment).filter(Assignment.id == submission_in.assignment_id).first()
-        if not assignment:
-            # Check if any assignments exist at all
-            total_assignments = db.query(Assignment).count()
-            if total_assignments == 0:
-                raise ValueError("No assignments exist in the system. Please create an assignment first.")
-            else:
-                raise ValueError(f"Assignment with ID {submission_in.assignment_id} not found. Please verify the assignment ID is correct.")
-        
-        print(f"Found assignment: {assignment.name} (ID: {assignment.id})")
-        
-        # Verify the student exists and is a student
-        student = db.query(User).filter(User.id == actual_student_id).first()
-        if not student:
-            raise ValueError(f"User with ID {actual_student_id} not found")
-        
-        print(f"Found student: {student.username} (ID: {student.id}, Role: {student.role.value})")
-        
-        if student.role.value != "student":
-            raise ValueError(f"User with ID {actual_student_id} is not a student")
-        
-        # Verify the student is enrolled in the class that contains this assignment
-        from models import Enrollment
-        enrollment = db.query(Enrollment).filter(
-            Enrollment.student_id == actual_student_id,
-            Enrollment.class_id == assignment.class_id
-        ).first()
-        
-        if not enrollment:
-            raise ValueError(f"Student with ID {actual_student_id} is not enrolled in the class for assignment {submission_in.assignment_id}")
-        
-        # Check if student has already submitted this assignment
-        existing_submission = db.query(Submission).filter(
-            Submission.assignment_id == submission_in.assignment_id,
-            Submission.student_id == actual_student_id
-        ).first()
+        db_submission = db.scalars(statement).first()
+        if db_submission is None:
+            db.rollback()
+            raise submission_rejection(db, submission_in.assignment_id, actual_student_id)
         
-        if existing_submission:
-            from fastapi import HTTPException, status
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Student has already submitted this assignment"
-            )
+        # Counters are kept by flush events, which this INSERT bypasses
+        adjust_counters(
+            db.connection(),
+            Counter({(db_submission.assignment.class_id, "submission_count"): 1}),
+            Counter({(db_submission.assignment_id, "submission_count"): 1})
+        )
+        db.commit()
+        db.refresh(db_submission)
+        return db_submission
+    except (ValueError, HTTPException):
+        raise
+    except IntegrityError as e:
+        db.rollback()
+        raise ValueError(f"Invalid submission: {e.orig}")
+    except Exception as e:
+        db.rollback()
+        raise ValueError(f"Failed to create submission: {str(e)}")
+
+
+def submission_rejection(db: Session, assignment_id: int, student_id: int) -> Exception:
+    """Explain why a guarded submission INSERT inserted nothing"""
+    from fastapi import HTTPException, status
+    
+    assignment = db.query(Assignment).filter(Assignment.id == assignment_id).first()
+    if not assignment:
+        return ValueError(f"Assignment with ID {assignment_id} not found. Please verify the assignment ID is correct.")
+    
+    student = db.query(User).filter(User.id == student_id).first()
+    if not student:
+        return ValueError(f"User with ID {student_id} not found")
+    if student.role != UserRole.STUDENT:
+        return ValueError(f"User with ID {student_id} is not a student")
+    
+    already_submitted = db.query(Submission.id).filter(
+        Submission.assignment_id == assignment_id,
+        Submission.student_id == student_id
+    ).first()
+    if already_submitted:
+        return HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Student has already submitted this assignment"
+        )
+    
+    return ValueError(f"Student with ID {student_id} is not enrolled in the class for assignment {assignment_id}")
+
+
+def bulk_grade_submissions(db: Session, grades: List[SubmissionGradeItem], teacher_id: Optional[int] = None) -> List[dict]:
+    """
+    Grade many submissions in one transaction with optimistic concurrency.
+    
+    Ownership and current versions are read for the whole batch in one query,
+    and every accepted grade is written by a single UPDATE that only matches
+    rows still at their expected version. Items are applied independently.
+    
+    Args:
+        db: Database session
+        grades: Submission IDs, grades and the versions the client last saw
+        teacher_id: Only allow submissions to assignments created by this teacher (optional)
         
-        # Create the new submission with enhanced validation
+    Returns:
+        List[dict]: One result per item, in request order, with status "updated",
+        "conflict", "not_found" or "forbidden" and the submission's current version
+    """
+    from collections import Counter
+    from sqlalchemy import case, update
+    from counters import adjust_counters
+    
+    rows = db.query(
+        Submission.id, Submission.version, Submission.grade, Submission.assignment_id, Assignment.creator_id
+    ).join(Assignment, Assignment.id == Submission.assignment_id).filter(
+        Submission.id.in_([item.submission_id for item in grades])
+    ).all()
+    current = {row.id: row for row in rows}
+    
+    accepted = {}
+    for item in grades:
+        row = current.get(item.submission_id)
+        if row is not None and (teacher_id is None or row.creator_id == teacher_id) and row.version == item.expected_version:
+            accepted[item.submission_id] = item
+    
+    updated = {}
+    if accepted:
         try:
-            db_submission = Submission(
-                assignment_id=submission_in.assignment_id,
-                student_id=actual_student_id,
-                time_spent_minutes=submission_in.time_spent_minutes
+            result = db.execute(
+                update(Submission)
+                .where(
+                    Submission.id.in_(accepted),
+                    Submission.version == case({i: item.expected_version for i, item in accepted.items()}, value=Submission.id)
+                )
+                .values(
+                    grade=case({i: item.grade for i, item in accepted.items()}, value=Submission.id),
+                    version=Submission.version + 1
+                )
+                .returning(Submission.id, Submission.version)
+                .execution_options(synchronize_session=False)
             )
+            updated = dict(result.all())
             
-            print(f"Created submission object: {db_submission}")
-            
-            db.add(db_submission)
+            # Counters are kept by flush events, which this UPDATE bypasses
+            newly_graded = Counter()
+            for submission_id in updated:
+                if current[submission_id].grade is None:
+                    newly_graded[(current[submission_id].assignment_id, "graded_count")] += 1
+            adjust_counters(db.connection(), Counter(), newly_graded)
             db.commit()
-            db.refresh(db_submission)
-            
-            print(f"Successfully created submission with ID: {db_submission.id}")
-            return db_submission
-            
-        except Exception as db_error:
+        except Exception:
             db.rollback()
-            print(f"Database error during submission creation: {db_error}")
-            print(f"Database error type: {type(db_error).__name__}")
-            
-            # Handle specific database constraint violations
-            error_str = str(db_error).lower()
-            if "foreign key constraint" in error_str or "fk_" in error_str:
-                if "assignment_id" in error_str:
-                    raise ValueError(f"Invalid Assignment ID: {submission_in.assignment_id}. The assignment does not exist or has been deleted.")
-                elif "student_id" in error_str:
-                    raise ValueError(f"Invalid Student ID: {actual_student_id}. The user does not exist or has been deleted.")
-                else:
-                    raise ValueError(f"Database constraint violation: {db_error}")
-            elif "not null" in error_str:
-                raise ValueError("Required field is missing or null")
-            elif "unique constraint" in error_str:
-                raise ValueError("A submission for this assignment already exists")
-            else:
-                raise ValueError(f"Database error: {db_error}")
-        
-    except ValueError as ve:
-        # Re-raise ValueError as-is (these are our validation errors)
-        print(f"Validation error in create_submission: {ve}")
-        db.rollback()
-        raise ve
-    except Exception as e:
-        print(f"Unexpected error in create_submission: {e}")
-        print(f"Error type: {type(e).__name__}")
-        db.rollback()
-        raise ValueError(f"Failed to create submission: {str(e)}")
+            raise
+    
+    # Rows changed between the read and the UPDATE report their new version
+    raced = [submission_id for submission_id in accepted if submission_id not in updated]
+    versions = {row.id: row.version for row in rows}
+    if raced:
+        versions.update(db.query(Submission.id, Submission.version).filter(Submission.id.in_(raced)).all())
+    
+    results = []
+    for item in grades:
+        row = current.get(item.submission_id)
+        if row is None:
+            results.append({"submission_id": item.submission_id, "status": "not_found", "version": None})
+        elif teacher_id is not None and row.creator_id != teacher_id:
+            results.append({"submission_id": item.submission_id, "status": "forbidden", "version": None})
+        elif item.submission_id in updated:
+            results.append({"submission_id": item.submission_id, "status": "updated", "version": updated[item.submission_id], "grade": item.grade})
+        else:
+            results.append({"submission_id": item.submission_id, "status": "conflict", "version": versions[item.submission_id]})
+    return results
 
 
 def get_student_classes_ids(db: Session, user_id: int) -> List[int]:
@@ -590,6 +769,56 @@ def get_student_classes_ids(db: Session, user_id: int) -> List[int]:
     return class_ids
 
 
+def get_classes_for_student(db: Session, student_id: int) -> List[Class]:
+    """
+    Get the classes a student is enrolled in.
+    
+    Args:
+        db: Database session
+        student_id: ID of the student
+        
+    Returns:
+        List[Class]: Enrolled classes ordered by name
+    """
+    enrolled = db.query(Enrollment.class_id).filter(Enrollment.student_id == student_id)
+    return db.query(Class).filter(Class.id.in_(enrolled)).order_by(Class.name).all()
+
+
+def get_grades_for_student(db: Session, student_id: int) -> List[dict]:
+    """
+    Get a student's submissions with their assignment and class names.
+    
+    Args:
+        db: Database session
+        student_id: ID of the student
+        
+    Returns:
+        List[dict]: One dictionary per submission, newest first
+    """
+    rows = (
+        db.query(Submission, Assignment.name, Assignment.class_id, Class.name)
+        .join(Assignment, Assignment.id == Submission.assignment_id)
+        .join(Class, Class.id == Assignment.class_id)
+        .filter(Submission.student_id == student_id)
+        .order_by(Submission.submitted_at.desc())
+        .all()
+    )
+    return [
+        {
+            "id": submission.id,
+            "assignment_id": submission.assignment_id,
+            "assignment_name": assignment_name,
+            "class_id": class_id,
+            "class_name": class_name,
+            "grade": submission.grade,
+            "time_spent_minutes": submission.time_spent_minutes,
+            "submitted_at": submission.submitted_at,
+            "is_graded": submission.grade is not None
+        }
+        for submission, assignment_name, class_id, class_name in rows
+    ]
+
+
 def get_assignments_for_student(db: Session, user_id: int) -> List[Assignment]:
     """
     Get all assignments associated with classes where the given user_id is a member (student).
@@ -661,7 +890,7 @@ def create_schedule(db: Session, schedule_in: ScheduleCreate) -> Schedule:
         Schedule: Created schedule object
         
     Raises:
-        HTTPException: If class_id doesn't exist
+        HTTPException: If class_id doesn't exist, or 409 if the room is already booked
     """
     # Validate that the class_id exists
     class_exists = db.query(Class).filter(Class.id == schedule_in.class_id).first()
@@ -672,10 +901,14 @@ def create_schedule(db: Session, schedule_in: ScheduleCreate) -> Schedule:
             detail=f"Class with ID {schedule_in.class_id} not found. Please ensure the class exists before creating a schedule."
         )
     
-    schedule = Schedule(**schedule_in.dict())
+    schedule_data = normalize_schedule_times(schedule_in.dict())
+    ensure_room_available(db, schedule_data)
+    
+    schedule = Schedule(**schedule_data)
     db.add(schedule)
-    db.commit()
+    commit_schedule(db, schedule_data)
     db.refresh(schedule)
+    room_index.upsert(schedule.id, schedule.room_number, schedule.start_time, schedule.end_time)
     return schedule
 
 
@@ -710,204 +943,1468 @@ def get_schedules_live(db: Session) -> List[Schedule]:
         joinedload(Schedule.class_).joinedload(Class.teacher)
     ).all()
 
-def get_schedules_live_enriched(db: Session) -> List[dict]:
+def get_schedules_live_enriched(db: Session, start: datetime, end: datetime, room_number: Optional[str] = None, building: Optional[str] = None, class_id: Optional[int] = None, teacher_id: Optional[int] = None) -> List[dict]:
     """
-    Get all schedules for live display with enriched class and teacher information.
+    Get schedules in a time window for live display with enriched class and teacher information.
+    
+    Recurring schedules are expanded into their occurrences within the window.
     
     Args:
         db: Database session
+        start: Only include schedules ending after this time
+        end: Only include schedules starting before this time
+        room_number: Only include this room (optional)
+        building: Only include rooms whose number starts with this prefix (optional)
+        class_id: Only include this class (optional)
+        teacher_id: Only include classes taught by this teacher (optional)
         
     Returns:
         List[dict]: List of enriched schedule dictionaries with class and teacher details
     """
-    from sqlalchemy.orm import joinedload
-    
-    schedules = db.query(Schedule).options(
-        joinedload(Schedule.class_).joinedload(Class.teacher)
-    ).all()
-    
-    enriched_schedules = []
-    for schedule in schedules:
-        # Get teacher information
-        teacher_name = "Unknown Teacher"
-        teacher_full_name = "Unknown Teacher"
-        
-        if schedule.class_ and schedule.class_.teacher:
-            teacher = schedule.class_.teacher
-            if teacher.first_name and teacher.last_name:
-                teacher_full_name = f"{teacher.first_name} {teacher.last_name}"
-                teacher_name = f"{teacher.first_name} {teacher.last_name}"
-            elif teacher.first_name:
-                teacher_name = teacher.first_name
-                teacher_full_name = teacher.first_name
-            elif teacher.username:
-                teacher_name = teacher.username
-                teacher_full_name = teacher.username
-        
-        # Get class information
-        class_name = schedule.class_.name if schedule.class_ else "Unknown Class"
-        class_code = schedule.class_.code if schedule.class_ else "UNKNOWN"
-        
-        enriched_schedule = {
-            "id": schedule.id,
-            "class_id": schedule.class_id,
-            "start_time": schedule.start_time,
-            "end_time": schedule.end_time,
-            "room_number": schedule.room_number,
-            "status": schedule.status,
-            "class_name": class_name,
-            "class_code": class_code,
-            "teacher_name": teacher_name,
-            "teacher_full_name": teacher_full_name
-        }
-        enriched_schedules.append(enriched_schedule)
-    
-    return enriched_schedules
+    return get_enriched_schedules(
+        db, start, end,
+        class_ids=[class_id] if class_id is not None else None,
+        room_number=room_number,
+        building=building,
+        teacher_id=teacher_id
+    )
 
 
-def get_schedule(db: Session, schedule_id: int) -> Optional[Schedule]:
+def get_student_schedule_enriched(db: Session, student_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[dict]:
     """
-    Get a specific schedule by ID.
+    Get enriched schedules, including recurring occurrences, for a student's enrolled classes.
     
     Args:
         db: Database session
-        schedule_id: ID of the schedule
+        student_id: ID of the student
+        start: Only include schedules ending after this time (optional)
+        end: Only include schedules starting before this time (optional)
         
     Returns:
-        Optional[Schedule]: Schedule object if found, None otherwise
+        List[dict]: List of enriched schedule dictionaries ordered by start time
     """
-    return db.query(Schedule).filter(Schedule.id == schedule_id).first()
+    return get_enriched_schedules(db, start, end, student_id=student_id)
 
 
-def update_schedule(db: Session, schedule_id: int, schedule_in: ScheduleCreate) -> Optional[Schedule]:
+def get_user_calendar(db: Session, user: User, start: datetime, end: datetime, since: Optional[datetime] = None) -> List[dict]:
     """
-    Update an existing schedule.
+    Get the schedule occurrences relevant to a user in a window, for any role.
+    
+    Students see their enrolled classes, teachers the classes they teach and
+    admins every class. With since, classes a student joined after it are
+    sent in full; pair it with get_user_calendar_removals for deletions.
     
     Args:
         db: Database session
-        schedule_id: ID of the schedule to update
-        schedule_in: Updated schedule data
+        user: The user whose calendar to build
+        start: Only include schedules ending after this time
+        end: Only include schedules starting before this time
+        since: Only include schedules and rules changed after this time (optional)
         
     Returns:
-        Optional[Schedule]: Updated schedule object if found, None otherwise
-        
-    Raises:
-        HTTPException: If class_id doesn't exist
-    """
-    # Validate that the class_id exists
-    class_exists = db.query(Class).filter(Class.id == schedule_in.class_id).first()
-    if not class_exists:
-        from fastapi import HTTPException, status
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Class with ID {schedule_in.class_id} not found. Please ensure the class exists before updating a schedule."
-        )
-    
-    schedule = db.query(Schedule).filter(Schedule.id == schedule_id).first()
-    if schedule:
-        for key, value in schedule_in.dict().items():
-            setattr(schedule, key, value)
-        db.commit()
-        db.refresh(schedule)
-    return schedule
+        List[dict]: Enriched schedules ordered by start time
+    """
+    if user.role == UserRole.STUDENT:
+        schedules = get_enriched_schedules(db, start, end, student_id=user.id, updated_since=since)
+    elif user.role == UserRole.TEACHER:
+        schedules = get_enriched_schedules(db, start, end, teacher_id=user.id, updated_since=since)
+    else:
+        schedules = get_enriched_schedules(db, start, end, updated_since=since)
+    
+    if since is not None and user.role == UserRole.STUDENT:
+        joined = [
+            row.class_id for row in
+            db.query(Enrollment.class_id).filter(Enrollment.student_id == user.id, Enrollment.created_at > to_naive_utc(since))
+        ]
+        if joined:
+            sent = {(schedule["id"], schedule["rule_id"], schedule["start_time"]) for schedule in schedules}
+            schedules.extend(
+                schedule for schedule in get_enriched_schedules(db, start, end, class_ids=joined)
+                if (schedule["id"], schedule["rule_id"], schedule["start_time"]) not in sent
+            )
+            schedules.sort(key=lambda schedule: schedule["start_time"])
+    return schedules
 
 
-def delete_schedule(db: Session, schedule_id: int) -> bool:
+def get_user_calendar_removals(db: Session, user: User, start: datetime, end: datetime, since: datetime) -> List[dict]:
     """
-    Delete a schedule.
+    Get what a calendar fetched before since should drop from [start, end).
+    
+    Covers deleted schedules and rules, schedules moved out of the window,
+    rules changed so that none of their occurrences fall in it, and classes
+    the user left or that were deleted ("class": drop everything from it).
     
     Args:
         db: Database session
-        schedule_id: ID of the schedule to delete
+        user: The user whose calendar is being synced
+        start: Start of the calendar window
+        end: End of the calendar window
+        since: The client's previous sync time
         
     Returns:
-        bool: True if deleted, False if not found
+        List[dict]: {"type", "id"} dictionaries
     """
-    schedule = db.query(Schedule).filter(Schedule.id == schedule_id).first()
-    if schedule:
-        db.delete(schedule)
-        db.commit()
-        return True
-    return False
+    since = to_naive_utc(since)
+    class_ids = get_sync_class_ids(user)
+    removed = get_sync_deletions(db, user, since, class_ids, ["schedule", "schedule_rule"], ["enrollment", "class"])
+    
+    moved_query = db.query(Schedule.id).filter(
+        Schedule.updated_at > since,
+        (Schedule.end_time <= start) | (Schedule.start_time >= end)
+    )
+    rule_query = db.query(ScheduleRule).filter(ScheduleRule.updated_at > since)
+    if class_ids is not None:
+        moved_query = moved_query.filter(Schedule.class_id.in_(class_ids))
+        rule_query = rule_query.filter(ScheduleRule.class_id.in_(class_ids))
+    removed.extend({"type": "schedule", "id": row.id} for row in moved_query.order_by(Schedule.id))
+    removed.extend(
+        {"type": "schedule_rule", "id": rule.id}
+        for rule in rule_query.order_by(ScheduleRule.id)
+        if not rule_occurrences(rule, start, end)
+    )
+    return removed
 
 
-# Announcement CRUD operations
-def create_announcement(db: Session, announcement_in: AnnouncementCreate) -> Announcement:
+def get_sync_class_ids(user: User):
+    """Select of the class IDs in a user's sync scope, or None for an admin's unscoped sync"""
+    from sqlalchemy import select
+    
+    if user.role == UserRole.STUDENT:
+        return select(Enrollment.class_id).where(Enrollment.student_id == user.id)
+    if user.role == UserRole.TEACHER:
+        return select(Class.id).where(Class.teacher_id == user.id)
+    return None
+
+
+def get_sync_deletions(db: Session, user: User, since: datetime, class_ids, class_entities: List[str], user_entities: List[str], global_entities: List[str] = ()) -> List[dict]:
     """
-    Create a new announcement.
+    Get the tombstones recorded after since that concern a user.
     
     Args:
         db: Database session
-        announcement_in: Announcement creation data
+        user: The user being synced
+        since: Only include deletions recorded after this time
+        class_ids: Select of the user's class IDs from get_sync_class_ids, or None for every class
+        class_entities: Entities matched by class
+        user_entities: Entities matched by the user they are addressed to
+        global_entities: Entities everyone receives
         
     Returns:
-        Announcement: Created announcement object
+        List[dict]: {"type", "id"} dictionaries; an unenrollment is reported as
+        a deleted "class", meaning drop everything from it
     """
-    announcement = Announcement(**announcement_in.dict())
-    db.add(announcement)
-    db.commit()
-    db.refresh(announcement)
-    return announcement
+    from sqlalchemy import and_, or_
+    from models import SyncTombstone
+    
+    tombstone_query = db.query(SyncTombstone).filter(SyncTombstone.deleted_at > since)
+    if class_ids is not None:
+        tombstone_query = tombstone_query.filter(or_(
+            and_(SyncTombstone.user_id == user.id, SyncTombstone.entity.in_(user_entities)),
+            and_(SyncTombstone.entity.in_(class_entities), SyncTombstone.class_id.in_(class_ids)),
+            SyncTombstone.entity.in_(global_entities)
+        ))
+    else:
+        entities = (set(class_entities) | set(user_entities) | set(global_entities)) - {"enrollment"}
+        tombstone_query = tombstone_query.filter(SyncTombstone.entity.in_(entities))
+    return [
+        {"type": "class" if tombstone.entity == "enrollment" else tombstone.entity, "id": tombstone.entity_id}
+        for tombstone in tombstone_query.order_by(SyncTombstone.id)
+    ]
 
 
-def get_announcements(db: Session, skip: int = 0, limit: int = 100) -> List[Announcement]:
+SYNC_SCHEDULE_HISTORY = timedelta(days=14)
+
+
+def get_sync_changes(db: Session, user: User, since: Optional[datetime], now: datetime) -> dict:
     """
-    Get all announcements with pagination.
+    Get the rows a user's dashboard should apply since a sync point.
+    
+    Students get their enrolled classes' assignments, schedules and rules and
+    their own submissions; teachers the classes they teach and submissions to
+    them; admins everything. Announcements are global. Classes a student joined
+    after since are sent in full. Single schedules that ended more than
+    SYNC_SCHEDULE_HISTORY before now are left out.
     
     Args:
         db: Database session
-        skip: Number of announcements to skip (for pagination)
-        limit: Maximum number of announcements to return
+        user: The user being synced
+        since: Only include rows changed and deletions recorded after this
+            time; None for a full sync without deletions
+        now: Current time, for the schedule history cutoff
         
     Returns:
-        List[Announcement]: List of announcement objects
-    """
-    return db.query(Announcement).order_by(Announcement.date_posted.desc()).offset(skip).limit(limit).all()
+        dict: Changed assignments, submissions, schedules, schedule_rules and
+        announcements, and deleted as {"type", "id"} dictionaries
+    """
+    from sqlalchemy import or_
+    
+    class_ids = get_sync_class_ids(user)
+    new_class_ids = None
+    if user.role == UserRole.STUDENT and since is not None:
+        new_class_ids = class_ids.where(Enrollment.created_at > since)
+    
+    def changed(query, model, class_column):
+        if class_ids is not None:
+            query = query.filter(class_column.in_(class_ids))
+        if since is not None:
+            condition = model.updated_at > since
+            if new_class_ids is not None:
+                condition = or_(condition, class_column.in_(new_class_ids))
+            query = query.filter(condition)
+        return query
+    
+    assignments = changed(db.query(Assignment), Assignment, Assignment.class_id).order_by(Assignment.id).all()
+    schedules = changed(
+        db.query(Schedule).filter(Schedule.end_time > now - SYNC_SCHEDULE_HISTORY), Schedule, Schedule.class_id
+    ).order_by(Schedule.start_time).all()
+    schedule_rules = changed(db.query(ScheduleRule), ScheduleRule, ScheduleRule.class_id).order_by(ScheduleRule.id).all()
+    
+    submission_query = db.query(Submission)
+    if user.role == UserRole.STUDENT:
+        submission_query = submission_query.filter(Submission.student_id == user.id)
+    elif class_ids is not None:
+        submission_query = submission_query.join(Assignment, Assignment.id == Submission.assignment_id).filter(Assignment.class_id.in_(class_ids))
+    if since is not None:
+        submission_query = submission_query.filter(Submission.updated_at > since)
+    submissions = submission_query.order_by(Submission.id).all()
+    
+    announcement_query = db.query(Announcement)
+    if since is not None:
+        announcement_query = announcement_query.filter(Announcement.updated_at > since)
+    announcements = announcement_query.order_by(Announcement.date_posted.desc()).all()
+    
+    deleted = []
+    if since is not None:
+        # Submissions, unenrollments and class deletions are addressed to a user; the rest by class
+        class_entities = ["assignment", "schedule", "schedule_rule"]
+        if user.role == UserRole.TEACHER:
+            class_entities.append("submission")
+        deleted = get_sync_deletions(
+            db, user, since, class_ids, class_entities, ["submission", "enrollment", "class"], ["announcement"]
+        )
+    
+    return {
+        "assignments": assignments,
+        "submissions": submissions,
+        "schedules": schedules,
+        "schedule_rules": schedule_rules,
+        "announcements": announcements,
+        "deleted": deleted
+    }
 
 
-def get_announcements_live(db: Session) -> List[Announcement]:
+def get_calendar_feed_data(db: Session, since: datetime, class_ids: Optional[List[int]] = None, room_number: Optional[str] = None) -> Tuple[List[Schedule], List[ScheduleRule]]:
     """
-    Get all announcements for live display (no pagination, ordered by date).
+    Get the schedules and recurring rules that make up a calendar feed.
     
     Args:
         db: Database session
+        since: Only include single schedules ending after this time
+        class_ids: Only include these classes (optional)
+        room_number: Only include this room (optional)
         
     Returns:
-        List[Announcement]: List of all announcement objects ordered by date
+        Tuple[List[Schedule], List[ScheduleRule]]: Schedules and rules with class and teacher loaded
     """
-    return db.query(Announcement).order_by(Announcement.date_posted.desc()).all()
+    from sqlalchemy.orm import joinedload
+    
+    schedule_query = db.query(Schedule).options(joinedload(Schedule.class_).joinedload(Class.teacher)).filter(Schedule.end_time > since)
+    rule_query = db.query(ScheduleRule).options(joinedload(ScheduleRule.class_).joinedload(Class.teacher))
+    if class_ids is not None:
+        schedule_query = schedule_query.filter(Schedule.class_id.in_(class_ids))
+        rule_query = rule_query.filter(ScheduleRule.class_id.in_(class_ids))
+    if room_number is not None:
+        schedule_query = schedule_query.filter(Schedule.room_number == room_number)
+        rule_query = rule_query.filter(ScheduleRule.room_number == room_number)
+    return schedule_query.order_by(Schedule.start_time).all(), rule_query.order_by(ScheduleRule.id).all()
 
 
-def get_announcement(db: Session, announcement_id: int) -> Optional[Announcement]:
+def get_enrolled_class_ids(db: Session, student_id: int) -> List[int]:
+    """IDs of the classes a student is enrolled in"""
+    return [row.class_id for row in db.query(Enrollment.class_id).filter(Enrollment.student_id == student_id)]
+
+
+def get_class_id_by_code(db: Session, code: str) -> Optional[int]:
+    """ID of the class with this code, if any"""
+    row = db.query(Class.id).filter(Class.code == code).first()
+    return row.id if row else None
+
+
+def take_seat(db: Session, class_id: int) -> bool:
     """
-    Get a specific announcement by ID.
+    Reserve a seat with a single conditional UPDATE of student_count.
+    
+    The capacity check and the increment are one statement, so concurrent
+    enrollments cannot both take the last seat.
+    """
+    from sqlalchemy import or_, update
+    
+    return db.execute(
+        update(Class)
+        .where(Class.id == class_id, or_(Class.capacity.is_(None), Class.student_count < Class.capacity))
+        .values(student_count=Class.student_count + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+
+
+def release_seat(db: Session, class_id: int):
+    """Give back a seat taken by take_seat or held by a removed enrollment"""
+    from sqlalchemy import update
+    
+    db.execute(
+        update(Class)
+        .where(Class.id == class_id)
+        .values(student_count=Class.student_count - 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def self_enroll(db: Session, class_id: int, student_id: int) -> dict:
+    """
+    Enroll a student in a class, or put them on its waitlist if it is full.
+    
+    Seats are accounted in Class.student_count by take_seat; the enrollment and
+    waitlist rows are written with INSERT ... ON CONFLICT DO NOTHING, so repeated
+    or concurrent requests from the same student are harmless.
     
     Args:
         db: Database session
-        announcement_id: ID of the announcement
+        class_id: ID of the class
+        student_id: ID of the student
         
     Returns:
-        Optional[Announcement]: Announcement object if found, None otherwise
+        dict: status "enrolled", "already_enrolled" or "waitlisted" (with the
+        1-based waitlist position)
     """
-    return db.query(Announcement).filter(Announcement.id == announcement_id).first()
+    from sqlalchemy import delete
+    import change_tracking
+    
+    try:
+        if take_seat(db, class_id):
+            enrolled = db.execute(
+                dialect_insert(db, Enrollment)
+                .values(class_id=class_id, student_id=student_id)
+                .on_conflict_do_nothing(index_elements=["class_id", "student_id"])
+                .returning(Enrollment.id)
+            ).first()
+            if enrolled is None:
+                db.rollback()  # Gives the seat back
+                return {"status": "already_enrolled", "class_id": class_id}
+            db.execute(delete(ClassWaitlistEntry).where(
+                ClassWaitlistEntry.class_id == class_id,
+                ClassWaitlistEntry.student_id == student_id
+            ))
+            db.commit()
+            change_tracking.bump_generation("schedules", [("student", student_id)])
+            return {"status": "enrolled", "class_id": class_id}
+        
+        # Full: the cold path may read before writing
+        already_enrolled = db.query(Enrollment.id).filter(
+            Enrollment.class_id == class_id,
+            Enrollment.student_id == student_id
+        ).first()
+        if already_enrolled:
+            db.rollback()
+            return {"status": "already_enrolled", "class_id": class_id}
+        
+        db.execute(
+            dialect_insert(db, ClassWaitlistEntry)
+            .values(class_id=class_id, student_id=student_id, created_at=datetime.utcnow())
+            .on_conflict_do_nothing(index_elements=["class_id", "student_id"])
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    
+    return {"status": "waitlisted", "class_id": class_id, "position": get_waitlist_position(db, class_id, student_id)}
 
 
-def update_announcement(db: Session, announcement_id: int, announcement_in: AnnouncementCreate) -> Optional[Announcement]:
+def get_waitlist_position(db: Session, class_id: int, student_id: int) -> Optional[int]:
+    """1-based position of a student on a class waitlist, or None if not on it"""
+    entry = db.query(ClassWaitlistEntry.id).filter(
+        ClassWaitlistEntry.class_id == class_id,
+        ClassWaitlistEntry.student_id == student_id
+    ).first()
+    if not entry:
+        return None
+    return db.query(func.count(ClassWaitlistEntry.id)).filter(
+        ClassWaitlistEntry.class_id == class_id,
+        ClassWaitlistEntry.id <= entry.id
+    ).scalar()
+
+
+def leave_class(db: Session, class_id: int, student_id: int) -> Optional[dict]:
     """
-    Update an existing announcement.
+    Drop a student's enrollment or waitlist entry for a class.
+    
+    A freed seat goes to the student at the head of the waitlist in the same
+    transaction.
     
     Args:
         db: Database session
-        announcement_id: ID of the announcement to update
-        announcement_in: Updated announcement data
+        class_id: ID of the class
+        student_id: ID of the student
         
     Returns:
-        Optional[Announcement]: Updated announcement object if found, None otherwise
+        Optional[dict]: What was left ("enrollment" or "waitlist") and the
+        promoted student's ID, if any; None if the student had neither
     """
-    announcement = db.query(Announcement).filter(Announcement.id == announcement_id).first()
+    from sqlalchemy import delete, select
+    import change_tracking
+    from tombstones import record_tombstones
+    
+    try:
+        removed = db.execute(
+            delete(Enrollment)
+            .where(Enrollment.class_id == class_id, Enrollment.student_id == student_id)
+            .returning(Enrollment.id)
+        ).first()
+        if removed is None:
+            left_waitlist = db.execute(delete(ClassWaitlistEntry).where(
+                ClassWaitlistEntry.class_id == class_id,
+                ClassWaitlistEntry.student_id == student_id
+            )).rowcount
+            db.commit()
+            return {"left": "waitlist", "promoted_student_id": None} if left_waitlist else None
+        
+        # Tombstones are recorded by flush events, which this DELETE bypasses
+        record_tombstones(db.connection(), [("enrollment", class_id, class_id, student_id)])
+        release_seat(db, class_id)
+        promoted_student_id = None
+        if take_seat(db, class_id):
+            head = select(ClassWaitlistEntry.id).where(ClassWaitlistEntry.class_id == class_id).order_by(ClassWaitlistEntry.id).limit(1).scalar_subquery()
+            promoted_student_id = db.execute(
+                delete(ClassWaitlistEntry).where(ClassWaitlistEntry.id == head).returning(ClassWaitlistEntry.student_id)
+            ).scalar()
+            enrolled = None
+            if promoted_student_id is not None:
+                enrolled = db.execute(
+                    dialect_insert(db, Enrollment)
+                    .values(class_id=class_id, student_id=promoted_student_id)
+                    .on_conflict_do_nothing(index_elements=["class_id", "student_id"])
+                    .returning(Enrollment.id)
+                ).first()
+            if enrolled is None:
+                release_seat(db, class_id)
+                promoted_student_id = None
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    
+    change_tracking.bump_generation("schedules", [("student", student) for student in (student_id, promoted_student_id) if student is not None])
+    return {"left": "enrollment", "promoted_student_id": promoted_student_id}
+
+
+ENROLLMENT_IMPORT_BATCH_SIZE = 5000
+ENROLLMENT_IMPORT_MAX_ERRORS = 1000
+
+
+def import_enrollments(db: Session, rows: Iterable[Tuple[int, str, str]]) -> dict:
+    """
+    Enroll students in bulk from (line number, student username, class code) rows.
+    
+    Rows are resolved in batches with one username and one class code lookup
+    each, then staged in a temporary table (COPY on PostgreSQL, executemany
+    elsewhere) and merged into enrollments by a single INSERT ... SELECT that
+    skips existing enrollments. Everything is committed together.
+    
+    Class capacity applies as it does to self-enrollment: a class's free seats
+    go to its rows in file order and the remaining students join the end of
+    its waitlist. An imported student leaves the waitlist of a class they are
+    enrolled in.
+    
+    Args:
+        db: Database session
+        rows: Rows to import, in file order
+        
+    Returns:
+        dict: Rows read, rows staged, enrollments created, students waitlisted
+        because their class was full, staged rows skipped as already enrolled,
+        already waitlisted or repeated, and per-row errors (the first
+        ENROLLMENT_IMPORT_MAX_ERRORS of them)
+    """
+    from collections import Counter
+    import csv
+    import io
+    from sqlalchemy import text
+    from counters import adjust_counters
+    import change_tracking
+    
+    postgres = db.get_bind().dialect.name == "postgresql"
+    connection = db.connection()
+    if postgres:
+        connection.execute(text("CREATE TEMP TABLE enrollment_import (line integer NOT NULL, class_id integer NOT NULL, student_id integer NOT NULL) ON COMMIT DROP"))
+    else:
+        connection.execute(text("DROP TABLE IF EXISTS temp.enrollment_import"))
+        connection.execute(text("CREATE TEMP TABLE enrollment_import (line integer NOT NULL, class_id integer NOT NULL, student_id integer NOT NULL)"))
+    
+    summary = {"rows": 0, "staged": 0, "enrolled": 0, "waitlisted": 0, "skipped": 0, "error_count": 0, "errors": []}
+    
+    def report(line: int, error: str):
+        summary["error_count"] += 1
+        if len(summary["errors"]) < ENROLLMENT_IMPORT_MAX_ERRORS:
+            summary["errors"].append({"line": line, "error": error})
+    
+    def stage(batch: List[Tuple[int, str, str]]):
+        usernames = {username for _, username, _ in batch}
+        codes = {code for _, _, code in batch}
+        students = {row.username: row for row in db.query(User.id, User.username, User.role).filter(User.username.in_(usernames))}
+        classes = dict(db.query(Class.code, Class.id).filter(Class.code.in_(codes)).all())
+        
+        resolved = []
+        for line, username, code in batch:
+            student = students.get(username)
+            if student is None:
+                report(line, f"Unknown student '{username}'")
+            elif student.role != UserRole.STUDENT:
+                report(line, f"User '{username}' is not a student")
+            elif code not in classes:
+                report(line, f"Unknown class code '{code}'")
+            else:
+                resolved.append((line, classes[code], student.id))
+        if not resolved:
+            return
+        
+        if postgres:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(resolved)
+            buffer.seek(0)
+            with connection.connection.dbapi_connection.cursor() as cursor:
+                cursor.copy_expert("COPY enrollment_import (line, class_id, student_id) FROM STDIN WITH (FORMAT csv)", buffer)
+        else:
+            connection.execute(
+                text("INSERT INTO enrollment_import (line, class_id, student_id) VALUES (:line, :class_id, :student_id)"),
+                [{"line": line, "class_id": class_id, "student_id": student_id} for line, class_id, student_id in resolved]
+            )
+        summary["staged"] += len(resolved)
+    
+    try:
+        batch = []
+        for line, username, code in rows:
+            summary["rows"] += 1
+            username, code = username.strip(), code.strip().upper()
+            if not username or not code:
+                report(line, "Student username and class code are required")
+                continue
+            batch.append((line, username, code))
+            if len(batch) >= ENROLLMENT_IMPORT_BATCH_SIZE:
+                stage(batch)
+                batch = []
+        if batch:
+            stage(batch)
+        
+        if postgres:
+            # Hold the seat counts still against concurrent self-enrollment
+            connection.execute(text(
+                "SELECT id FROM classes WHERE id IN (SELECT class_id FROM enrollment_import) ORDER BY id FOR UPDATE"
+            ))
+        
+        # Each class's new students are numbered in file order and take its free seats first.
+        # WHERE keeps SQLite from parsing ON CONFLICT as a join constraint.
+        inserted = connection.execute(text(
+            "WITH candidates AS ("
+            " SELECT i.class_id, i.student_id, MIN(i.line) AS line FROM enrollment_import i"
+            " WHERE NOT EXISTS (SELECT 1 FROM enrollments e WHERE e.class_id = i.class_id AND e.student_id = i.student_id)"
+            " GROUP BY i.class_id, i.student_id"
+            "), ranked AS ("
+            " SELECT class_id, student_id, ROW_NUMBER() OVER (PARTITION BY class_id ORDER BY line) AS seat FROM candidates"
+            ") "
+            "INSERT INTO enrollments (class_id, student_id) "
+            "SELECT r.class_id, r.student_id FROM ranked r JOIN classes c ON c.id = r.class_id "
+            "WHERE c.capacity IS NULL OR r.seat <= c.capacity - c.student_count "
+            "ON CONFLICT (class_id, student_id) DO NOTHING "
+            "RETURNING class_id, student_id"
+        )).all()
+        
+        # Whoever did not get a seat joins the waitlist behind the students already on it
+        waitlisted = connection.execute(text(
+            "INSERT INTO class_waitlist (class_id, student_id, created_at) "
+            "SELECT i.class_id, i.student_id, :now FROM enrollment_import i "
+            "WHERE NOT EXISTS (SELECT 1 FROM enrollments e WHERE e.class_id = i.class_id AND e.student_id = i.student_id) "
+            "GROUP BY i.class_id, i.student_id ORDER BY MIN(i.line) "
+            "ON CONFLICT (class_id, student_id) DO NOTHING "
+            "RETURNING class_id"
+        ), {"now": datetime.utcnow()}).scalars().all()
+        if inserted:
+            connection.execute(text(
+                "DELETE FROM class_waitlist WHERE class_id IN (SELECT class_id FROM enrollment_import) "
+                "AND EXISTS (SELECT 1 FROM enrollments e WHERE e.class_id = class_waitlist.class_id AND e.student_id = class_waitlist.student_id)"
+            ))
+        
+        # Counters and change tracking follow ORM flushes, which this merge bypasses
+        adjust_counters(connection, Counter((class_id, "student_count") for class_id, _ in inserted), Counter())
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    change_tracking.bump_generation("schedules", {("student", student_id) for _, student_id in inserted})
+    
+    summary["errors"].sort(key=lambda error: error["line"])
+    summary["enrolled"] = len(inserted)
+    summary["waitlisted"] = len(waitlisted)
+    summary["skipped"] = summary["staged"] - len(inserted) - len(waitlisted)  # Already enrolled, already waitlisted or repeated
+    return summary
+
+
+def get_taught_class_ids(db: Session, teacher_id: int) -> List[int]:
+    """IDs of the classes a teacher is assigned to"""
+    return [row.id for row in db.query(Class.id).filter(Class.teacher_id == teacher_id)]
+
+
+def get_room_numbers(db: Session) -> List[str]:
+    """Distinct room numbers used by single and recurring schedules"""
+    rooms = {row.room_number for row in db.query(Schedule.room_number).distinct()}
+    rooms.update(row.room_number for row in db.query(ScheduleRule.room_number).distinct())
+    return sorted(rooms)
+
+
+def get_room_usage_data(db: Session, start: datetime, end: datetime, room_numbers: Optional[List[str]] = None) -> Tuple[List[Tuple[str, int, datetime, datetime]], List[Tuple[int, datetime, bool, bool]]]:
+    """
+    Load the bookings and cleanliness reports needed for room utilization analytics.
+    
+    Recurring schedules are expanded into their occurrences within the window.
+    
+    Args:
+        db: Database session
+        start: Start of the window
+        end: End of the window
+        room_numbers: Only include these rooms (optional)
+        
+    Returns:
+        Tuple of (room_number, class_id, start_time, end_time) bookings overlapping the
+        window and (class_id, created_at, is_clean_before, is_clean_after) reports filed in it
+    """
+    schedule_query = db.query(Schedule.room_number, Schedule.class_id, Schedule.start_time, Schedule.end_time).filter(
+        Schedule.start_time < end,
+        Schedule.end_time > start
+    )
+    rule_query = db.query(ScheduleRule).filter(ScheduleRule.start_time < end)
+    if room_numbers is not None:
+        schedule_query = schedule_query.filter(Schedule.room_number.in_(room_numbers))
+        rule_query = rule_query.filter(ScheduleRule.room_number.in_(room_numbers))
+    
+    bookings = [tuple(row) for row in schedule_query]
+    for rule in rule_query:
+        duration = rule.end_time - rule.start_time
+        for occurrence in expand_occurrences(rule.rrule, rule.start_time, duration, parse_exdates(rule.exdates), start, end):
+            bookings.append((rule.room_number, rule.class_id, occurrence, occurrence + duration))
+    
+    reports = [
+        tuple(row)
+        for row in db.query(ClassroomReport.class_id, ClassroomReport.created_at, ClassroomReport.is_clean_before, ClassroomReport.is_clean_after).filter(
+            ClassroomReport.created_at >= start,
+            ClassroomReport.created_at < end
+        )
+    ]
+    return bookings, reports
+
+
+# Recurring occurrences are only expanded for a bounded window; without one, the coming week
+RECURRING_DEFAULT_WINDOW = timedelta(days=7)
+
+
+def get_enriched_schedules(db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None, class_ids: Optional[List[int]] = None, room_number: Optional[str] = None, building: Optional[str] = None, teacher_id: Optional[int] = None, student_id: Optional[int] = None, updated_since: Optional[datetime] = None) -> List[dict]:
+    """
+    Get single and recurring schedules as enriched dictionaries ordered by start time.
+    
+    Recurrence rules are expanded lazily, only for the requested window, through
+    a bounded cache of expanded windows. If start or end is omitted the rules are
+    expanded from today (UTC midnight) for RECURRING_DEFAULT_WINDOW.
+    
+    Args:
+        db: Database session
+        start: Only include schedules ending after this time (optional)
+        end: Only include schedules starting before this time (optional)
+        class_ids: Only include these classes (optional)
+        room_number: Only include this room (optional)
+        building: Only include rooms whose number starts with this prefix (optional)
+        teacher_id: Only include classes taught by this teacher (optional)
+        student_id: Only include classes this student is enrolled in (optional)
+        updated_since: Only include schedules and rules changed after this time (optional)
+        
+    Returns:
+        List[dict]: Enriched schedules; recurring occurrences have id None and a rule_id
+    """
+    from sqlalchemy.orm import joinedload
+    
+    start = to_naive_utc(start) if start else None
+    end = to_naive_utc(end) if end else None
+    
+    schedule_query = db.query(Schedule).options(joinedload(Schedule.class_).joinedload(Class.teacher))
+    rule_query = db.query(ScheduleRule).options(joinedload(ScheduleRule.class_).joinedload(Class.teacher))
+    if class_ids is not None:
+        schedule_query = schedule_query.filter(Schedule.class_id.in_(class_ids))
+        rule_query = rule_query.filter(ScheduleRule.class_id.in_(class_ids))
+    if room_number is not None:
+        schedule_query = schedule_query.filter(Schedule.room_number == room_number)
+        rule_query = rule_query.filter(ScheduleRule.room_number == room_number)
+    if building is not None:
+        schedule_query = schedule_query.filter(Schedule.room_number.startswith(building, autoescape=True))
+        rule_query = rule_query.filter(ScheduleRule.room_number.startswith(building, autoescape=True))
+    if teacher_id is not None:
+        schedule_query = schedule_query.join(Schedule.class_).filter(Class.teacher_id == teacher_id)
+        rule_query = rule_query.join(ScheduleRule.class_).filter(Class.teacher_id == teacher_id)
+    if student_id is not None:
+        # Enrollment scope as a subquery keeps this a single statement
+        enrolled = db.query(Enrollment.class_id).filter(Enrollment.student_id == student_id)
+        schedule_query = schedule_query.filter(Schedule.class_id.in_(enrolled))
+        rule_query = rule_query.filter(ScheduleRule.class_id.in_(enrolled))
+    if updated_since is not None:
+        updated_since = to_naive_utc(updated_since)
+        schedule_query = schedule_query.filter(Schedule.updated_at > updated_since)
+        rule_query = rule_query.filter(ScheduleRule.updated_at > updated_since)
+    if start is not None:
+        # Served by the (end_time, start_time) index, whatever a booking's length
+        schedule_query = schedule_query.filter(Schedule.end_time > start)
+    if end is not None:
+        schedule_query = schedule_query.filter(Schedule.start_time < end)
+    
+    enriched_schedules = [
+        build_enriched_schedule(schedule.class_, schedule.id, None, schedule.class_id, schedule.start_time, schedule.end_time, schedule.room_number, schedule.status)
+        for schedule in schedule_query.all()
+    ]
+    
+    window_start = start or datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    window_end = end or window_start + RECURRING_DEFAULT_WINDOW
+    for rule in rule_query.filter(ScheduleRule.start_time < window_end).all():
+        duration = rule.end_time - rule.start_time
+        for occurrence in expand_occurrences(rule.rrule, rule.start_time, duration, parse_exdates(rule.exdates), window_start, window_end):
+            enriched_schedules.append(
+                build_enriched_schedule(rule.class_, None, rule.id, rule.class_id, occurrence, occurrence + duration, rule.room_number, rule.status)
+            )
+    
+    enriched_schedules.sort(key=lambda schedule: schedule["start_time"])
+    return enriched_schedules
+
+
+def build_enriched_schedule(class_obj: Optional[Class], schedule_id: Optional[int], rule_id: Optional[int], class_id: int, start_time: datetime, end_time: datetime, room_number: str, status: str) -> dict:
+    """Shape a schedule or recurring occurrence with its class and teacher names"""
+    # Get teacher information
+    teacher_name = "Unknown Teacher"
+    teacher_full_name = "Unknown Teacher"
+    
+    if class_obj and class_obj.teacher:
+        teacher = class_obj.teacher
+        if teacher.first_name and teacher.last_name:
+            teacher_full_name = f"{teacher.first_name} {teacher.last_name}"
+            teacher_name = f"{teacher.first_name} {teacher.last_name}"
+        elif teacher.first_name:
+            teacher_name = teacher.first_name
+            teacher_full_name = teacher.first_name
+        elif teacher.username:
+            teacher_name = teacher.username
+            teacher_full_name = teacher.username
+    
+    # Get class information
+    class_name = class_obj.name if class_obj else "Unknown Class"
+    class_code = class_obj.code if class_obj else "UNKNOWN"
+    
+    return {
+        "id": schedule_id,
+        "rule_id": rule_id,
+        "class_id": class_id,
+        "start_time": start_time,
+        "end_time": end_time,
+        "room_number": room_number,
+        "status": status,
+        "class_name": class_name,
+        "class_code": class_code,
+        "teacher_name": teacher_name,
+        "teacher_full_name": teacher_full_name
+    }
+
+
+def get_schedule(db: Session, schedule_id: int) -> Optional[Schedule]:
+    """
+    Get a specific schedule by ID.
+    
+    Args:
+        db: Database session
+        schedule_id: ID of the schedule
+        
+    Returns:
+        Optional[Schedule]: Schedule object if found, None otherwise
+    """
+    return db.query(Schedule).filter(Schedule.id == schedule_id).first()
+
+
+def update_schedule(db: Session, schedule_id: int, schedule_in: ScheduleCreate) -> Optional[Schedule]:
+    """
+    Update an existing schedule.
+    
+    Args:
+        db: Database session
+        schedule_id: ID of the schedule to update
+        schedule_in: Updated schedule data
+        
+    Returns:
+        Optional[Schedule]: Updated schedule object if found, None otherwise
+        
+    Raises:
+        HTTPException: If class_id doesn't exist, or 409 if the room is already booked
+    """
+    # Validate that the class_id exists
+    class_exists = db.query(Class).filter(Class.id == schedule_in.class_id).first()
+    if not class_exists:
+        from fastapi import HTTPException, status
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Class with ID {schedule_in.class_id} not found. Please ensure the class exists before updating a schedule."
+        )
+    
+    schedule = db.query(Schedule).filter(Schedule.id == schedule_id).first()
+    if schedule:
+        schedule_data = normalize_schedule_times(schedule_in.dict())
+        ensure_room_available(db, schedule_data, exclude_id=schedule_id)
+        for key, value in schedule_data.items():
+            setattr(schedule, key, value)
+        commit_schedule(db, schedule_data, exclude_id=schedule_id)
+        db.refresh(schedule)
+        room_index.upsert(schedule.id, schedule.room_number, schedule.start_time, schedule.end_time)
+    return schedule
+
+
+def delete_schedule(db: Session, schedule_id: int) -> bool:
+    """
+    Delete a schedule.
+    
+    Args:
+        db: Database session
+        schedule_id: ID of the schedule to delete
+        
+    Returns:
+        bool: True if deleted, False if not found
+    """
+    schedule = db.query(Schedule).filter(Schedule.id == schedule_id).first()
+    if schedule:
+        db.delete(schedule)
+        db.commit()
+        room_index.discard(schedule_id)
+        return True
+    return False
+
+
+# Recurring schedule rule CRUD operations
+def parse_exdates(exdates: str) -> Tuple[datetime, ...]:
+    """Parse the stored comma-separated exception dates"""
+    return tuple(datetime.fromisoformat(item) for item in exdates.split(",") if item)
+
+
+def schedule_rule_values(rule_in: ScheduleRuleCreate) -> dict:
+    """Column values for a rule, with times as naive UTC and exdates serialized"""
+    values = normalize_schedule_times(rule_in.dict())
+    values["exdates"] = ",".join(
+        exdate.isoformat() for exdate in sorted({to_naive_utc(exdate) for exdate in rule_in.exdates})
+    )
+    return values
+
+
+def create_schedule_rule(db: Session, rule_in: ScheduleRuleCreate) -> ScheduleRule:
+    """
+    Create a recurring schedule rule.
+    
+    Args:
+        db: Database session
+        rule_in: Rule creation data
+        
+    Returns:
+        ScheduleRule: Created rule object
+        
+    Raises:
+        HTTPException: If class_id doesn't exist, or 409 if an occurrence clashes
+            with a booking or another rule's occurrence in the same room
+    """
+    class_exists = db.query(Class).filter(Class.id == rule_in.class_id).first()
+    if not class_exists:
+        from fastapi import HTTPException, status
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Class with ID {rule_in.class_id} not found. Please ensure the class exists before creating a schedule."
+        )
+    
+    rule_data = schedule_rule_values(rule_in)
+    ensure_rule_room_available(db, rule_data)
+    
+    rule = ScheduleRule(**rule_data)
+    db.add(rule)
+    db.commit()
+    db.refresh(rule)
+    return rule
+
+
+def get_schedule_rules(db: Session, skip: int = 0, limit: int = 100) -> List[ScheduleRule]:
+    """
+    Get all recurring schedule rules with pagination.
+    
+    Args:
+        db: Database session
+        skip: Number of rules to skip (for pagination)
+        limit: Maximum number of rules to return
+        
+    Returns:
+        List[ScheduleRule]: List of rule objects
+    """
+    return db.query(ScheduleRule).offset(skip).limit(limit).all()
+
+
+def get_schedule_rule(db: Session, rule_id: int) -> Optional[ScheduleRule]:
+    """
+    Get a specific recurring schedule rule by ID.
+    
+    Args:
+        db: Database session
+        rule_id: ID of the rule
+        
+    Returns:
+        Optional[ScheduleRule]: Rule object if found, None otherwise
+    """
+    return db.query(ScheduleRule).filter(ScheduleRule.id == rule_id).first()
+
+
+def update_schedule_rule(db: Session, rule_id: int, rule_in: ScheduleRuleCreate) -> Optional[ScheduleRule]:
+    """
+    Update a recurring schedule rule.
+    
+    Args:
+        db: Database session
+        rule_id: ID of the rule to update
+        rule_in: Updated rule data
+        
+    Returns:
+        Optional[ScheduleRule]: Updated rule object if found, None otherwise
+        
+    Raises:
+        HTTPException: If class_id doesn't exist, or 409 if an occurrence clashes
+            with a booking or another rule's occurrence in the same room
+    """
+    class_exists = db.query(Class).filter(Class.id == rule_in.class_id).first()
+    if not class_exists:
+        from fastapi import HTTPException, status
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Class with ID {rule_in.class_id} not found. Please ensure the class exists before updating a schedule."
+        )
+    
+    rule = db.query(ScheduleRule).filter(ScheduleRule.id == rule_id).first()
+    if rule:
+        rule_data = schedule_rule_values(rule_in)
+        ensure_rule_room_available(db, rule_data, exclude_rule_id=rule_id)
+        for key, value in rule_data.items():
+            setattr(rule, key, value)
+        db.commit()
+        db.refresh(rule)
+    return rule
+
+
+def delete_schedule_rule(db: Session, rule_id: int) -> bool:
+    """
+    Delete a recurring schedule rule.
+    
+    Args:
+        db: Database session
+        rule_id: ID of the rule to delete
+        
+    Returns:
+        bool: True if deleted, False if not found
+    """
+    rule = db.query(ScheduleRule).filter(ScheduleRule.id == rule_id).first()
+    if rule:
+        db.delete(rule)
+        db.commit()
+        return True
+    return False
+
+
+def normalize_schedule_times(schedule_data: dict) -> dict:
+    """Store schedule times as naive UTC so they compare consistently"""
+    schedule_data["start_time"] = to_naive_utc(schedule_data["start_time"])
+    schedule_data["end_time"] = to_naive_utc(schedule_data["end_time"])
+    return schedule_data
+
+
+def find_schedule_conflicts(db: Session, room_number: str, start_time: datetime, end_time: datetime, exclude_id: Optional[int] = None) -> List[Schedule]:
+    """
+    Find bookings of a room that overlap [start_time, end_time).
+    
+    On PostgreSQL the tsrange overlap is answered by the GiST index behind the
+    schedules_room_no_overlap exclusion constraint. Other databases use the
+    in-memory per-room interval index, loading a room from the database the
+    first time it is checked.
+    
+    Args:
+        db: Database session
+        room_number: Room to check
+        start_time: Start of the requested booking
+        end_time: End of the requested booking (bookings may touch end-to-start)
+        exclude_id: Schedule to ignore, e.g. the one being updated
+        
+    Returns:
+        List[Schedule]: Overlapping schedules ordered by start time
+    """
+    query = db.query(Schedule).filter(Schedule.room_number == room_number)
+    if db.get_bind().dialect.name == "postgresql":
+        query = query.filter(
+            func.tsrange(Schedule.start_time, Schedule.end_time).op("&&")(func.tsrange(start_time, end_time))
+        )
+        if exclude_id is not None:
+            query = query.filter(Schedule.id != exclude_id)
+    else:
+        if not room_index.has_room(room_number):
+            room_index.load_room(
+                room_number,
+                db.query(Schedule.id, Schedule.start_time, Schedule.end_time).filter(Schedule.room_number == room_number).all()
+            )
+        conflict_ids = room_index.overlapping(room_number, start_time, end_time, exclude_id=exclude_id)
+        if not conflict_ids:
+            return []
+        query = query.filter(Schedule.id.in_(conflict_ids))
+    return query.order_by(Schedule.start_time).all()
+
+
+def rule_occurrences(rule: ScheduleRule, window_start: datetime, window_end: datetime) -> Tuple[datetime, ...]:
+    """Starts of a rule's occurrences that overlap [window_start, window_end)"""
+    return expand_occurrences(
+        rule.rrule, rule.start_time, rule.end_time - rule.start_time, parse_exdates(rule.exdates), window_start, window_end
+    )
+
+
+def get_rule_occurrences(db: Session, window_start: datetime, window_end: datetime, room_number: Optional[str] = None, exclude_rule_id: Optional[int] = None) -> List[Tuple[ScheduleRule, datetime]]:
+    """
+    Find recurring occurrences that overlap [window_start, window_end).
+    
+    Args:
+        db: Database session
+        window_start: Start of the window
+        window_end: End of the window
+        room_number: Only look at this room's rules (optional)
+        exclude_rule_id: Rule to ignore, e.g. the one being updated
+        
+    Returns:
+        List[Tuple[ScheduleRule, datetime]]: (rule, occurrence start) pairs ordered by start
+    """
+    query = db.query(ScheduleRule).filter(ScheduleRule.start_time < window_end)
+    if room_number is not None:
+        query = query.filter(ScheduleRule.room_number == room_number)
+    if exclude_rule_id is not None:
+        query = query.filter(ScheduleRule.id != exclude_rule_id)
+    occurrences = [
+        (rule, occurrence)
+        for rule in query.all()
+        for occurrence in rule_occurrences(rule, window_start, window_end)
+    ]
+    occurrences.sort(key=lambda pair: pair[1])
+    return occurrences
+
+
+def occurrence_overlaps(starts: Tuple[datetime, ...], duration: timedelta, start_time: datetime, end_time: datetime) -> bool:
+    """Whether any occurrence in sorted ``starts`` of length ``duration`` overlaps [start_time, end_time)"""
+    # An occurrence overlaps iff it starts after start_time - duration and before end_time
+    position = bisect_right(starts, start_time - duration)
+    return position < len(starts) and starts[position] < end_time
+
+
+def schedule_conflict_error(room_number: str, conflicts: List[Schedule], rule_conflicts: Iterable[Tuple[ScheduleRule, datetime]] = ()):
+    """Build the 409 response listing the bookings and recurring occurrences that clash"""
+    from fastapi import HTTPException, status
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail={
+            "message": f"Room {room_number} is already booked during the requested time",
+            "conflicts": [
+                {
+                    "id": conflict.id,
+                    "rule_id": None,
+                    "class_id": conflict.class_id,
+                    "room_number": conflict.room_number,
+                    "start_time": conflict.start_time.isoformat(),
+                    "end_time": conflict.end_time.isoformat()
+                }
+                for conflict in conflicts
+            ] + [
+                {
+                    "id": None,
+                    "rule_id": rule.id,
+                    "class_id": rule.class_id,
+                    "room_number": rule.room_number,
+                    "start_time": occurrence.isoformat(),
+                    "end_time": (occurrence + (rule.end_time - rule.start_time)).isoformat()
+                }
+                for rule, occurrence in rule_conflicts
+            ]
+        }
+    )
+
+
+def ensure_room_available(db: Session, schedule_data: dict, exclude_id: Optional[int] = None):
+    """
+    Reject a booking that overlaps an existing booking or a recurring occurrence in the same room.
+    
+    Raises:
+        HTTPException: 409 with the clashing bookings and occurrences
+    """
+    conflicts = find_schedule_conflicts(
+        db, schedule_data["room_number"], schedule_data["start_time"], schedule_data["end_time"], exclude_id=exclude_id
+    )
+    rule_conflicts = get_rule_occurrences(
+        db, schedule_data["start_time"], schedule_data["end_time"], room_number=schedule_data["room_number"]
+    )
+    if conflicts or rule_conflicts:
+        raise schedule_conflict_error(schedule_data["room_number"], conflicts, rule_conflicts)
+
+
+# Two rules are compared over this span from when both are active. Weekly and
+# daily rules repeat with a period far shorter than this, so a clash that
+# exists at all shows up inside it.
+RULE_CONFLICT_HORIZON = timedelta(days=366)
+
+
+def ensure_rule_room_available(db: Session, rule_data: dict, exclude_rule_id: Optional[int] = None):
+    """
+    Reject a recurring rule whose occurrences overlap a booking or another rule's occurrence in the same room.
+    
+    Args:
+        db: Database session
+        rule_data: Column values from schedule_rule_values
+        exclude_rule_id: Rule to ignore, e.g. the one being updated
+        
+    Raises:
+        HTTPException: 409 with the clashing bookings and, per clashing rule, its first clashing occurrence
+    """
+    room_number = rule_data["room_number"]
+    first_start = rule_data["start_time"]
+    duration = rule_data["end_time"] - first_start
+    exdates = parse_exdates(rule_data["exdates"])
+    
+    def occurrences(window_start: datetime, window_end: datetime) -> Tuple[datetime, ...]:
+        return expand_occurrences(rule_data["rrule"], first_start, duration, exdates, window_start, window_end)
+    
+    schedules = db.query(Schedule).filter(
+        Schedule.room_number == room_number,
+        Schedule.end_time > first_start
+    ).order_by(Schedule.start_time).all()
+    conflicts = []
+    if schedules:
+        starts = occurrences(first_start, max(schedule.end_time for schedule in schedules))
+        conflicts = [
+            schedule for schedule in schedules
+            if occurrence_overlaps(starts, duration, schedule.start_time, schedule.end_time)
+        ]
+    
+    other_rules = db.query(ScheduleRule).filter(ScheduleRule.room_number == room_number)
+    if exclude_rule_id is not None:
+        other_rules = other_rules.filter(ScheduleRule.id != exclude_rule_id)
+    rule_conflicts = []
+    for other in other_rules.all():
+        window_start = max(first_start, other.start_time)
+        window_end = window_start + RULE_CONFLICT_HORIZON
+        starts = occurrences(window_start, window_end)
+        other_duration = other.end_time - other.start_time
+        for occurrence in rule_occurrences(other, window_start, window_end):
+            if occurrence_overlaps(starts, duration, occurrence, occurrence + other_duration):
+                rule_conflicts.append((other, occurrence))
+                break
+    
+    if conflicts or rule_conflicts:
+        raise schedule_conflict_error(room_number, conflicts, rule_conflicts)
+
+
+def commit_schedule(db: Session, schedule_data: dict, exclude_id: Optional[int] = None):
+    """
+    Commit a schedule change, turning an exclusion-constraint violation into a 409.
+    
+    The pre-check can race with a concurrent booking; on PostgreSQL the
+    exclusion constraint is the final word.
+    """
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        conflicts = find_schedule_conflicts(
+            db, schedule_data["room_number"], schedule_data["start_time"], schedule_data["end_time"], exclude_id=exclude_id
+        )
+        if conflicts:
+            raise schedule_conflict_error(schedule_data["room_number"], conflicts)
+        raise
+
+
+def create_schedules_batch(db: Session, schedules_in: List[ScheduleCreate]) -> List[Schedule]:
+    """
+    Create many schedule entries in one transaction, all or nothing.
+    
+    Args:
+        db: Database session
+        schedules_in: Schedule creation data
+        
+    Returns:
+        List[Schedule]: Created schedule objects
+        
+    Raises:
+        HTTPException: 404 if a class doesn't exist, or 409 if any booking clashes
+            with an existing one or with another in the batch
+    """
+    from fastapi import HTTPException, status
+    
+    class_ids = {schedule_in.class_id for schedule_in in schedules_in}
+    found_ids = {row.id for row in db.query(Class.id).filter(Class.id.in_(class_ids))}
+    if class_ids - found_ids:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Classes not found: {', '.join(str(class_id) for class_id in sorted(class_ids - found_ids))}"
+        )
+    
+    batch = sorted(
+        (normalize_schedule_times(schedule_in.dict()) for schedule_in in schedules_in),
+        key=lambda data: (data["room_number"], data["start_time"])
+    )
+    for previous, current in zip(batch, batch[1:]):
+        if previous["room_number"] == current["room_number"] and current["start_time"] < previous["end_time"]:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail={
+                    "message": f"Room {current['room_number']} is booked twice within the batch",
+                    "conflicts": [
+                        {key: (value.isoformat() if isinstance(value, datetime) else value) for key, value in data.items()}
+                        for data in (previous, current)
+                    ]
+                }
+            )
+    for schedule_data in batch:
+        ensure_room_available(db, schedule_data)
+    
+    schedules = [Schedule(**schedule_data) for schedule_data in batch]
+    db.add_all(schedules)
+    try:
+        db.flush()
+        booked = [(schedule.id, schedule.room_number, schedule.start_time, schedule.end_time) for schedule in schedules]
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        for schedule_data in batch:
+            ensure_room_available(db, schedule_data)
+        raise
+    for schedule_id, room_number, start_time, end_time in booked:
+        room_index.upsert(schedule_id, room_number, start_time, end_time)
+    return schedules
+
+
+def ensure_room_index_loaded(db: Session):
+    """Load every room's bookings into the interval index if the snapshot is missing or stale"""
+    if room_index.needs_full_load():
+        room_index.load_all(
+            db.query(Schedule.id, Schedule.room_number, Schedule.start_time, Schedule.end_time).yield_per(1000)
+        )
+
+
+def get_room_availability(db: Session, start_time: datetime, end_time: datetime) -> dict:
+    """
+    Check which rooms are free for the whole of [start_time, end_time).
+    
+    Rooms are the distinct room numbers that appear in schedules or recurring
+    rules; a recurring occurrence in the window makes its room busy.
+    
+    Args:
+        db: Database session
+        start_time: Start of the window
+        end_time: End of the window
+        
+    Returns:
+        dict: Room number to True if free, False if booked at any point in the window
+    """
+    ensure_room_index_loaded(db)
+    start_time, end_time = to_naive_utc(start_time), to_naive_utc(end_time)
+    availability = room_index.free_rooms(start_time, end_time)
+    for (room_number,) in db.query(ScheduleRule.room_number).distinct():
+        availability.setdefault(room_number, True)
+    for rule, _ in get_rule_occurrences(db, start_time, end_time):
+        availability[rule.room_number] = False
+    return dict(sorted(availability.items()))
+
+
+def get_next_free_slots(db: Session, after: datetime, duration: timedelta, room_number: Optional[str] = None) -> List[Tuple[str, datetime]]:
+    """
+    Find each room's earliest free slot of at least ``duration`` starting at or after ``after``.
+    
+    A slot must clear both bookings and recurring occurrences. Each clash with
+    an occurrence restarts the search after it, up to NEXT_FREE_SLOT_MAX_STEPS
+    times; a room that stays busy past that is left out.
+    
+    Args:
+        db: Database session
+        after: Earliest acceptable slot start
+        duration: Required slot length
+        room_number: Only search this room (optional)
+        
+    Returns:
+        List[Tuple[str, datetime]]: (room_number, slot start) pairs ordered by slot start
+    """
+    ensure_room_index_loaded(db)
+    after = to_naive_utc(after)
+    rules_query = db.query(ScheduleRule)
+    if room_number is not None:
+        rules_query = rules_query.filter(ScheduleRule.room_number == room_number)
+    rules_by_room = {}
+    for rule in rules_query.all():
+        rules_by_room.setdefault(rule.room_number, []).append(rule)
+    
+    if room_number is not None:
+        room_numbers = [room_number]
+    else:
+        room_numbers = sorted(set(room_index.room_numbers()) | set(rules_by_room))
+    slots = []
+    for room in room_numbers:
+        if room not in rules_by_room:
+            slot_start = room_index.next_free_slot(room, after, duration)
+        else:
+            slot_start = next_free_slot_with_rules(room, after, duration, rules_by_room[room])
+        if slot_start is not None:
+            slots.append((room, slot_start))
+    slots.sort(key=lambda slot: (slot[1], slot[0]))
+    return slots
+
+
+NEXT_FREE_SLOT_MAX_STEPS = 500
+
+
+def next_free_slot_with_rules(room_number: str, after: datetime, duration: timedelta, rules: List[ScheduleRule]) -> Optional[datetime]:
+    """Earliest slot in a room that is free of both indexed bookings and the room's recurring occurrences"""
+    candidate = after
+    for _ in range(NEXT_FREE_SLOT_MAX_STEPS):
+        # A room that only has rules is not in the booking index
+        slot_start = room_index.next_free_slot(room_number, candidate, duration) or candidate
+        slot_end = slot_start + duration
+        blocked_until = max(
+            (
+                occurrence + (rule.end_time - rule.start_time)
+                for rule in rules
+                for occurrence in rule_occurrences(rule, slot_start, slot_end)
+            ),
+            default=None
+        )
+        if blocked_until is None:
+            return slot_start
+        candidate = blocked_until
+    return None
+
+
+# Announcement CRUD operations
+def create_announcement(db: Session, announcement_in: AnnouncementCreate) -> Announcement:
+    """
+    Create a new announcement.
+    
+    Args:
+        db: Database session
+        announcement_in: Announcement creation data
+        
+    Returns:
+        Announcement: Created announcement object
+    """
+    announcement = Announcement(**announcement_in.dict())
+    db.add(announcement)
+    if announcement.is_urgent:
+        enqueue_urgent_announcement(db, announcement)
+    db.commit()
+    db.refresh(announcement)
+    return announcement
+
+
+def enqueue_urgent_announcement(db: Session, announcement: Announcement):
+    """
+    Add an outbox row notifying everyone of an urgent announcement.
+    
+    The row is part of the caller's transaction, so the notification exists
+    if and only if the announcement is committed; notifications.py delivers it.
+    An announcement that already has an outbox row is not enqueued again, so
+    turning is_urgent off and back on does not repeat the fan-out while the
+    row is retained (see NOTIFICATION_RETENTION).
+    
+    Args:
+        db: Database session
+        announcement: The urgent announcement, flushed here if new
+    """
+    import json
+    from models import NotificationOutbox
+    
+    db.flush()
+    db.execute(
+        dialect_insert(db, NotificationOutbox)
+        .values(
+            event="urgent_announcement",
+            announcement_id=announcement.id,
+            payload=json.dumps({
+                "id": announcement.id,
+                "title": announcement.title,
+                "content": announcement.content,
+                "date_posted": announcement.date_posted.isoformat()
+            })
+        )
+        .on_conflict_do_nothing(index_elements=["event", "announcement_id"])
+    )
+
+
+def get_announcements(db: Session, skip: int = 0, limit: int = 100) -> List[Announcement]:
+    """
+    Get all announcements with pagination.
+    
+    Args:
+        db: Database session
+        skip: Number of announcements to skip (for pagination)
+        limit: Maximum number of announcements to return
+        
+    Returns:
+        List[Announcement]: List of announcement objects
+    """
+    return db.query(Announcement).order_by(Announcement.date_posted.desc()).offset(skip).limit(limit).all()
+
+
+def get_announcements_live(db: Session) -> List[Announcement]:
+    """
+    Get all announcements for live display (no pagination, ordered by date).
+    
+    Args:
+        db: Database session
+        
+    Returns:
+        List[Announcement]: List of all announcement objects ordered by date
+    """
+    return db.query(Announcement).order_by(Announcement.date_posted.desc()).all()
+
+
+def get_announcement(db: Session, announcement_id: int) -> Optional[Announcement]:
+    """
+    Get a specific announcement by ID.
+    
+    Args:
+        db: Database session
+        announcement_id: ID of the announcement
+        
+    Returns:
+        Optional[Announcement]: Announcement object if found, None otherwise
+    """
+    return db.query(Announcement).filter(Announcement.id == announcement_id).first()
+
+
+def update_announcement(db: Session, announcement_id: int, announcement_in: AnnouncementCreate) -> Optional[Announcement]:
+    """
+    Update an existing announcement.
+    
+    Args:
+        db: Database session
+        announcement_id: ID of the announcement to update
+        announcement_in: Updated announcement data
+        
+    Returns:
+        Optional[Announcement]: Updated announcement object if found, None otherwise
+    """
+    # An announcement that becomes urgent is notified like a new urgent one
+    announcement = db.query(Announcement).filter(Announcement.id == announcement_id).first()
     if announcement:
+        was_urgent = announcement.is_urgent
         for key, value in announcement_in.dict().items():
             setattr(announcement, key, value)
+        if announcement.is_urgent and not was_urgent:
+            enqueue_urgent_announcement(db, announcement)
         db.commit()
         db.refresh(announcement)
     return announcement
@@ -933,7 +2430,7 @@ def delete_announcement(db: Session, announcement_id: int) -> bool:
 
 
 # Classroom Report CRUD operations
-def create_classroom_report(db: Session, report_in: ClassroomReportCreate, reporter_id: int) -> ClassroomReport:
+def create_classroom_report(db: Session, report_in: ClassroomReportCreate, reporter_id: int, photo_hash: Optional[int] = None) -> ClassroomReport:
     """
     Create a new classroom report.
     
@@ -941,6 +2438,7 @@ def create_classroom_report(db: Session, report_in: ClassroomReportCreate, repor
         db: Database session
         report_in: ClassroomReportCreate object containing report data
         reporter_id: ID of the user creating the report
+        photo_hash: Optional perceptual hash of the attached photo
         
     Returns:
         ClassroomReport: The created report object
@@ -965,7 +2463,8 @@ def create_classroom_report(db: Session, report_in: ClassroomReportCreate, repor
         is_clean_before=report_in.is_clean_before,
         is_clean_after=report_in.is_clean_after,
         report_text=report_in.report_text,
-        photo_url=report_in.photo_url
+        photo_url=report_in.photo_url,
+        photo_hash=photo_hash
     )
     
     db.add(db_report)
@@ -1005,6 +2504,44 @@ def get_classroom_reports_by_class(db: Session, class_id: int, skip: int = 0, li
     return db.query(ClassroomReport).filter(ClassroomReport.class_id == class_id).order_by(ClassroomReport.created_at.desc()).offset(skip).limit(limit).all()
 
 
+def get_classroom_reports_by_class_after(
+    db: Session,
+    class_id: int,
+    after_id: int = 0,
+    limit: int = 200,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> List[tuple]:
+    """
+    Get one page of a class's classroom reports using keyset pagination.
+    
+    Used to stream large exports in constant memory: callers pass the last
+    report ID they saw as ``after_id`` to fetch the next page.
+    
+    Args:
+        db: Database session
+        class_id: ID of the class
+        after_id: Only return reports with an ID greater than this
+        limit: Maximum number of reports to return
+        start: Optional inclusive lower bound on created_at
+        end: Optional exclusive upper bound on created_at
+        
+    Returns:
+        List[tuple]: (ClassroomReport, reporter username) rows ordered by report ID
+    """
+    query = db.query(ClassroomReport, User.username).join(
+        User, ClassroomReport.reporter_id == User.id
+    ).filter(
+        ClassroomReport.class_id == class_id,
+        ClassroomReport.id > after_id
+    )
+    if start is not None:
+        query = query.filter(ClassroomReport.created_at >= start)
+    if end is not None:
+        query = query.filter(ClassroomReport.created_at < end)
+    return query.order_by(ClassroomReport.id).limit(limit).all()
+
+
 def get_classroom_reports_by_reporter(db: Session, reporter_id: int, skip: int = 0, limit: int = 100) -> List[ClassroomReport]:
     """
     Get classroom reports created by a specific user.
@@ -1054,6 +2591,63 @@ def delete_classroom_report(db: Session, report_id: int) -> bool:
     return False
 
 
+def get_report_photo_hashes(db: Session) -> List[Tuple[int, int]]:
+    """
+    Get the photo hash of every classroom report that has one.
+    
+    Only the two integer columns are fetched, so this stays cheap even with
+    hundreds of thousands of reports.
+    
+    Args:
+        db: Database session
+        
+    Returns:
+        List[Tuple[int, int]]: (report ID, photo hash) pairs ordered by report ID
+    """
+    return db.query(ClassroomReport.id, ClassroomReport.photo_hash).filter(
+        ClassroomReport.photo_hash.isnot(None)
+    ).order_by(ClassroomReport.id).all()
+
+
+def get_classroom_reports_with_details(db: Session, report_ids: List[int]) -> List[tuple]:
+    """
+    Get classroom reports together with their class and reporter in one query.
+    
+    Args:
+        db: Database session
+        report_ids: IDs of the reports to fetch
+        
+    Returns:
+        List[tuple]: (ClassroomReport, Class, User) rows
+    """
+    if not report_ids:
+        return []
+    return db.query(ClassroomReport, Class, User).join(
+        Class, ClassroomReport.class_id == Class.id
+    ).join(
+        User, ClassroomReport.reporter_id == User.id
+    ).filter(ClassroomReport.id.in_(report_ids)).all()
+
+
+def get_reports_missing_photo_hash(db: Session, after_id: int = 0, limit: int = 500) -> List[ClassroomReport]:
+    """
+    Get reports with a photo that has not been hashed yet.
+    
+    Args:
+        db: Database session
+        after_id: Only return reports with an ID greater than this (keyset pagination)
+        limit: Maximum number of reports to return
+        
+    Returns:
+        List[ClassroomReport]: Reports with photo_url set and photo_hash empty
+    """
+    return db.query(ClassroomReport).filter(
+        ClassroomReport.id > after_id,
+        ClassroomReport.photo_url.isnot(None),
+        ClassroomReport.photo_hash.is_(None)
+    ).order_by(ClassroomReport.id).limit(limit).all()
+
+
 # Password change CRUD operations
 def change_user_password(db: Session, user_id: int, current_password: str, new_password: str) -> bool:
     """
@@ -1157,4 +2751,277 @@ def update_user_profile_picture(db: Session, user_id: int, profile_picture_url:
         return user
     except Exception as e:
         db.rollback()
-        raise ValueError(f"Failed to update profile picture: {str(e)}")
\ No newline at end of file
+        raise ValueError(f"Failed to update profile picture: {str(e)}")
+
+
+# Resumable upload session CRUD operations
+def create_upload_session(db: Session, upload_id: str, user_id: int, filename: str, total_size: int, expires_at: datetime) -> UploadSession:
+    """
+    Create a new resumable upload session.
+    
+    Args:
+        db: Database session
+        upload_id: Opaque ID handed to the client
+        user_id: ID of the user uploading the file
+        filename: Original filename of the upload
+        total_size: Declared size of the complete file in bytes
+        expires_at: When the session expires if no further chunks arrive
+        
+    Returns:
+        UploadSession: The created upload session
+    """
+    upload_session = UploadSession(
+        id=upload_id,
+        user_id=user_id,
+        filename=filename,
+        total_size=total_size,
+        received_bytes=0,
+        expires_at=expires_at
+    )
+    
+    db.add(upload_session)
+    db.commit()
+    db.refresh(upload_session)
+    return upload_session
+
+
+def get_upload_session(db: Session, upload_id: str, user_id: int) -> Optional[UploadSession]:
+    """
+    Get a live (non-expired) upload session owned by a user.
+    
+    Args:
+        db: Database session
+        upload_id: ID of the upload session
+        user_id: ID of the user who owns the session
+        
+    Returns:
+        Optional[UploadSession]: Upload session if found and not expired, None otherwise
+    """
+    return db.query(UploadSession).filter(
+        UploadSession.id == upload_id,
+        UploadSession.user_id == user_id,
+        UploadSession.expires_at > datetime.utcnow()
+    ).first()
+
+
+def advance_upload_session(db: Session, upload_id: str, expected_offset: int, new_offset: int, expires_at: datetime) -> bool:
+    """
+    Move an upload session's offset forward after a chunk has been written.
+    
+    The update is conditional on the offset still being ``expected_offset`` so
+    two clients racing on the same chunk cannot both advance the session.
+    
+    Args:
+        db: Database session
+        upload_id: ID of the upload session
+        expected_offset: Offset the chunk was written at
+        new_offset: Offset after the chunk
+        expires_at: New expiry time for the session
+        
+    Returns:
+        bool: True if the offset was advanced, False if another write won
+    """
+    updated = db.query(UploadSession).filter(
+        UploadSession.id == upload_id,
+        UploadSession.received_bytes == expected_offset
+    ).update(
+        {"received_bytes": new_offset, "expires_at": expires_at},
+        synchronize_session=False
+    )
+    db.commit()
+    return updated == 1
+
+
+def delete_upload_session(db: Session, upload_id: str) -> bool:
+    """
+    Delete an upload session.
+    
+    Args:
+        db: Database session
+        upload_id: ID of the upload session to delete
+        
+    Returns:
+        bool: True if deleted, False if not found
+    """
+    deleted = db.query(UploadSession).filter(UploadSession.id == upload_id).delete(synchronize_session=False)
+    db.commit()
+    return deleted == 1
+
+
+def delete_expired_upload_sessions(db: Session, now: datetime) -> List[str]:
+    """
+    Delete all upload sessions that expired before ``now``.
+    
+    Args:
+        db: Database session
+        now: Reference time for expiry
+        
+    Returns:
+        List[str]: IDs of the deleted sessions, so their partial files can be reclaimed
+    """
+    expired_ids = [row.id for row in db.query(UploadSession.id).filter(UploadSession.expires_at <= now).all()]
+    if expired_ids:
+        db.query(UploadSession).filter(UploadSession.id.in_(expired_ids)).delete(synchronize_session=False)
+        db.commit()
+    return expired_ids
+
+
+def get_upload_session_ids(db: Session) -> List[str]:
+    """
+    Get the IDs of all upload sessions still in the database.
+    
+    Args:
+        db: Database session
+        
+    Returns:
+        List[str]: List of upload session IDs
+    """
+    return [row.id for row in db.query(UploadSession.id).all()]
+
+
+
+# Upload storage accounting
+def get_referenced_upload_urls(db: Session, urls: List[str]) -> set:
+    """
+    Find which of the given upload URLs are still referenced by a user or report.
+    
+    Args:
+        db: Database session
+        urls: Batch of upload URLs (e.g. "/uploads/<filename>") to check
+        
+    Returns:
+        set: The subset of ``urls`` referenced by users.profile_picture_url or classroom_reports.photo_url
+    """
+    if not urls:
+        return set()
+    
+    profile_urls = db.query(User.profile_picture_url).filter(User.profile_picture_url.in_(urls))
+    report_urls = db.query(ClassroomReport.photo_url).filter(ClassroomReport.photo_url.in_(urls))
+    return {row[0] for row in profile_urls.union(report_urls).all()}
+
+
+def iter_upload_references(db: Session, batch_size: int = 1000) -> Iterator[Tuple[str, int, str, str]]:
+    """
+    Stream every stored upload reference without loading whole tables.
+    
+    Args:
+        db: Database session
+        batch_size: Number of rows fetched per round trip
+        
+    Yields:
+        Tuple[str, int, str, str]: (upload URL, owning user ID, username, category) where
+        category is "profile_picture" or "report_photo"
+    """
+    profile_rows = db.query(User.profile_picture_url, User.id, User.username).filter(
+        User.profile_picture_url.isnot(None)
+    ).yield_per(batch_size)
+    for url, user_id, username in profile_rows:
+        yield url, user_id, username, "profile_picture"
+    
+    report_rows = db.query(ClassroomReport.photo_url, User.id, User.username).join(
+        User, ClassroomReport.reporter_id == User.id
+    ).filter(
+        ClassroomReport.photo_url.isnot(None)
+    ).yield_per(batch_size)
+    for url, user_id, username in report_rows:
+        yield url, user_id, username, "report_photo"
+
+
+def claim_idempotency_key(db: Session, owner: str, key: str, method: str, path: str, claimed_at: datetime, expires_before: datetime, lease_expires_before: datetime) -> Optional[IdempotencyKey]:
+    """
+    Claim an idempotency key for a request about to run.
+    
+    A stored response older than ``expires_before`` is dropped and the key
+    claimed afresh. So is an in-flight claim older than ``lease_expires_before``,
+    whose worker is assumed to have died before storing a response.
+    
+    Args:
+        db: Database session
+        owner: Username the key belongs to
+        key: Idempotency-Key header value
+        method: HTTP method of the request
+        path: Request path
+        claimed_at: Time of this claim; identifies it to complete and release
+        expires_before: Keys created before this time are expired
+        lease_expires_before: In-flight keys claimed before this time are abandoned
+        
+    Returns:
+        Optional[IdempotencyKey]: None if the key was claimed for this request,
+        otherwise the existing record (in flight if its status_code is None)
+    """
+    from sqlalchemy import and_, or_
+    
+    db.query(IdempotencyKey).filter(
+        IdempotencyKey.owner == owner,
+        IdempotencyKey.key == key,
+        or_(
+            IdempotencyKey.created_at < expires_before,
+            and_(IdempotencyKey.status_code.is_(None), IdempotencyKey.created_at < lease_expires_before)
+        )
+    ).delete(synchronize_session=False)
+    db.add(IdempotencyKey(owner=owner, key=key, method=method, path=path, created_at=claimed_at))
+    try:
+        db.commit()
+        return None
+    except IntegrityError:
+        db.rollback()
+        return db.query(IdempotencyKey).filter(IdempotencyKey.owner == owner, IdempotencyKey.key == key).first()
+
+
+def complete_idempotency_key(db: Session, owner: str, key: str, claimed_at: datetime, request_hash: Optional[str], status_code: int, content_type: Optional[str], response_body: bytes):
+    """
+    Store the response of a claimed idempotency key for replay.
+    
+    Nothing is stored if the claim's lease ran out and a retry re-claimed the key.
+    
+    Args:
+        db: Database session
+        owner: Username the key belongs to
+        key: Idempotency-Key header value
+        claimed_at: Time the key was claimed, as passed to claim_idempotency_key
+        request_hash: SHA-256 of the request body, or None if it was not fully read
+        status_code: Response status
+        content_type: Response Content-Type header
+        response_body: Response body
+    """
+    db.query(IdempotencyKey).filter(
+        IdempotencyKey.owner == owner,
+        IdempotencyKey.key == key,
+        IdempotencyKey.created_at == claimed_at
+    ).update(
+        {
+            "request_hash": request_hash,
+            "status_code": status_code,
+            "content_type": content_type,
+            "response_body": response_body
+        },
+        synchronize_session=False
+    )
+    db.commit()
+
+
+def release_idempotency_key(db: Session, owner: str, key: str, claimed_at: datetime):
+    """Drop a claimed key whose request failed, so a retry runs again"""
+    db.query(IdempotencyKey).filter(
+        IdempotencyKey.owner == owner,
+        IdempotencyKey.key == key,
+        IdempotencyKey.created_at == claimed_at,
+        IdempotencyKey.status_code.is_(None)
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+def delete_expired_idempotency_keys(db: Session, expires_before: datetime) -> int:
+    """
+    Delete idempotency keys created before ``expires_before``.
+    
+    Args:
+        db: Database session
+        expires_before: Keys created before this time are expired
+        
+    Returns:
+        int: Number of keys deleted
+    """
+    deleted = db.query(IdempotencyKey).filter(IdempotencyKey.created_at < expires_before).delete(synchronize_session=False)
+    db.commit()
+    return deleted
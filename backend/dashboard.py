@@ -0,0 +1,119 @@
+"""
+Role-aware dashboard bootstrap.
+
+The dashboards used to fire one request per panel on login. /me/bootstrap
+authenticates once and loads every panel for the user's role in that one
+round trip, one section after another on the request's own database
+session. A session per section would hold several pool connections per
+request and exhaust the pool during a login rush. Each section carries an
+ETag of its content; a client that sends back the ETags it holds gets those
+sections without data.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session
+
+from crud import count_total_classes, count_total_users, get_announcements_live, get_assignments_by_teacher, get_assignments_for_student, get_classes, get_classes_by_teacher, get_classes_for_student, get_grades_for_student, get_user_calendar
+from models import AnnouncementResponse, AssignmentResponse, ClassResponse, User, UserRole
+
+DASHBOARD_SCHEDULE_WINDOW = timedelta(days=7)
+DASHBOARD_LIST_LIMIT = 100
+
+
+def _classes(db: Session, user: User, now: datetime):
+    if user.role == UserRole.STUDENT:
+        classes = get_classes_for_student(db, user.id)
+    elif user.role == UserRole.TEACHER:
+        classes = get_classes_by_teacher(db, teacher_id=user.id)
+    else:
+        classes = get_classes(db, limit=DASHBOARD_LIST_LIMIT)
+    return [ClassResponse.model_validate(c) for c in classes]
+
+
+def _assignments(db: Session, user: User, now: datetime):
+    if user.role == UserRole.STUDENT:
+        assignments = get_assignments_for_student(db, user.id)
+    else:
+        assignments = get_assignments_by_teacher(db, teacher_id=user.id, limit=DASHBOARD_LIST_LIMIT)
+    return [AssignmentResponse.model_validate(a) for a in assignments]
+
+
+def _grades(db: Session, user: User, now: datetime):
+    return get_grades_for_student(db, user.id)
+
+
+def _schedules(db: Session, user: User, now: datetime):
+    start = datetime.combine(now.date(), datetime.min.time())
+    return get_user_calendar(db, user, start, start + DASHBOARD_SCHEDULE_WINDOW)
+
+
+def _announcements(db: Session, user: User, now: datetime):
+    return [AnnouncementResponse.model_validate(a) for a in get_announcements_live(db)]
+
+
+def _metrics(db: Session, user: User, now: datetime):
+    if user.role == UserRole.TEACHER:
+        classes = get_classes_by_teacher(db, teacher_id=user.id)
+        return {"total_classes": len(classes), "total_students": sum(c.student_count for c in classes)}
+    return {"total_users": count_total_users(db), "total_classes": count_total_classes(db)}
+
+
+SECTION_LOADERS: Dict[str, Callable[[Session, User, datetime], object]] = {
+    "classes": _classes,
+    "assignments": _assignments,
+    "grades": _grades,
+    "schedules": _schedules,
+    "announcements": _announcements,
+    "metrics": _metrics,
+}
+
+# Sections each role's dashboard shows, besides the user profile
+ROLE_SECTIONS = {
+    UserRole.STUDENT: ("classes", "assignments", "grades", "schedules", "announcements"),
+    UserRole.TEACHER: ("classes", "assignments", "schedules", "announcements", "metrics"),
+    UserRole.ADMIN: ("classes", "schedules", "announcements", "metrics"),
+}
+
+
+def section_etag(name: str, data) -> str:
+    body = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return f'"{name}-{hashlib.sha256(body).hexdigest()[:24]}"'
+
+
+def select_sections(role: UserRole, requested: Optional[Iterable[str]]) -> List[str]:
+    """The role's sections, narrowed to those requested; raises ValueError for unknown names"""
+    available = ROLE_SECTIONS[role]
+    if not requested:
+        return list(available)
+    unknown = sorted(set(requested) - set(available))
+    if unknown:
+        raise ValueError(f"Unknown dashboard section(s): {', '.join(unknown)}; available: {', '.join(available)}")
+    return [name for name in available if name in requested]
+
+
+def load_dashboard(db: Session, user: User, sections: List[str], known_etags: Iterable[str], now: datetime) -> dict:
+    """
+    Load dashboard sections in order on one session.
+
+    Args:
+        db: The request's database session
+        user: Authenticated user
+        sections: Section names, as returned by select_sections
+        known_etags: ETags the client already holds
+        now: Current time
+
+    Returns:
+        dict: Section name -> {"etag", "data"}, or {"etag", "not_modified": True}
+        when the client already holds that ETag
+    """
+    known = set(known_etags)
+    payload = {}
+    for name in sections:
+        data = jsonable_encoder(SECTION_LOADERS[name](db, user, now))
+        etag = section_etag(name, data)
+        payload[name] = {"etag": etag, "not_modified": True} if etag in known else {"etag": etag, "data": data}
+    return payload
@@ -3,6 +3,7 @@ from dotenv import load_dotenv
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from starlette.requests import HTTPConnection
 
 # Load environment variables from .env file
 load_dotenv()
@@ -22,8 +23,15 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # Create Base class for declarative models
 Base = declarative_base()
 
+# Scope key under which /batch hands its session to in-process sub-requests
+SHARED_SESSION_SCOPE_KEY = "classtrack.db"
+
 # Dependency to get database session
-def get_db():
+def get_db(connection: HTTPConnection):
+    shared = connection.scope.get(SHARED_SESSION_SCOPE_KEY)
+    if shared is not None:
+        yield shared
+        return
     db = SessionLocal()
     try:
         yield db
@@ -0,0 +1,184 @@
+"""
+Idempotency-Key support for POST and PATCH requests.
+
+A client that may retry a write sends an Idempotency-Key header. The first
+request with a key claims it and runs normally; its response is stored
+against the key. A retry with the same key gets the stored response back
+without the endpoint running again, so no validation queries are repeated
+and no upload is saved twice. Keys are scoped to the authenticated user and
+expire after IDEMPOTENCY_KEY_TTL.
+
+While the first request runs, retries get 409. That claim is a lease: if it
+is still unfinished after IDEMPOTENCY_CLAIM_LEASE, the worker is taken to
+have died and the next retry claims the key and runs the request again.
+
+Key reads and writes run in the threadpool, so waiting for a pooled
+connection never blocks the event loop.
+"""
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Optional
+
+from crud import claim_idempotency_key, complete_idempotency_key, release_idempotency_key, delete_expired_idempotency_keys
+from database import SessionLocal
+from security import verify_token
+
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+IDEMPOTENCY_CLAIM_LEASE = timedelta(minutes=5)
+IDEMPOTENT_METHODS = ("POST", "PATCH")
+MAX_KEY_LENGTH = 255
+MAX_STORED_RESPONSE_BYTES = 1024 * 1024
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _token_owner(scope) -> Optional[str]:
+    authorization = _header(scope, b"authorization")
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return None
+    return verify_token(authorization[7:].strip())
+
+
+async def _send_json(send, status_code: int, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _hash_body(receive) -> Optional[str]:
+    """Read and hash a request body the endpoint will not see"""
+    digest = hashlib.sha256()
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        digest.update(message.get("body", b""))
+        if not message.get("more_body", False):
+            return digest.hexdigest()
+
+
+def sweep_idempotency_keys() -> int:
+    """Delete expired idempotency keys; returns how many were removed"""
+    db = SessionLocal()
+    try:
+        return delete_expired_idempotency_keys(db, datetime.utcnow() - IDEMPOTENCY_KEY_TTL)
+    finally:
+        db.close()
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware storing and replaying responses by Idempotency-Key"""
+
+    def __init__(self, app, session_factory=SessionLocal):
+        self.app = app
+        self.session_factory = session_factory
+
+    def _with_session(self, operation, *args):
+        """Run a crud operation on its own session; called through asyncio.to_thread"""
+        db = self.session_factory()
+        try:
+            return operation(db, *args)
+        finally:
+            db.close()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in IDEMPOTENT_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        key = _header(scope, b"idempotency-key")
+        owner = _token_owner(scope) if key is not None else None
+        if owner is None:
+            # No key, or a request the endpoint will reject as unauthenticated
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await _send_json(send, 400, f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+            return
+
+        claimed_at = datetime.utcnow()
+        existing = await asyncio.to_thread(
+            self._with_session, claim_idempotency_key, owner, key, scope["method"], scope["path"], claimed_at,
+            claimed_at - IDEMPOTENCY_KEY_TTL, claimed_at - IDEMPOTENCY_CLAIM_LEASE
+        )
+
+        if existing is None:
+            await self._run_and_store(scope, receive, send, owner, key, claimed_at)
+        else:
+            await self._replay(existing, scope, receive, send)
+
+    async def _replay(self, existing, scope, receive, send):
+        if existing.method != scope["method"] or existing.path != scope["path"]:
+            await _send_json(send, 422, "Idempotency-Key was already used for a different request")
+            return
+        if existing.status_code is None:
+            await _send_json(send, 409, "A request with this Idempotency-Key is still being processed")
+            return
+
+        request_hash = await _hash_body(receive)
+        if existing.request_hash is not None and request_hash != existing.request_hash:
+            await _send_json(send, 422, "Idempotency-Key was already used for a different request")
+            return
+
+        body = existing.response_body or b""
+        headers = [(b"content-length", str(len(body)).encode()), (b"idempotent-replayed", b"true")]
+        if existing.content_type:
+            headers.append((b"content-type", existing.content_type.encode("latin-1")))
+        await send({"type": "http.response.start", "status": existing.status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _run_and_store(self, scope, receive, send, owner: str, key: str, claimed_at: datetime):
+        digest = hashlib.sha256()
+        # Multipart boundaries may change between retries, so those bodies are not fingerprinted
+        content_type = _header(scope, b"content-type") or ""
+        request = {"complete": False, "fingerprint": not content_type.startswith("multipart/")}
+        response = {"status": None, "content_type": None, "chunks": [], "size": 0}
+
+        async def hashing_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                digest.update(message.get("body", b""))
+                if not message.get("more_body", False):
+                    request["complete"] = True
+            return message
+
+        async def capturing_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                for name, value in message.get("headers", []):
+                    if name.lower() == b"content-type":
+                        response["content_type"] = value.decode("latin-1")
+            elif message["type"] == "http.response.body" and response["size"] <= MAX_STORED_RESPONSE_BYTES:
+                chunk = message.get("body", b"")
+                response["chunks"].append(chunk)
+                response["size"] += len(chunk)
+            await send(message)
+
+        stored = False
+        try:
+            await self.app(scope, hashing_receive, capturing_send)
+            status_code = response["status"]
+            if status_code is not None and status_code < 500 and response["size"] <= MAX_STORED_RESPONSE_BYTES:
+                await asyncio.to_thread(
+                    self._with_session, complete_idempotency_key, owner, key, claimed_at,
+                    digest.hexdigest() if request["complete"] and request["fingerprint"] else None,
+                    status_code,
+                    response["content_type"],
+                    b"".join(response["chunks"])
+                )
+                stored = True
+        finally:
+            if not stored:
+                # Server errors and unstorable responses are not replayed; let a retry run again
+                await asyncio.to_thread(self._with_session, release_idempotency_key, owner, key, claimed_at)
@@ -0,0 +1,633 @@
+import os
+import struct
+import numpy as np
+from itertools import combinations
+from math import comb
+from PIL import Image
+from typing import BinaryIO, List, NamedTuple, Optional, Tuple
+
+# Upload guard limits
+MAX_IMAGE_PIXELS = 50_000_000  # Largest phone sensors are ~48MP
+MAX_IMAGE_FRAMES = 100
+COPY_BLOCK_SIZE = 64 * 1024
+
+# Pillow's own decompression-bomb check, in case anything decodes an unchecked file
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+# Perceptual hash configuration
+DHASH_SIZE = 8  # 8x8 gradient bits -> 64-bit hash
+MAX_DUPLICATE_DISTANCE = 8  # Search cost grows quickly beyond this
+PROBE_PASS_COST = 10  # Relative cost of one probe pass vs. one candidate check
+PROBE_CHUNK_SIZE = 1 << 16  # Bounds candidate-pair memory per lookup
+
+
+def compute_dhash(file_path: str) -> int:
+    """
+    Compute the 64-bit difference hash (dHash) of an image.
+
+    The image is reduced to a 9x8 grayscale thumbnail and each bit records
+    whether a pixel is brighter than its right-hand neighbour, so re-encoded,
+    resized or lightly edited copies of a photo hash to nearby values.
+
+    Args:
+        file_path: Path of the image on disk
+
+    Returns:
+        int: Hash as a signed 64-bit integer (fits a BIGINT column)
+
+    Raises:
+        OSError: If the file cannot be read or decoded as an image
+    """
+    with Image.open(file_path) as image:
+        # Let JPEG decode at reduced scale; we only need a tiny thumbnail
+        image.draft("L", (DHASH_SIZE * 8, DHASH_SIZE * 8))
+        thumbnail = image.convert("L").resize((DHASH_SIZE + 1, DHASH_SIZE), Image.BILINEAR)
+        pixels = np.asarray(thumbnail, dtype=np.int16)
+
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return to_signed64(value)
+
+
+def to_signed64(value: int) -> int:
+    """Map an unsigned 64-bit hash onto the signed BIGINT range"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def hamming_distances(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Element-wise Hamming distance between two arrays of 64-bit hashes.
+
+    Args:
+        a: Array of hashes (any 64-bit integer dtype)
+        b: Array of hashes broadcastable against ``a``
+
+    Returns:
+        np.ndarray: Array of bit distances (0-64)
+    """
+    xor = np.bitwise_xor(a.astype(np.int64).view(np.uint64), b.astype(np.int64).view(np.uint64))
+    if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+        return np.bitwise_count(xor)
+
+    # SWAR popcount for older NumPy
+    xor = xor - ((xor >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    xor = (xor & np.uint64(0x3333333333333333)) + ((xor >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    xor = (xor + (xor >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return ((xor * np.uint64(0x0101010101010101)) >> np.uint64(56)).astype(np.uint8)
+
+
+def _band_plan(count: int, max_distance: int) -> Tuple[int, int]:
+    """
+    Choose how many bands to split the hash into for a search.
+
+    With ``bands`` bands, two hashes within ``max_distance`` bits agree on some
+    band to within ``max_distance // bands`` bits. More bands mean narrower
+    bands (more false candidates per probe); fewer bands mean a larger probe
+    radius (more probes). Pick the split with the lowest estimated work.
+
+    Returns:
+        Tuple[int, int]: (number of bands, probe radius per band)
+    """
+    best = None
+    for bands in range(1, max_distance + 2):
+        width = 64 // bands
+        radius = max_distance // bands
+        probes = sum(comb(width, k) for k in range(radius + 1))
+        # Each probe costs a few passes over the array plus one check per candidate
+        cost = bands * probes * (PROBE_PASS_COST + count / float(1 << width))
+        if best is None or cost < best[0]:
+            best = (cost, bands, radius)
+    return best[1], best[2]
+
+
+def _band_bounds(bands: int) -> List[Tuple[int, int]]:
+    """Split 64 bits into ``bands`` contiguous (shift, width) slices"""
+    bounds = []
+    shift = 0
+    for band in range(bands):
+        width = 64 // bands + (1 if band < 64 % bands else 0)
+        bounds.append((shift, width))
+        shift += width
+    return bounds
+
+
+def _matching_pairs(sorted_values: np.ndarray, order: np.ndarray, probes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """All index pairs (i, j) with probes[i] == values[j], given values sorted by ``order``"""
+    low = np.searchsorted(sorted_values, probes, side="left")
+    high = np.searchsorted(sorted_values, probes, side="right")
+    counts = high - low
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    left = np.repeat(np.arange(len(probes)), counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    right = order[np.repeat(low, counts) + offsets]
+    return left, right
+
+
+def find_near_duplicate_groups(hashes: np.ndarray, max_distance: int) -> List[np.ndarray]:
+    """
+    Group hashes that are within ``max_distance`` bits of each other.
+
+    Uses multi-index hashing: the 64 bits are split into bands, and by the
+    pigeonhole principle any two hashes within the distance are within
+    ``max_distance // bands`` bits of each other on at least one band.
+    Candidate pairs therefore come from sorted-band lookups of each hash and
+    its few bit-flipped probes rather than from comparing all pairs, and are
+    verified with a vectorized popcount. Identical hashes are collapsed first
+    so a photo reused hundreds of times costs no more than one used twice.
+
+    Args:
+        hashes: Array of signed 64-bit hashes, one per report
+        max_distance: Maximum Hamming distance (0 to MAX_DUPLICATE_DISTANCE)
+
+    Returns:
+        List[np.ndarray]: Groups of indices into ``hashes``; only groups of two or more are returned
+
+    Raises:
+        ValueError: If max_distance is out of range
+    """
+    if max_distance < 0 or max_distance > MAX_DUPLICATE_DISTANCE:
+        raise ValueError(f"max_distance must be between 0 and {MAX_DUPLICATE_DISTANCE}")
+
+    hashes = np.asarray(hashes, dtype=np.int64)
+    if len(hashes) < 2:
+        return []
+
+    unique_hashes, inverse = np.unique(hashes, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    unsigned = unique_hashes.view(np.uint64)
+
+    # Union-find over unique hashes
+    parent = list(range(len(unique_hashes)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    if max_distance > 0 and len(unique_hashes) > 1:
+        bands, radius = _band_plan(len(unique_hashes), max_distance)
+        for shift, width in _band_bounds(bands):
+            band = (unsigned >> np.uint64(shift)) & np.uint64((1 << width) - 1)
+            order = np.argsort(band, kind="stable")
+            sorted_band = band[order]
+
+            for flipped in range(radius + 1):
+                for bits in combinations(range(width), flipped):
+                    probes = band ^ np.uint64(sum(1 << bit for bit in bits))
+                    for start in range(0, len(probes), PROBE_CHUNK_SIZE):
+                        left, right = _matching_pairs(sorted_band, order, probes[start:start + PROBE_CHUNK_SIZE])
+                        left += start
+                        keep = left < right
+                        left, right = left[keep], right[keep]
+                        close = hamming_distances(unique_hashes[left], unique_hashes[right]) <= max_distance
+
+                        for i, j in zip(left[close].tolist(), right[close].tolist()):
+                            root_i, root_j = find(i), find(j)
+                            if root_i != root_j:
+                                parent[root_j] = root_i
+
+    roots = np.array([find(i) for i in range(len(unique_hashes))], dtype=np.int64)
+    report_roots = roots[inverse]
+
+    order = np.argsort(report_roots, kind="stable")
+    boundaries = np.flatnonzero(np.diff(report_roots[order])) + 1
+    return [group for group in np.split(order, boundaries) if len(group) > 1]
+
+
+def try_compute_dhash(file_path: str) -> Optional[int]:
+    """Compute a photo's dHash, returning None if it cannot be decoded"""
+    try:
+        return compute_dhash(file_path)
+    except Exception as e:
+        print(f"Could not hash photo {file_path}: {e}")
+        return None
+
+
+# Header-only image probe and metadata stripping
+
+class ImageRejectedError(ValueError):
+    """Raised when an uploaded image is malformed, unsupported, or over the limits"""
+
+
+class ImageProbe(NamedTuple):
+    format: str
+    width: int
+    height: int
+    frames: int
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_METADATA_CHUNKS = {b"eXIf", b"tEXt", b"zTXt", b"iTXt", b"tIME"}
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+JPEG_EXIF_HEADER = b"Exif\x00\x00"
+WEBP_METADATA_CHUNKS = {b"EXIF", b"XMP "}
+WEBP_VP8X_METADATA_FLAGS = 0x08 | 0x04  # EXIF and XMP present
+
+
+def _read_exact(file: BinaryIO, size: int) -> bytes:
+    data = file.read(size)
+    if len(data) != size:
+        raise ImageRejectedError("Image file is truncated or malformed")
+    return data
+
+
+def _probe_png(file: BinaryIO) -> ImageProbe:
+    width = height = None
+    frames = 1
+    while True:
+        header = file.read(8)
+        if len(header) < 8:
+            break
+        length, chunk_type = struct.unpack(">I4s", header)
+        if chunk_type == b"IHDR":
+            width, height = struct.unpack(">II", _read_exact(file, 8))
+            file.seek(length - 8 + 4, 1)
+        elif chunk_type == b"acTL":
+            frames = struct.unpack(">I", _read_exact(file, 4))[0]
+            file.seek(length - 4 + 4, 1)
+        elif chunk_type in (b"IDAT", b"IEND"):
+            break  # acTL must precede the image data
+        else:
+            file.seek(length + 4, 1)
+    if width is None:
+        raise ImageRejectedError("PNG image has no header")
+    return ImageProbe("png", width, height, frames)
+
+
+def _probe_jpeg(file: BinaryIO) -> ImageProbe:
+    while True:
+        byte = file.read(1)
+        if not byte:
+            break
+        if byte != b"\xff":
+            continue
+        marker = file.read(1)
+        while marker == b"\xff":
+            marker = file.read(1)
+        if not marker:
+            break
+        marker = marker[0]
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        if marker in (0xD9, 0xDA):
+            break  # End of image or start of scan before any frame header
+        length = struct.unpack(">H", _read_exact(file, 2))[0]
+        if marker in JPEG_SOF_MARKERS:
+            _, height, width = struct.unpack(">BHH", _read_exact(file, 5))
+            return ImageProbe("jpeg", width, height, 1)
+        file.seek(length - 2, 1)
+    raise ImageRejectedError("JPEG image has no frame header")
+
+
+def _skip_gif_sub_blocks(file: BinaryIO):
+    while True:
+        size = file.read(1)
+        if not size or size[0] == 0:
+            return
+        file.seek(size[0], 1)
+
+
+def _probe_gif(file: BinaryIO) -> ImageProbe:
+    width, height, packed = struct.unpack("<HHB", _read_exact(file, 5))
+    file.seek(2, 1)
+    if packed & 0x80:
+        file.seek(3 * (2 ** ((packed & 0x07) + 1)), 1)
+
+    frames = 0
+    while True:
+        block = file.read(1)
+        if not block or block == b"\x3b":
+            break
+        if block == b"\x2c":
+            frames += 1
+            if frames > MAX_IMAGE_FRAMES:
+                break  # Over the limit already; no need to walk the rest
+            _, _, frame_width, frame_height, local_packed = struct.unpack("<HHHHB", _read_exact(file, 9))
+            width, height = max(width, frame_width), max(height, frame_height)
+            if local_packed & 0x80:
+                file.seek(3 * (2 ** ((local_packed & 0x07) + 1)), 1)
+            file.seek(1, 1)  # LZW minimum code size
+            _skip_gif_sub_blocks(file)
+        elif block == b"\x21":
+            file.seek(1, 1)  # Extension label
+            _skip_gif_sub_blocks(file)
+        else:
+            raise ImageRejectedError("GIF image is malformed")
+    return ImageProbe("gif", width, height, max(frames, 1))
+
+
+def _iter_webp_chunks(file: BinaryIO):
+    """Yield (fourcc, data offset, size) for each RIFF chunk without reading payloads"""
+    file.seek(12)
+    while True:
+        header = file.read(8)
+        if len(header) < 8:
+            return
+        fourcc, size = struct.unpack("<4sI", header)
+        offset = file.tell()
+        yield fourcc, offset, size
+        file.seek(offset + size + (size & 1))
+
+
+def _probe_webp(file: BinaryIO) -> ImageProbe:
+    width = height = None
+    frames = 0
+    for fourcc, offset, size in _iter_webp_chunks(file):
+        if fourcc == b"VP8X":
+            data = _read_exact(file, 10)
+            width = int.from_bytes(data[4:7], "little") + 1
+            height = int.from_bytes(data[7:10], "little") + 1
+        elif fourcc == b"VP8 " and width is None:
+            data = _read_exact(file, 10)
+            if data[3:6] != b"\x9d\x01\x2a":
+                raise ImageRejectedError("WebP image is malformed")
+            width, height = struct.unpack("<HH", data[6:10])
+            width, height = width & 0x3FFF, height & 0x3FFF
+        elif fourcc == b"VP8L" and width is None:
+            data = _read_exact(file, 5)
+            if data[0] != 0x2F:
+                raise ImageRejectedError("WebP image is malformed")
+            bits = int.from_bytes(data[1:5], "little")
+            width, height = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        elif fourcc == b"ANMF":
+            frames += 1
+            if frames > MAX_IMAGE_FRAMES:
+                break
+    if width is None:
+        raise ImageRejectedError("WebP image has no header")
+    return ImageProbe("webp", width, height, max(frames, 1))
+
+
+AVIF_BRANDS = {b"avif", b"avis"}
+HEIC_BRANDS = {b"heic", b"heix", b"heim", b"heis", b"hevc", b"hevx"}
+ISOBMFF_MAX_BOXES = 4096
+
+
+def _iter_isobmff_boxes(file: BinaryIO, start: int, end: int):
+    """Yield (type, payload offset, payload end) for each box in [start, end) without reading payloads"""
+    offset = start
+    for _ in range(ISOBMFF_MAX_BOXES):
+        if offset + 8 > end:
+            return
+        file.seek(offset)
+        size, box_type = struct.unpack(">I4s", _read_exact(file, 8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", _read_exact(file, 8))[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            raise ImageRejectedError("Image file is truncated or malformed")
+        yield box_type, offset + header, offset + size
+        offset += size
+    raise ImageRejectedError("Image has too many boxes")
+
+
+def _probe_isobmff(file: BinaryIO) -> ImageProbe:
+    """AVIF/HEIC: brand from ftyp, dimensions from the largest ispe property"""
+    file.seek(0, os.SEEK_END)
+    end = file.tell()
+    image_format = None
+    width = height = 0
+    for box_type, payload, box_end in _iter_isobmff_boxes(file, 0, end):
+        if box_type == b"ftyp":
+            file.seek(payload)
+            data = _read_exact(file, min(box_end - payload, 256))
+            brands = {data[i:i + 4] for i in range(0, len(data) - 3, 4) if i != 4}  # Skip minor version
+            image_format = "avif" if brands & AVIF_BRANDS else "heic" if brands & HEIC_BRANDS else None
+            if image_format is None:
+                break
+        elif box_type == b"meta":
+            # meta is a full box: version and flags precede its children
+            for child, child_payload, child_end in _iter_isobmff_boxes(file, payload + 4, box_end):
+                if child != b"iprp":
+                    continue
+                for container, container_payload, container_end in _iter_isobmff_boxes(file, child_payload, child_end):
+                    if container != b"ipco":
+                        continue
+                    for prop, prop_payload, prop_end in _iter_isobmff_boxes(file, container_payload, container_end):
+                        if prop == b"ispe":
+                            file.seek(prop_payload + 4)
+                            prop_width, prop_height = struct.unpack(">II", _read_exact(file, 8))
+                            if prop_width * prop_height > width * height:
+                                width, height = prop_width, prop_height
+    if image_format is None:
+        raise ImageRejectedError("Unsupported image format. Allowed formats: JPEG, PNG, GIF, WebP")
+    if not width:
+        raise ImageRejectedError(f"{image_format.upper()} image has no size property")
+    return ImageProbe(image_format, width, height, 1)
+
+
+def probe_image(file: BinaryIO) -> ImageProbe:
+    """
+    Read an image's format, dimensions and frame count without decoding it.
+
+    Only container headers are parsed and payloads are skipped with seek(),
+    so a small file that would decode to an enormous bitmap costs no more to
+    probe than any other. Supports PNG/APNG, JPEG, GIF, WebP, AVIF and HEIC.
+
+    Args:
+        file: Seekable binary file positioned anywhere (rewound first)
+
+    Returns:
+        ImageProbe: Format, width, height and frame count
+
+    Raises:
+        ImageRejectedError: If the format is unsupported or the headers are malformed
+    """
+    file.seek(0)
+    head = file.read(12)
+    file.seek(0)
+
+    try:
+        if head.startswith(PNG_SIGNATURE):
+            file.seek(8)
+            return _probe_png(file)
+        if head.startswith(b"\xff\xd8"):
+            file.seek(2)
+            return _probe_jpeg(file)
+        if head[:6] in (b"GIF87a", b"GIF89a"):
+            file.seek(6)
+            return _probe_gif(file)
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            return _probe_webp(file)
+        if head[4:8] == b"ftyp":
+            return _probe_isobmff(file)
+    except struct.error:
+        raise ImageRejectedError("Image file is truncated or malformed")
+    raise ImageRejectedError("Unsupported image format. Allowed formats: JPEG, PNG, GIF, WebP")
+
+
+def check_image_limits(probe: ImageProbe):
+    """
+    Reject images whose decoded size would be unreasonable.
+
+    Raises:
+        ImageRejectedError: If the image is empty or over the pixel or frame limits
+    """
+    if probe.width <= 0 or probe.height <= 0:
+        raise ImageRejectedError("Image has invalid dimensions")
+    if probe.width * probe.height > MAX_IMAGE_PIXELS:
+        raise ImageRejectedError(
+            f"Image dimensions too large ({probe.width}x{probe.height}). Maximum: {MAX_IMAGE_PIXELS // 1_000_000} megapixels"
+        )
+    if probe.frames > MAX_IMAGE_FRAMES:
+        raise ImageRejectedError(f"Image has too many frames. Maximum: {MAX_IMAGE_FRAMES}")
+
+
+def _copy_bytes(src: BinaryIO, dst: BinaryIO, size: Optional[int] = None):
+    """Copy ``size`` bytes (or the rest of the file) in fixed-size blocks"""
+    while size is None or size > 0:
+        block = src.read(COPY_BLOCK_SIZE if size is None else min(COPY_BLOCK_SIZE, size))
+        if not block:
+            return
+        dst.write(block)
+        if size is not None:
+            size -= len(block)
+
+
+def _exif_orientation(payload: bytes) -> Optional[int]:
+    """Extract the Orientation tag from an APP1 Exif payload"""
+    tiff = payload[len(JPEG_EXIF_HEADER):]
+    if len(tiff) < 8 or tiff[:2] not in (b"II", b"MM"):
+        return None
+    order = "<" if tiff[:2] == b"II" else ">"
+    try:
+        ifd_offset = struct.unpack(order + "I", tiff[4:8])[0]
+        count = struct.unpack(order + "H", tiff[ifd_offset:ifd_offset + 2])[0]
+        for index in range(count):
+            entry = tiff[ifd_offset + 2 + index * 12:ifd_offset + 14 + index * 12]
+            tag, field_type = struct.unpack(order + "HH", entry[:4])
+            if tag == 0x0112 and field_type == 3:
+                return struct.unpack(order + "H", entry[8:10])[0]
+    except struct.error:
+        return None
+    return None
+
+
+def _minimal_exif_segment(orientation: int) -> bytes:
+    """An APP1 segment carrying only the Orientation tag"""
+    tiff = b"MM\x00\x2a" + struct.pack(">I", 8) + struct.pack(">H", 1)
+    tiff += struct.pack(">HHIHH", 0x0112, 3, 1, orientation, 0) + struct.pack(">I", 0)
+    payload = JPEG_EXIF_HEADER + tiff
+    return b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+
+
+def _strip_jpeg(src: BinaryIO, dst: BinaryIO):
+    dst.write(_read_exact(src, 2))  # SOI
+    while True:
+        marker = src.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            dst.write(marker)
+            break
+        if marker[1] in JPEG_STANDALONE_MARKERS:
+            dst.write(marker)
+            continue
+        length_bytes = _read_exact(src, 2)
+        payload = _read_exact(src, struct.unpack(">H", length_bytes)[0] - 2)
+
+        if marker[1] == 0xE1:
+            # Exif/XMP: drop it, but keep the orientation so photos still display upright
+            if payload.startswith(JPEG_EXIF_HEADER):
+                orientation = _exif_orientation(payload)
+                if orientation and orientation != 1:
+                    dst.write(_minimal_exif_segment(orientation))
+            continue
+        if marker[1] in (0xED, 0xFE):
+            continue  # Photoshop IRB (IPTC) and comments
+
+        dst.write(marker + length_bytes + payload)
+        if marker[1] == 0xDA:
+            break  # Entropy-coded data follows; copy the rest verbatim
+    _copy_bytes(src, dst)
+
+
+def _strip_png(src: BinaryIO, dst: BinaryIO):
+    dst.write(_read_exact(src, 8))
+    while True:
+        header = src.read(8)
+        if len(header) < 8:
+            dst.write(header)
+            return
+        length, chunk_type = struct.unpack(">I4s", header)
+        if chunk_type in PNG_METADATA_CHUNKS:
+            src.seek(length + 4, 1)
+            continue
+        dst.write(header)
+        _copy_bytes(src, dst, length + 4)
+        if chunk_type == b"IEND":
+            return
+
+
+def _strip_webp(src: BinaryIO, dst: BinaryIO):
+    chunks = list(_iter_webp_chunks(src))
+    kept = [chunk for chunk in chunks if chunk[0] not in WEBP_METADATA_CHUNKS]
+    if len(kept) == len(chunks):
+        src.seek(0)
+        _copy_bytes(src, dst)
+        return
+
+    riff_size = 4 + sum(8 + size + (size & 1) for _, _, size in kept)
+    dst.write(b"RIFF" + struct.pack("<I", riff_size) + b"WEBP")
+    for fourcc, offset, size in kept:
+        src.seek(offset)
+        dst.write(struct.pack("<4sI", fourcc, size))
+        if fourcc == b"VP8X":
+            flags = _read_exact(src, 1)[0] & ~WEBP_VP8X_METADATA_FLAGS
+            dst.write(bytes([flags]))
+            _copy_bytes(src, dst, size - 1 + (size & 1))
+        else:
+            _copy_bytes(src, dst, size + (size & 1))
+
+
+def sanitize_image(src: BinaryIO, destination_path: str, passthrough_formats: Tuple[str, ...] = ()) -> ImageProbe:
+    """
+    Validate an uploaded image and store it at ``destination_path`` without metadata.
+
+    The probe and limit checks run before the destination is created. The copy
+    is a single streaming pass that drops EXIF/XMP/IPTC and text chunks
+    (keeping the JPEG orientation), so stored photos are smaller and do not
+    leak GPS coordinates or device details. AVIF and HEIC are only accepted
+    when listed in ``passthrough_formats`` and are stored as uploaded, with
+    their metadata.
+
+    Args:
+        src: Seekable binary file holding the upload
+        destination_path: Where to write the sanitized image
+        passthrough_formats: Extra formats ("avif", "heic") to accept and copy unchanged
+
+    Returns:
+        ImageProbe: Format, dimensions and frame count of the image
+
+    Raises:
+        ImageRejectedError: If the image is unsupported, malformed or over the limits
+    """
+    probe = probe_image(src)
+    if probe.format in ("avif", "heic") and probe.format not in passthrough_formats:
+        raise ImageRejectedError("Unsupported image format. Allowed formats: JPEG, PNG, GIF, WebP")
+    check_image_limits(probe)
+
+    src.seek(0)
+    try:
+        with open(destination_path, "wb") as dst:
+            if probe.format == "jpeg":
+                _strip_jpeg(src, dst)
+            elif probe.format == "png":
+                _strip_png(src, dst)
+            elif probe.format == "webp":
+                _strip_webp(src, dst)
+            else:
+                _copy_bytes(src, dst)
+    except BaseException:
+        if os.path.exists(destination_path):
+            os.remove(destination_path)
+        raise
+    return probe
@@ -0,0 +1,370 @@
+"""
+WebSocket hub for live schedule and announcement displays.
+
+Hallway displays and dashboards subscribe to topics instead of polling
+/schedules/live and /announcements/live:
+
+    room:<room number>     schedules in one room
+    building:<prefix>      schedules in rooms whose number starts with prefix
+    announcements          every announcement
+
+Committed ORM changes to schedules and recurring schedule rules (creation,
+deletion, and changes to status, room or times, plus recurrence and
+exception dates for rules) and announcements are captured by session events
+and pushed to subscribers as diffs. Rule events reach the rule's room and
+building topics; displays re-expand the rule's occurrences from them. Each
+message is encoded once and placed on every subscriber's bounded queue. A
+client that falls LIVE_QUEUE_SIZE messages behind has its backlog dropped
+and receives one {"type": "resync"} message telling it to refetch, so a slow
+client never holds memory or slows down the others. Each worker process
+accepts at most MAX_LIVE_CONNECTIONS sockets.
+
+Events are also written to the live_events table in the committing
+transaction. The worker that committed them pushes them at once; every other
+worker's LiveEventRelay polls the table and pushes them to its own
+subscribers, so a display sees changes made through any worker. Rows older
+than LIVE_EVENT_RETENTION are swept.
+"""
+import asyncio
+import json
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import delete, event, insert, inspect
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Announcement, LiveEvent, Schedule, ScheduleRule
+
+MAX_LIVE_CONNECTIONS = 5000
+MAX_TOPICS_PER_CONNECTION = 20
+LIVE_QUEUE_SIZE = 64
+
+# Identifies this worker's rows in live_events
+PROCESS_ORIGIN = uuid.uuid4().hex
+# Rows can commit out of ID order, so the relay re-reads this far back
+LIVE_RELAY_LOOKBACK = timedelta(minutes=1)
+LIVE_EVENT_RETENTION = timedelta(hours=1)
+
+ANNOUNCEMENTS_TOPIC = "announcements"
+ROOM_TOPIC_PREFIX = "room:"
+BUILDING_TOPIC_PREFIX = "building:"
+
+# Schedule columns whose changes are pushed to displays
+SCHEDULE_DIFF_FIELDS = ("status", "room_number", "start_time", "end_time", "class_id")
+SCHEDULE_RULE_DIFF_FIELDS = SCHEDULE_DIFF_FIELDS + ("rrule", "exdates")
+
+
+def parse_topic(topic: str) -> Optional[str]:
+    """Normalized topic, or None if it is not one the hub serves"""
+    topic = topic.strip()
+    if topic == ANNOUNCEMENTS_TOPIC:
+        return topic
+    for prefix in (ROOM_TOPIC_PREFIX, BUILDING_TOPIC_PREFIX):
+        if topic.startswith(prefix) and len(topic) > len(prefix):
+            return topic
+    return None
+
+
+class LiveConnection:
+    """One subscriber: its topics and a bounded queue of encoded messages"""
+
+    def __init__(self):
+        self.topics: Set[str] = set()
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+        self.resyncs = 0
+
+    def offer(self, message: str):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Too far behind to catch up by diffs; drop the backlog and ask for a refetch
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(json.dumps({"type": "resync"}))
+            self.resyncs += 1
+
+
+class LiveHub:
+    """Per-process registry of live subscribers and their topics"""
+
+    def __init__(self, max_connections: int = MAX_LIVE_CONNECTIONS):
+        self.max_connections = max_connections
+        self._connections: Set[LiveConnection] = set()
+        self._subscribers: Dict[str, Set[LiveConnection]] = defaultdict(set)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """Deliver published events on this loop; called once at startup"""
+        self._loop = loop
+
+    @property
+    def connection_count(self) -> int:
+        return len(self._connections)
+
+    def connect(self) -> Optional[LiveConnection]:
+        """Register a connection, or None if the process is at its budget"""
+        if len(self._connections) >= self.max_connections:
+            return None
+        connection = LiveConnection()
+        self._connections.add(connection)
+        return connection
+
+    def disconnect(self, connection: LiveConnection):
+        self._connections.discard(connection)
+        for topic in connection.topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(connection)
+                if not subscribers:
+                    del self._subscribers[topic]
+        connection.topics.clear()
+
+    def subscribe(self, connection: LiveConnection, topics: List[str]) -> List[str]:
+        """Add topics; raises ValueError for unknown topics or too many"""
+        parsed = [parse_topic(topic) for topic in topics]
+        invalid = [topic for topic, normalized in zip(topics, parsed) if normalized is None]
+        if invalid:
+            raise ValueError(f"Unknown topic(s): {', '.join(invalid)}")
+        if len(connection.topics | set(parsed)) > MAX_TOPICS_PER_CONNECTION:
+            raise ValueError(f"At most {MAX_TOPICS_PER_CONNECTION} topics per connection")
+        for topic in parsed:
+            connection.topics.add(topic)
+            self._subscribers[topic].add(connection)
+        return sorted(connection.topics)
+
+    def unsubscribe(self, connection: LiveConnection, topics: List[str]) -> List[str]:
+        for topic in topics:
+            topic = topic.strip()
+            connection.topics.discard(topic)
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(connection)
+                if not subscribers:
+                    del self._subscribers[topic]
+        return sorted(connection.topics)
+
+    def _topics_for(self, rooms: Set[str]) -> Set[str]:
+        topics = {ROOM_TOPIC_PREFIX + room for room in rooms}
+        for topic in self._subscribers:
+            if topic.startswith(BUILDING_TOPIC_PREFIX):
+                prefix = topic[len(BUILDING_TOPIC_PREFIX):]
+                if any(room.startswith(prefix) for room in rooms):
+                    topics.add(topic)
+        return topics
+
+    def dispatch(self, events: List[dict]):
+        """Fan events out to subscribers; must run on the hub's loop"""
+        for live_event in events:
+            rooms = live_event.pop("_rooms", None)
+            topics = {ANNOUNCEMENTS_TOPIC} if rooms is None else self._topics_for(rooms)
+            targets = set()
+            for topic in topics:
+                targets |= self._subscribers.get(topic, set())
+            if targets:
+                message = json.dumps(live_event, default=_encode)
+                for connection in targets:
+                    connection.offer(message)
+
+    def publish(self, events: List[dict]):
+        """Hand events to the hub's loop; safe to call from any thread"""
+        if self._loop is None or self._loop.is_closed() or not events:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self.dispatch(events)
+        else:
+            self._loop.call_soon_threadsafe(self.dispatch, events)
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+live_hub = LiveHub()
+
+
+def _schedule_payload(schedule: Schedule) -> dict:
+    return {
+        "id": schedule.id,
+        "class_id": schedule.class_id,
+        "room_number": schedule.room_number,
+        "start_time": schedule.start_time,
+        "end_time": schedule.end_time,
+        "status": schedule.status,
+    }
+
+
+def _exdates(value: str) -> List[str]:
+    return [item for item in (value or "").split(",") if item]
+
+
+def _schedule_rule_payload(rule: ScheduleRule) -> dict:
+    return {
+        "id": rule.id,
+        "class_id": rule.class_id,
+        "room_number": rule.room_number,
+        "start_time": rule.start_time,
+        "end_time": rule.end_time,
+        "rrule": rule.rrule,
+        "exdates": _exdates(rule.exdates),
+        "status": rule.status,
+    }
+
+
+def _announcement_payload(announcement: Announcement) -> dict:
+    return {
+        "id": announcement.id,
+        "title": announcement.title,
+        "content": announcement.content,
+        "is_urgent": announcement.is_urgent,
+        "date_posted": announcement.date_posted,
+    }
+
+
+def _schedule_changes(schedule, fields=SCHEDULE_DIFF_FIELDS):
+    """Changed diff fields of a schedule or rule and the room it was in before"""
+    state = inspect(schedule)
+    changes = {}
+    previous_room = None
+    for field in fields:
+        history = state.attrs[field].history
+        if history.has_changes():
+            changes[field] = getattr(schedule, field)
+            if field == "room_number" and history.deleted:
+                previous_room = history.deleted[0]
+    if "exdates" in changes:
+        changes["exdates"] = _exdates(changes["exdates"])
+    return changes, previous_room
+
+
+@event.listens_for(Session, "after_flush")
+def _capture_live_events(session, flush_context):
+    # The session still shows pre-flush state here, but new rows have their IDs
+    events = []
+    for instance in session.new:
+        if isinstance(instance, Schedule):
+            events.append({"type": "schedule", "action": "created", "schedule": _schedule_payload(instance), "_rooms": {instance.room_number}})
+        elif isinstance(instance, ScheduleRule):
+            events.append({"type": "schedule_rule", "action": "created", "rule": _schedule_rule_payload(instance), "_rooms": {instance.room_number}})
+        elif isinstance(instance, Announcement):
+            events.append({"type": "announcement", "action": "created", "announcement": _announcement_payload(instance)})
+    for instance in session.dirty:
+        if isinstance(instance, Schedule) and instance not in session.deleted:
+            changes, previous_room = _schedule_changes(instance)
+            if changes:
+                rooms = {instance.room_number} | ({previous_room} if previous_room else set())
+                events.append({"type": "schedule", "action": "updated", "id": instance.id, "changes": changes, "_rooms": rooms})
+        elif isinstance(instance, ScheduleRule) and instance not in session.deleted:
+            changes, previous_room = _schedule_changes(instance, SCHEDULE_RULE_DIFF_FIELDS)
+            if changes:
+                rooms = {instance.room_number} | ({previous_room} if previous_room else set())
+                # The full rule goes along: a display in the new room has not seen it before
+                events.append({"type": "schedule_rule", "action": "updated", "id": instance.id, "changes": changes, "rule": _schedule_rule_payload(instance), "_rooms": rooms})
+        elif isinstance(instance, Announcement) and session.is_modified(instance):
+            events.append({"type": "announcement", "action": "updated", "announcement": _announcement_payload(instance)})
+    for instance in session.deleted:
+        if isinstance(instance, Schedule):
+            events.append({"type": "schedule", "action": "deleted", "id": instance.id, "_rooms": {instance.room_number}})
+        elif isinstance(instance, ScheduleRule):
+            events.append({"type": "schedule_rule", "action": "deleted", "id": instance.id, "_rooms": {instance.room_number}})
+        elif isinstance(instance, Announcement):
+            events.append({"type": "announcement", "action": "deleted", "id": instance.id})
+    if not events:
+        return
+
+    # Written in the same transaction, so other workers relay exactly what commits
+    session.connection().execute(insert(LiveEvent), [
+        {"origin": PROCESS_ORIGIN, "payload": _encode_event(live_event), "created_at": datetime.utcnow()}
+        for live_event in events
+    ])
+    session.info.setdefault("live_events", []).extend(events)
+
+
+def _encode_event(live_event: dict) -> str:
+    rooms = live_event.get("_rooms")
+    stored = live_event if rooms is None else {**live_event, "_rooms": sorted(rooms)}
+    return json.dumps(stored, default=_encode)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_live_events(session):
+    live_hub.publish(session.info.pop("live_events", []))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_live_events(session):
+    session.info.pop("live_events", None)
+
+
+class LiveEventRelay:
+    """Pushes events committed by other worker processes to this worker's subscribers"""
+
+    def __init__(self):
+        self._seen: Dict[int, datetime] = {}
+        self._started = False
+
+    def poll(self) -> int:
+        """Publish other workers' live events not seen before; returns how many"""
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(LiveEvent.id, LiveEvent.origin, LiveEvent.payload, LiveEvent.created_at)
+                .filter(LiveEvent.created_at > now - LIVE_RELAY_LOOKBACK)
+                .order_by(LiveEvent.id)
+                .all()
+            )
+        finally:
+            db.close()
+
+        new_rows = [row for row in rows if row.id not in self._seen]
+        for row in new_rows:
+            self._seen[row.id] = row.created_at
+        self._seen = {event_id: created_at for event_id, created_at in self._seen.items() if created_at > now - 2 * LIVE_RELAY_LOOKBACK}
+        if not self._started:
+            # Rows from before startup were pushed by whoever was running then
+            self._started = True
+            return 0
+        relayed = [json.loads(row.payload) for row in new_rows if row.origin != PROCESS_ORIGIN]
+        live_hub.publish(relayed)
+        return len(relayed)
+
+
+def delete_expired_live_events(db: Session, created_before: datetime) -> int:
+    """
+    Delete live events recorded before a cutoff.
+
+    Args:
+        db: Database session
+        created_before: Remove events older than this time
+
+    Returns:
+        int: Number of events removed
+    """
+    try:
+        removed = db.execute(delete(LiveEvent).where(LiveEvent.created_at < created_before)).rowcount
+        db.commit()
+        return removed
+    except Exception:
+        db.rollback()
+        raise
+
+
+def sweep_live_events() -> int:
+    """Delete live events past LIVE_EVENT_RETENTION; returns how many were removed"""
+    db = SessionLocal()
+    try:
+        return delete_expired_live_events(db, datetime.utcnow() - LIVE_EVENT_RETENTION)
+    finally:
+        db.close()
+
+
+live_relay = LiveEventRelay()
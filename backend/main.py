@@ -1,21 +1,50 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, Request, WebSocket, WebSocketDisconnect
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session
-from pydantic import BaseModel, validator
-from typing import Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from pydantic import BaseModel, ValidationError, validator
+from starlette.requests import ClientDisconnect
+from typing import Iterator, List, Optional, Set, Tuple
 import enum
 from datetime import datetime, timedelta
+import asyncio
+import base64
+import binascii
+import csv
+import io
+import json
 import os
+import time
+import zipfile
+from urllib.parse import quote
 import uuid
 import aiofiles
+import numpy as np
 
 from database import engine, SessionLocal, get_db
-from models import Base, User, Class, UserRole, ClassCreate, ClassResponse, Assignment, AssignmentCreate, AssignmentResponse, Schedule, ScheduleCreate, ScheduleResponse, Announcement, AnnouncementCreate, AnnouncementResponse, Submission, ClassroomReport, ClassroomReportCreate, ClassroomReportResponse, Enrollment
-from schemas import ClassExport, SubmissionCreate, Submission as SubmissionSchema, SubmissionResponse
-from security import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, verify_password, get_password_hash, create_access_token, verify_token
-from crud import create_class, get_class, get_classes, update_class, delete_class, delete_user, count_total_users, count_total_classes, get_all_users, get_all_classes, create_assignment, create_submission, get_assignments_for_student, get_assignments, get_assignments_by_teacher, create_schedule, get_schedules, get_schedules_live, get_schedules_live_enriched, get_schedule, update_schedule, delete_schedule, create_announcement, get_announcements, get_announcements_live, get_announcement, update_announcement, delete_announcement, create_classroom_report, get_classroom_reports, get_classroom_reports_by_class, get_classroom_reports_by_reporter, get_classroom_report, delete_classroom_report, change_user_password, update_user_profile, update_user_profile_picture, get_classes_by_teacher
+from models import Base, User, Class, UserRole, ClassCreate, ClassResponse, ClassEnrollRequest, Assignment, AssignmentCreate, AssignmentResponse, Schedule, ScheduleCreate, ScheduleResponse, ScheduleRuleCreate, ScheduleRuleResponse, TimetableJobCreate, Announcement, AnnouncementCreate, AnnouncementResponse, Submission, ClassroomReport, ClassroomReportCreate, ClassroomReportResponse, Enrollment, UploadSessionCreate, UploadSessionResponse
+from schemas import ClassExport, SubmissionCreate, Submission as SubmissionSchema, SubmissionResponse, BulkGradeRequest
+from schedule_index import to_naive_utc
+from calendar_feed import CalendarEvent, render_calendar, feed_cache
+from recurrence import format_rrule
+from room_analytics import get_room_utilization, week_start, WEEK
+from counters import reconcile_counters
+from idempotency import IdempotencyMiddleware, sweep_idempotency_keys
+from tombstones import SYNC_TOMBSTONE_RETENTION, sweep_tombstones
+from dashboard import load_dashboard, section_etag, select_sections
+from live_hub import live_hub, live_relay, sweep_live_events, ANNOUNCEMENTS_TOPIC, LiveConnection
+from notifications import dispatch_notifications, sweep_notifications, urgent_relay
+from batching import MAX_BATCH_REQUESTS, SHARED_USER_SCOPE_KEY, run_batch, validate_batch_path
+from class_codes import class_codes
+from timetable import Meeting, TimetableProblem, solve_timetable, timetable_jobs
+from imaging import try_compute_dhash, find_near_duplicate_groups, MAX_DUPLICATE_DISTANCE, sanitize_image, ImageRejectedError
+from security import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, verify_password, get_password_hash, create_access_token, verify_token, create_calendar_feed_token, verify_calendar_feed_token
+from crud import create_class, get_class, get_classes, update_class, delete_class, delete_user, create_users_bulk, count_total_users, count_total_classes, get_all_users, get_all_classes, create_assignment, create_submission, bulk_grade_submissions, get_assignments_for_student, get_assignments, get_assignments_by_teacher, create_schedule, get_schedules, get_schedules_live, get_schedules_live_enriched, get_schedule, update_schedule, delete_schedule, create_announcement, get_announcements, get_announcements_live, get_announcement, update_announcement, delete_announcement, create_classroom_report, get_classroom_reports, get_classroom_reports_by_class, get_classroom_reports_by_reporter, get_classroom_report, delete_classroom_report, change_user_password, update_user_profile, update_user_profile_picture, get_classes_by_teacher, create_upload_session, get_upload_session, advance_upload_session, delete_upload_session, delete_expired_upload_sessions, get_upload_session_ids, get_referenced_upload_urls, iter_upload_references, get_report_photo_hashes, get_classroom_reports_with_details, get_reports_missing_photo_hash, get_classroom_reports_by_class_after, get_room_availability, get_next_free_slots, get_student_schedule_enriched, get_user_calendar, get_user_calendar_removals, get_sync_changes, get_grades_for_student, create_schedule_rule, get_schedule_rules, get_schedule_rule, update_schedule_rule, delete_schedule_rule, get_calendar_feed_data, get_enrolled_class_ids, get_taught_class_ids, import_enrollments, get_class_id_by_code, self_enroll, leave_class, build_enriched_schedule, parse_exdates, get_room_numbers, get_room_usage_data, create_schedules_batch
 
 
 # Security scheme
@@ -29,6 +58,72 @@ if not os.path.exists(UPLOAD_DIR):
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 
+# Profile photos in these formats are kept as uploaded; they cannot be stripped of metadata here
+PROFILE_PHOTO_PASSTHROUGH_FORMATS = ("avif", "heic")
+
+# Resumable upload configuration
+# Partial uploads live outside UPLOAD_DIR so they are never served by the static mount
+UPLOAD_PARTIAL_DIR = "uploads_partial"
+if not os.path.exists(UPLOAD_PARTIAL_DIR):
+    os.makedirs(UPLOAD_PARTIAL_DIR)
+
+UPLOAD_SESSION_TTL = timedelta(hours=24)  # Sliding expiry, renewed on every chunk
+UPLOAD_SWEEP_INTERVAL_SECONDS = 15 * 60
+
+# Orphaned upload garbage collection
+# Files younger than the grace period are never deleted, so a photo saved just
+# before its report/profile row is committed is not mistaken for an orphan.
+UPLOAD_ORPHAN_GRACE_PERIOD = timedelta(hours=6)
+UPLOAD_GC_INTERVAL_SECONDS = 60 * 60
+UPLOAD_GC_BATCH_SIZE = 500
+
+# Expired Idempotency-Key records are pruned this often
+IDEMPOTENCY_SWEEP_INTERVAL_SECONDS = 60 * 60
+
+# Delete tombstones past their retention this often
+TOMBSTONE_SWEEP_INTERVAL_SECONDS = 6 * 60 * 60
+
+# Urgent announcement outbox: email dispatch and live relay intervals
+NOTIFICATION_DISPATCH_INTERVAL_SECONDS = 5
+URGENT_RELAY_INTERVAL_SECONDS = 2
+
+# Delete notification outbox rows past their retention this often
+NOTIFICATION_SWEEP_INTERVAL_SECONDS = 6 * 60 * 60
+
+# Live display events committed by other workers: relay and cleanup intervals
+LIVE_RELAY_INTERVAL_SECONDS = 1
+LIVE_EVENT_SWEEP_INTERVAL_SECONDS = 10 * 60
+
+# Server-sent event streams send a comment this often to keep proxies from timing out
+SSE_KEEPALIVE_SECONDS = 15
+
+# Photo archive streaming
+PHOTO_ARCHIVE_PAGE_SIZE = 200
+PHOTO_ARCHIVE_READ_SIZE = 64 * 1024
+
+# Live schedule display window
+LIVE_SCHEDULE_DEFAULT_WINDOW = timedelta(days=1)
+LIVE_SCHEDULE_MAX_WINDOW = timedelta(days=31)
+
+# Per-user calendar window; the returned sync time trails the request by
+# SINCE_OVERLAP so changes still committing are picked up by the next fetch
+MY_CALENDAR_DEFAULT_WINDOW = timedelta(days=7)
+MY_CALENDAR_SINCE_OVERLAP = timedelta(seconds=30)
+
+# Delta-sync cursors trail the request by the same overlap
+MY_SYNC_CURSOR_OVERLAP = timedelta(seconds=30)
+
+# Calendar feeds include single schedules from this far back
+CALENDAR_FEED_HISTORY = timedelta(days=90)
+CALENDAR_FEED_KINDS = ("student", "teacher", "room")
+
+# Room utilization analytics
+ROOM_ANALYTICS_DEFAULT_WEEKS = 12
+ROOM_ANALYTICS_MAX_WEEKS = 53
+
+# Bulk user provisioning
+MAX_BULK_USERS = 10000
+
 # Pydantic models for request/response
 class UserRoleEnum(str, enum.Enum):
     ADMIN = "admin"
@@ -52,6 +147,54 @@ class UserCreate(BaseModel):
             raise ValueError('Password must be at least 6 characters long')
         return v
 
+class BulkUserRow(BaseModel):
+    # Validated per row by create_users_bulk, so one bad row does not reject the batch
+    username: str = ""
+    password: str = ""
+    role: str = ""
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+
+class BulkUserCreate(BaseModel):
+    users: List[BulkUserRow]
+    
+    @validator('users')
+    def validate_users(cls, v):
+        if not v:
+            raise ValueError('At least one user is required')
+        if len(v) > MAX_BULK_USERS:
+            raise ValueError(f'At most {MAX_BULK_USERS} users can be created at once')
+        return v
+
+class BatchSubRequest(BaseModel):
+    id: Optional[str] = None
+    method: str = "GET"
+    path: str
+    
+    @validator('method')
+    def validate_method(cls, v):
+        if v.upper() != "GET":
+            raise ValueError('Only GET requests can be batched')
+        return "GET"
+    
+    @validator('path')
+    def validate_path(cls, v):
+        error = validate_batch_path(v)
+        if error:
+            raise ValueError(error)
+        return v
+
+class BatchRequest(BaseModel):
+    requests: List[BatchSubRequest]
+    
+    @validator('requests')
+    def validate_requests(cls, v):
+        if not v:
+            raise ValueError('At least one request is required')
+        if len(v) > MAX_BATCH_REQUESTS:
+            raise ValueError(f'At most {MAX_BATCH_REQUESTS} requests can be batched at once')
+        return v
+
 class UserUpdate(BaseModel):
     username: Optional[str] = None
     password: Optional[str] = None
@@ -179,9 +322,28 @@ async def lifespan(app: FastAPI):
     finally:
         db.close()
     
+    # Deliver committed schedule and announcement changes to live subscribers
+    live_hub.bind(asyncio.get_running_loop())
+    
+    # Start background maintenance
+    background_tasks = [
+        asyncio.create_task(run_periodically(sweep_upload_sessions, UPLOAD_SWEEP_INTERVAL_SECONDS, "upload session sweep")),
+        asyncio.create_task(run_periodically(sweep_orphaned_uploads, UPLOAD_GC_INTERVAL_SECONDS, "orphaned upload sweep")),
+        asyncio.create_task(run_periodically(sweep_idempotency_keys, IDEMPOTENCY_SWEEP_INTERVAL_SECONDS, "idempotency key sweep")),
+        asyncio.create_task(run_periodically(sweep_tombstones, TOMBSTONE_SWEEP_INTERVAL_SECONDS, "sync tombstone sweep")),
+        asyncio.create_task(run_periodically(dispatch_notifications, NOTIFICATION_DISPATCH_INTERVAL_SECONDS, "notification dispatch")),
+        asyncio.create_task(run_periodically(urgent_relay.poll, URGENT_RELAY_INTERVAL_SECONDS, "urgent announcement relay")),
+        asyncio.create_task(run_periodically(sweep_notifications, NOTIFICATION_SWEEP_INTERVAL_SECONDS, "notification sweep")),
+        asyncio.create_task(run_periodically(live_relay.poll, LIVE_RELAY_INTERVAL_SECONDS, "live event relay")),
+        asyncio.create_task(run_periodically(sweep_live_events, LIVE_EVENT_SWEEP_INTERVAL_SECONDS, "live event sweep")),
+    ]
+    
     yield
-    # Shutdown: Clean up if needed
-    pass
+    # Shutdown: Stop background maintenance and any timetable searches
+    for task in background_tasks:
+        task.cancel()
+    for job in timetable_jobs.running():
+        job.cancelled.set()
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -191,6 +353,9 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Replay stored responses for retried writes carrying an Idempotency-Key
+app.add_middleware(IdempotencyMiddleware)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -234,8 +399,14 @@ def authenticate_user(db: Session, username: str, password: str) -> Optional[Use
     return user
 
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)) -> User:
+def get_current_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)) -> User:
     """Get the current authenticated user from JWT token"""
+    # A plain def runs in the threadpool, so waiting for a pool connection never blocks the event loop
+    # Sub-requests of a /batch call reuse the user the batch authenticated
+    batch_user = request.scope.get(SHARED_USER_SCOPE_KEY)
+    if batch_user is not None:
+        return batch_user
+    
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -611,6 +782,154 @@ async def delete_existing_class(
             detail=f"Failed to delete class: {str(e)}"
         )
 
+# Enrollment endpoints (Admin only)
+
+ENROLLMENT_CSV_HEADERS = {("student_username", "class_code"), ("username", "code"), ("student", "class")}
+
+
+def iter_enrollment_csv(file) -> Iterator[tuple]:
+    """(line number, student username, class code) for each data row of an uploaded CSV"""
+    reader = csv.reader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+    for row in reader:
+        if reader.line_num == 1 and tuple(cell.strip().lower() for cell in row[:2]) in ENROLLMENT_CSV_HEADERS:
+            continue
+        if not any(cell.strip() for cell in row):
+            continue
+        yield reader.line_num, row[0] if row else "", row[1] if len(row) > 1 else ""
+
+
+@app.post("/admin/enrollments/import")
+async def import_enrollments_endpoint(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Enroll students in bulk from a CSV file (Admin only)
+    
+    - **file**: CSV with one "student username, class code" pair per row; a
+      student_username,class_code header row is optional
+    
+    Class capacity is respected: a full class puts the remaining students on
+    its waitlist, in file order. Rows that are already enrolled, already
+    waitlisted or repeated are skipped. Rows with an unknown student or class,
+    or a user who is not a student, are reported by line and do not stop the import.
+    
+    Requires authentication and ADMIN role.
+    """
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to import enrollments"
+        )
+    
+    try:
+        return await asyncio.to_thread(import_enrollments, db, iter_enrollment_csv(file.file))
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="CSV file must be UTF-8 encoded"
+        )
+    except csv.Error as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid CSV file: {str(e)}"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to import enrollments: {str(e)}"
+        )
+
+# Class self-enrollment (Students)
+
+@app.post("/classes/enroll")
+async def self_enroll_endpoint(
+    request: ClassEnrollRequest,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Join a class with its class code (Student only)
+    
+    - **code**: The class code (case-insensitive)
+    
+    Returns 201 with status "enrolled", 200 with status "already_enrolled", or,
+    when the class is at capacity, 202 with status "waitlisted" and the
+    student's waitlist position. Waitlisted students are enrolled automatically
+    as seats free up.
+    
+    Requires authentication and STUDENT role.
+    """
+    if current_user.role != UserRole.STUDENT:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only students can enroll in classes"
+        )
+    
+    class_id = class_codes.lookup(request.code, lambda: get_class_id_by_code(db, request.code), time.monotonic())
+    if class_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No class with this code"
+        )
+    
+    try:
+        result = self_enroll(db, class_id, current_user.id)
+    except IntegrityError:
+        # The class was deleted after its code was cached
+        class_codes.clear()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No class with this code"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to enroll: {str(e)}"
+        )
+    
+    response.status_code = {
+        "enrolled": status.HTTP_201_CREATED,
+        "waitlisted": status.HTTP_202_ACCEPTED
+    }.get(result["status"], status.HTTP_200_OK)
+    return result
+
+
+@app.delete("/classes/{class_id}/enrollment")
+async def leave_class_endpoint(
+    class_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Leave a class, or its waitlist (Student only)
+    
+    A freed seat goes to the first student on the waitlist.
+    
+    Requires authentication and STUDENT role.
+    """
+    if current_user.role != UserRole.STUDENT:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only students can leave classes"
+        )
+    
+    try:
+        result = leave_class(db, class_id, current_user.id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to leave class: {str(e)}"
+        )
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Not enrolled in or waitlisted for this class"
+        )
+    return {"message": f"Left the class {result['left']}", "left": result["left"]}
+
 # Assignment endpoints (Teacher and Admin only)
 
 @app.get("/assignments/", response_model=list[AssignmentResponse])
@@ -836,26 +1155,17 @@ async def create_new_submission(
         )
     
     try:
-        print(f"API: Creating submission for user {current_user.id} with data: {submission_data}")
-        
         # Always use the authenticated user's ID, ignoring any student_id from the frontend
-        new_submission = create_submission(db, submission_in=submission_data, student_id=current_user.id)
-        print(f"API: Successfully created submission {new_submission.id}")
-        return new_submission
+        return create_submission(db, submission_in=submission_data, student_id=current_user.id)
     except HTTPException:
         # Let HTTPException (like 409 Conflict) pass through unchanged
         raise
     except ValueError as e:
-        print(f"API: ValueError in submission creation: {e}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
     except Exception as e:
-        print(f"API: Unexpected error in submission creation: {e}")
-        print(f"API: Error type: {type(e).__name__}")
-        import traceback
-        traceback.print_exc()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="An unexpected error occurred while creating the submission. Please try again."
@@ -1016,6 +1326,44 @@ async def get_assignment_submissions(
             detail=f"Failed to get assignment submissions: {str(e)}"
         )
 
+@app.patch("/submissions/grades")
+async def bulk_grade_submissions_endpoint(
+    request: BulkGradeRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Grade many submissions at once (Teacher and Admin only)
+    
+    - **grades**: List of submission_id, grade (0-100) and expected_version (up to 500)
+    
+    Each grade is applied only if the submission is still at expected_version.
+    Items are independent; the response lists one result per item with status
+    "updated", "conflict" (with the current version), "not_found" or "forbidden".
+    Teachers can only grade submissions to assignments they created.
+    
+    Requires authentication and TEACHER or ADMIN role.
+    """
+    if current_user.role not in [UserRole.TEACHER, UserRole.ADMIN]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to grade submissions"
+        )
+    
+    try:
+        teacher_id = current_user.id if current_user.role == UserRole.TEACHER else None
+        results = bulk_grade_submissions(db, request.grades, teacher_id=teacher_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to update grades: {str(e)}"
+        )
+    
+    return {
+        "updated": sum(1 for result in results if result["status"] == "updated"),
+        "results": results
+    }
+
 @app.patch("/submissions/{submission_id}/grade")
 async def update_submission_grade(
     submission_id: int,
@@ -1028,6 +1376,7 @@ async def update_submission_grade(
     
     - **submission_id**: ID of the submission to grade
     - **grade**: Grade value (float between 0 and 100)
+    - **expected_version**: Version the grader last saw (optional); a mismatch returns 409
     
     Requires authentication and TEACHER or ADMIN role.
     """
@@ -1069,9 +1418,23 @@ async def update_submission_grade(
                 detail="Grade must be a number between 0 and 100"
             )
         
-        # Update grade
+        expected_version = grade_data.get("expected_version")
+        if expected_version is not None and expected_version != submission.version:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Submission was changed by someone else (current version {submission.version})"
+            )
+        
+        # Update grade; the version column makes a concurrent change fail the flush
         submission.grade = float(grade)
-        db.commit()
+        try:
+            db.commit()
+        except StaleDataError:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Submission was changed by someone else"
+            )
         db.refresh(submission)
         
         return {
@@ -1080,7 +1443,8 @@ async def update_submission_grade(
             "student_id": submission.student_id,
             "grade": submission.grade,
             "time_spent_minutes": submission.time_spent_minutes,
-            "submitted_at": submission.submitted_at
+            "submitted_at": submission.submitted_at,
+            "version": submission.version
         }
         
     except HTTPException:
@@ -1161,6 +1525,94 @@ async def create_user_by_admin(
             detail=f"Failed to create user: {str(e)}"
         )
 
+def bulk_user_summary(results: List[dict]) -> dict:
+    created = sum(1 for result in results if result["status"] == "created")
+    return {"created": created, "failed": len(results) - created, "results": results}
+
+
+@app.post("/users/bulk")
+async def create_users_bulk_endpoint(
+    request: BulkUserCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Create many users at once (Admin only)
+    
+    - **users**: Up to 10,000 entries of username, password, role and optional first_name / last_name
+    
+    Invalid rows and taken usernames are reported per row and do not stop the
+    other rows from being created. Rows are numbered from 1.
+    
+    Requires authentication and ADMIN role.
+    """
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to create users"
+        )
+    
+    try:
+        rows = ((index, row.dict()) for index, row in enumerate(request.users, start=1))
+        results = await asyncio.to_thread(create_users_bulk, db, rows)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to create users: {str(e)}"
+        )
+    return bulk_user_summary(results)
+
+
+@app.post("/users/bulk/csv")
+async def create_users_bulk_csv_endpoint(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Create many users from a CSV file (Admin only)
+    
+    - **file**: CSV with a header row naming the columns username, password, role
+      and optionally first_name, last_name
+    
+    Rows are numbered by their line in the file. Invalid rows and taken usernames
+    are reported per row and do not stop the other rows from being created.
+    
+    Requires authentication and ADMIN role.
+    """
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to create users"
+        )
+    
+    def read_rows():
+        reader = csv.DictReader(io.TextIOWrapper(file.file, encoding="utf-8-sig", newline=""))
+        missing = {"username", "password", "role"} - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(f"CSV header is missing column(s): {', '.join(sorted(missing))}")
+        for row in reader:
+            yield reader.line_num, row
+    
+    try:
+        results = await asyncio.to_thread(create_users_bulk, db, read_rows())
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="CSV file must be UTF-8 encoded"
+        )
+    except (ValueError, csv.Error) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid CSV file: {str(e)}"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to create users: {str(e)}"
+        )
+    return bulk_user_summary(results)
+
 @app.get("/users/me", response_model=UserResponse)
 async def read_users_me(current_user: User = Depends(get_current_user)):
     """Get current user information (protected endpoint)"""
@@ -1219,6 +1671,22 @@ async def update_user_profile_endpoint(
             detail="An unexpected error occurred while updating profile. Please try again."
         )
 
+async def save_uploaded_image(source, file_path: str, passthrough_formats: tuple = ()):
+    """
+    Store an uploaded image after the header-only size guard, with metadata stripped.
+    
+    Formats in passthrough_formats ("avif", "heic") are accepted and stored unchanged.
+    Raises HTTP 400 if the image is unsupported, malformed, or over the pixel/frame limits;
+    nothing is written in that case.
+    """
+    try:
+        await asyncio.to_thread(sanitize_image, source, file_path, passthrough_formats)
+    except ImageRejectedError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
 @app.post("/users/me/photo")
 async def upload_profile_photo_endpoint(
     photo: UploadFile = File(...),
@@ -1228,7 +1696,9 @@ async def upload_profile_photo_endpoint(
     """
     Upload profile photo for current user (Protected endpoint)
     
-    - **photo**: Image file (JPEG, PNG, GIF, WebP)
+    - **photo**: Image file (JPEG, PNG, GIF, WebP, AVIF, HEIC)
+    
+    AVIF and HEIC photos are stored as uploaded; other formats have their metadata stripped.
     
     Requires authentication. Only the authenticated user can upload their own profile photo.
     """
@@ -1237,7 +1707,7 @@ async def upload_profile_photo_endpoint(
         if not photo.content_type or not photo.content_type.startswith('image/'):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="File must be an image (JPEG, PNG, GIF, or WebP)"
+                detail="File must be an image (JPEG, PNG, GIF, WebP, AVIF or HEIC)"
             )
         
         # Validate file size (max 5MB)
@@ -1252,10 +1722,8 @@ async def upload_profile_photo_endpoint(
         unique_filename = f"{current_user.id}_{uuid.uuid4().hex}.{file_extension}"
         file_path = os.path.join(UPLOAD_DIR, unique_filename)
         
-        # Save the file
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await photo.read()
-            await f.write(content)
+        # Validate the image headers and save it without metadata
+        await save_uploaded_image(photo.file, file_path, PROFILE_PHOTO_PASSTHROUGH_FORMATS)
         
         # Generate full accessible URL for the uploaded file
         photo_url = f"/uploads/{unique_filename}"
@@ -1527,13 +1995,52 @@ async def get_schedules_endpoint(
 
 
 @app.get("/schedules/live")
-async def get_schedules_live_endpoint(db: Session = Depends(get_db)):
+async def get_schedules_live_endpoint(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    room_number: Optional[str] = None,
+    building: Optional[str] = None,
+    class_id: Optional[int] = None,
+    teacher_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
     """
-    Get all schedules for live display with enriched teacher and class information (Public endpoint)
+    Get schedules in a time window for live display with enriched teacher and class information (Public endpoint)
     No authentication required - for student dashboard display.
+    
+    - **start**: Start of the window (defaults to today, 00:00 UTC)
+    - **end**: End of the window (defaults to one day after start)
+    - **room_number**: Only this room (optional)
+    - **building**: Only rooms whose number starts with this prefix, e.g. "B-" (optional)
+    - **class_id**: Only this class (optional)
+    - **teacher_id**: Only classes taught by this teacher (optional)
+    
+    Recurring schedules are expanded into occurrences within the window;
+    occurrences have a rule_id and no id.
     """
+    start = to_naive_utc(start) if start else datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    end = to_naive_utc(end) if end else start + LIVE_SCHEDULE_DEFAULT_WINDOW
+    if end <= start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="End time must be after start time"
+        )
+    if end - start > LIVE_SCHEDULE_MAX_WINDOW:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Time window cannot exceed {LIVE_SCHEDULE_MAX_WINDOW.days} days"
+        )
+    
     try:
-        return get_schedules_live_enriched(db)
+        return get_schedules_live_enriched(
+            db,
+            start=start,
+            end=end,
+            room_number=room_number,
+            building=building,
+            class_id=class_id,
+            teacher_id=teacher_id
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -1625,333 +2132,2036 @@ async def delete_schedule_endpoint(
     return {"message": "Schedule deleted successfully"}
 
 
-# Announcement endpoints
-@app.post("/announcements/", response_model=AnnouncementResponse)
-async def create_announcement_endpoint(
-    announcement: AnnouncementCreate,
+# Recurring schedule rule endpoints
+@app.post("/schedule-rules/", response_model=ScheduleRuleResponse)
+async def create_schedule_rule_endpoint(
+    rule: ScheduleRuleCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Create a new announcement (Admin and Teacher only)
+    Create a recurring schedule (Admin and Teacher only)
+    
+    - **start_time** / **end_time**: The first occurrence; its length applies to every occurrence
+    - **rrule**: Recurrence rule, e.g. FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20261218
+      (FREQ=DAILY|WEEKLY with INTERVAL, BYDAY, UNTIL or COUNT)
+    - **exdates**: Occurrence start times to skip
+    
     Requires authentication and ADMIN or TEACHER role.
     """
     if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to create announcements"
+            detail="Not authorized to create schedules"
         )
     
     try:
-        return create_announcement(db, announcement)
+        return create_schedule_rule(db, rule)
+    except HTTPException:
+        # Re-raise HTTPExceptions (like 404 for invalid class_id)
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to create announcement: {str(e)}"
+            detail=f"Failed to create schedule rule: {str(e)}"
         )
 
 
-@app.get("/announcements/", response_model=list[AnnouncementResponse])
-async def get_announcements_endpoint(
+@app.get("/schedule-rules/", response_model=list[ScheduleRuleResponse])
+async def get_schedule_rules_endpoint(
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Get all announcements with pagination (Admin and Teacher only)
+    Get all recurring schedules with pagination (Admin and Teacher only)
     Requires authentication and ADMIN or TEACHER role.
     """
     if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to view announcements"
+            detail="Not authorized to view schedules"
         )
     
     try:
-        return get_announcements(db, skip=skip, limit=limit)
+        return get_schedule_rules(db, skip=skip, limit=limit)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to fetch announcements: {str(e)}"
+            detail=f"Failed to fetch schedule rules: {str(e)}"
         )
 
 
-@app.get("/announcements/live", response_model=list[AnnouncementResponse])
-async def get_announcements_live_endpoint(db: Session = Depends(get_db)):
+@app.get("/schedule-rules/{rule_id}", response_model=ScheduleRuleResponse)
+async def get_schedule_rule_endpoint(
+    rule_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
     """
-    Get all announcements for live display (Public endpoint)
-    No authentication required - for student dashboard display.
+    Get a specific recurring schedule by ID (Admin and Teacher only)
+    Requires authentication and ADMIN or TEACHER role.
     """
-    try:
-        return get_announcements_live(db)
-    except Exception as e:
+    if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to fetch live announcements: {str(e)}"
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view schedules"
         )
+    
+    rule = get_schedule_rule(db, rule_id)
+    if not rule:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Schedule rule not found"
+        )
+    return rule
 
 
-@app.get("/announcements/{announcement_id}", response_model=AnnouncementResponse)
-async def get_announcement_endpoint(
-    announcement_id: int,
+@app.put("/schedule-rules/{rule_id}", response_model=ScheduleRuleResponse)
+async def update_schedule_rule_endpoint(
+    rule_id: int,
+    rule: ScheduleRuleCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Get a specific announcement by ID (Admin and Teacher only)
+    Update a recurring schedule, e.g. to add exception dates (Admin and Teacher only)
     Requires authentication and ADMIN or TEACHER role.
     """
     if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to view announcements"
+            detail="Not authorized to update schedules"
         )
     
-    announcement = get_announcement(db, announcement_id)
-    if not announcement:
+    try:
+        updated_rule = update_schedule_rule(db, rule_id, rule)
+        if not updated_rule:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Schedule rule not found"
+            )
+        return updated_rule
+    except HTTPException:
+        raise
+    except Exception as e:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Announcement not found"
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to update schedule rule: {str(e)}"
         )
-    return announcement
 
 
-@app.put("/announcements/{announcement_id}", response_model=AnnouncementResponse)
-async def update_announcement_endpoint(
-    announcement_id: int,
-    announcement: AnnouncementCreate,
+@app.delete("/schedule-rules/{rule_id}")
+async def delete_schedule_rule_endpoint(
+    rule_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Update an announcement (Admin and Teacher only)
+    Delete a recurring schedule and all its occurrences (Admin and Teacher only)
     Requires authentication and ADMIN or TEACHER role.
     """
     if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to update announcements"
+            detail="Not authorized to delete schedules"
         )
     
-    updated_announcement = update_announcement(db, announcement_id, announcement)
-    if not updated_announcement:
+    if not delete_schedule_rule(db, rule_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Announcement not found"
+            detail="Schedule rule not found"
         )
-    return updated_announcement
+    return {"message": "Schedule rule deleted successfully"}
 
 
-@app.delete("/announcements/{announcement_id}")
-async def delete_announcement_endpoint(
-    announcement_id: int,
+# Room availability endpoints
+@app.get("/rooms/availability")
+async def get_room_availability_endpoint(
+    at: Optional[datetime] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Delete an announcement (Admin and Teacher only)
+    List which rooms are free at a point in time or for a whole time range (Admin and Teacher only)
+    
+    - **at**: Point in time to check (use instead of start/end)
+    - **start**: Start of the range to check
+    - **end**: End of the range to check
+    
+    Rooms are the room numbers that appear in schedules or recurring schedules;
+    a recurring occurrence in the range makes its room busy.
+    
     Requires authentication and ADMIN or TEACHER role.
     """
     if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to delete announcements"
+            detail="Not authorized to view room availability"
         )
     
-    if not delete_announcement(db, announcement_id):
+    if at is not None:
+        if start is not None or end is not None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Use either at, or start and end"
+            )
+        start, end = at, at + timedelta(microseconds=1)
+    elif start is None or end is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide at, or both start and end"
+        )
+    elif end <= start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="End time must be after start time"
+        )
+    
+    try:
+        availability = get_room_availability(db, start, end)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch room availability: {str(e)}"
+        )
+    
+    return {
+        "start": start,
+        "end": end,
+        "free_rooms": [room for room, free in availability.items() if free],
+        "busy_rooms": [room for room, free in availability.items() if not free]
+    }
+
+
+@app.get("/rooms/availability/next-free")
+async def get_next_free_room_slots_endpoint(
+    duration_minutes: int,
+    after: Optional[datetime] = None,
+    room_number: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Find the next free slot of a given length in each room (Admin and Teacher only)
+    
+    - **duration_minutes**: Required slot length in minutes
+    - **after**: Earliest slot start (defaults to now, UTC)
+    - **room_number**: Only search this room (optional)
+    
+    Slots are ordered by start time, earliest first.
+    
+    Requires authentication and ADMIN or TEACHER role.
+    """
+    if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view room availability"
+        )
+    
+    if duration_minutes < 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Duration must be at least 1 minute"
+        )
+    
+    duration = timedelta(minutes=duration_minutes)
+    try:
+        slots = get_next_free_slots(db, after or datetime.utcnow(), duration, room_number=room_number)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch room availability: {str(e)}"
+        )
+    
+    if room_number is not None and not slots:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Announcement not found"
+            detail="Room not found"
         )
-    return {"message": "Announcement deleted successfully"}
+    
+    return {
+        "duration_minutes": duration_minutes,
+        "slots": [
+            {"room_number": room, "start": slot_start, "end": slot_start + duration}
+            for room, slot_start in slots
+        ]
+    }
 
 
-# Classroom Report endpoints
+# Calendar (ICS) feeds
+def calendar_feed_url(feed_kind: str, subject: str) -> str:
+    token = create_calendar_feed_token(feed_kind, subject)
+    return f"/calendar/{feed_kind}/{quote(subject, safe='')}.ics?token={token}"
 
-@app.post("/reports/", response_model=ClassroomReportResponse, status_code=status.HTTP_201_CREATED)
-async def create_classroom_report_endpoint(
-    class_id: int = Form(...),
-    is_clean_before: bool = Form(...),
-    is_clean_after: bool = Form(...),
-    report_text: str = Form(...),
-    photo: Optional[UploadFile] = File(None),
+
+def build_calendar_feed(db: Session, feed_kind: str, subject: str) -> Tuple[bytes, Set[tuple]]:
+    """
+    Render a student, teacher or room timetable as an iCalendar document.
+    
+    Returns the document and the change-tracking keys it was built from.
+    """
+    since = datetime.utcnow() - CALENDAR_FEED_HISTORY
+    if feed_kind == "room":
+        name = f"Room {subject}"
+        schedules, rules = get_calendar_feed_data(db, since, room_number=subject)
+        dependencies = {("room", subject)}
+    else:
+        user = db.query(User).filter(User.id == int(subject)).first() if subject.isdigit() else None
+        expected_role = UserRole.STUDENT if feed_kind == "student" else UserRole.TEACHER
+        if not user or user.role != expected_role:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Calendar feed not found"
+            )
+        name = f"{user.first_name or user.username} - Timetable"
+        class_ids = get_enrolled_class_ids(db, user.id) if feed_kind == "student" else get_taught_class_ids(db, user.id)
+        schedules, rules = get_calendar_feed_data(db, since, class_ids=class_ids)
+        dependencies = {(feed_kind, user.id)} | {("class", class_id) for class_id in class_ids}
+    # Class names and teachers appear in every event
+    dependencies |= {("class", entry.class_id) for entry in (*schedules, *rules)}
+    
+    def to_event(uid, stamp, entry, rrule=None, exdates=()):
+        return CalendarEvent(
+            uid=uid,
+            stamp=stamp,
+            start=entry["start_time"],
+            end=entry["end_time"],
+            summary=f"{entry['class_code']} {entry['class_name']}",
+            location=entry["room_number"],
+            description=f"Teacher: {entry['teacher_full_name']}",
+            rrule=rrule,
+            exdates=exdates
+        )
+    
+    events = [
+        to_event(
+            f"schedule-{schedule.id}@classtrack",
+            schedule.updated_at,
+            build_enriched_schedule(schedule.class_, schedule.id, None, schedule.class_id, schedule.start_time, schedule.end_time, schedule.room_number, schedule.status)
+        )
+        for schedule in schedules
+    ]
+    events += [
+        to_event(
+            f"schedule-rule-{rule.id}@classtrack",
+            rule.updated_at,
+            build_enriched_schedule(rule.class_, None, rule.id, rule.class_id, rule.start_time, rule.end_time, rule.room_number, rule.status),
+            rrule=format_rrule(rule.rrule),
+            exdates=parse_exdates(rule.exdates)
+        )
+        for rule in rules
+    ]
+    return render_calendar(name, events), dependencies
+
+
+@app.get("/calendar/feeds")
+async def get_my_calendar_feeds_endpoint(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get the subscription URL for the current user's timetable feed (Students and Teachers)
+    
+    The URL contains a secret token; anyone with the URL can read the feed.
+    
+    Requires authentication and STUDENT or TEACHER role.
+    """
+    if current_user.role not in [UserRole.STUDENT, UserRole.TEACHER]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only students and teachers have personal calendar feeds"
+        )
+    
+    feed_kind = "student" if current_user.role == UserRole.STUDENT else "teacher"
+    return {"feed_kind": feed_kind, "url": calendar_feed_url(feed_kind, str(current_user.id))}
+
+
+@app.get("/calendar/rooms/{room_number:path}/feed")
+async def get_room_calendar_feed_endpoint(
+    room_number: str,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get the subscription URL for a room's booking feed (Admin and Teacher only)
+    Requires authentication and ADMIN or TEACHER role.
+    """
+    if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view room feeds"
+        )
+    
+    return {"feed_kind": "room", "url": calendar_feed_url("room", room_number)}
+
+
+@app.get("/calendar/{feed_kind}/{subject:path}.ics")
+async def get_calendar_feed_endpoint(
+    feed_kind: str,
+    subject: str,
+    token: str,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Download an iCalendar feed (Token-authenticated, for calendar app subscriptions)
+    
+    - **feed_kind**: student, teacher or room
+    - **subject**: User ID, or room number for room feeds
+    - **token**: Feed token from /calendar/feeds or /calendar/rooms/{room_number}/feed
+    
+    Rendered feeds are cached until the feed's own schedules change; send
+    If-None-Match for a 304. The ETag only changes when the feed's content does.
+    """
+    if feed_kind not in CALENDAR_FEED_KINDS or not verify_calendar_feed_token(feed_kind, subject, token):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Calendar feed not found"
+        )
+    
+    try:
+        feed = feed_cache.get_or_build(
+            (feed_kind, subject),
+            lambda: build_calendar_feed(db, feed_kind, subject),
+            time.monotonic()
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to build calendar feed: {str(e)}"
+        )
+    
+    headers = {"ETag": feed.etag, "Cache-Control": "private, max-age=300"}
+    if feed.etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=feed.body, media_type="text/calendar; charset=utf-8", headers=headers)
+
+
+# Live display updates (WebSocket)
+async def pump_live_messages(websocket: WebSocket, connection):
+    """Send a connection's queued messages until the socket goes away"""
+    while True:
+        message = await connection.queue.get()
+        await websocket.send_text(message)
+
+
+@app.websocket("/ws/live")
+async def live_updates(websocket: WebSocket, topics: Optional[str] = None):
+    """
+    Push schedule and announcement changes to displays (Public endpoint)
+    
+    - **topics**: Comma-separated topics to subscribe to on connect (optional)
+    
+    Topics are room:<room number>, building:<prefix> and announcements.
+    Send {"action": "subscribe" | "unsubscribe", "topics": [...]} to change
+    them. Messages are schedule diffs ({"type": "schedule", "action":
+    "created" | "updated" | "deleted"}), recurring schedule diffs ({"type":
+    "schedule_rule"}, same actions), announcements, urgent announcement
+    notifications ({"type": "urgent_announcement"}), acknowledgements and
+    errors. {"type": "resync"} means updates were dropped because the client
+    fell behind; refetch /schedules/live or /announcements/live. Closed with
+    code 1013 when the server is at its connection limit.
+    """
+    await websocket.accept()
+    connection = live_hub.connect()
+    if connection is None:
+        await websocket.close(code=1013)
+        return
+    
+    def reply(message: dict):
+        connection.offer(json.dumps(message))
+    
+    def change_topics(action: str, requested: List[str]):
+        try:
+            current = live_hub.subscribe(connection, requested) if action == "subscribe" else live_hub.unsubscribe(connection, requested)
+            reply({"type": "subscribed", "topics": current})
+        except ValueError as e:
+            reply({"type": "error", "detail": str(e)})
+    
+    sender = asyncio.create_task(pump_live_messages(websocket, connection))
+    try:
+        if topics:
+            change_topics("subscribe", [topic for topic in topics.split(",") if topic.strip()])
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                action, requested = message["action"], message["topics"]
+                if action not in ("subscribe", "unsubscribe") or not isinstance(requested, list) or not all(isinstance(t, str) for t in requested):
+                    raise ValueError
+            except (ValueError, KeyError, TypeError):
+                reply({"type": "error", "detail": 'Expected {"action": "subscribe" | "unsubscribe", "topics": [...]}'})
+                continue
+            change_topics(action, requested)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        live_hub.disconnect(connection)
+
+
+# Announcement endpoints
+@app.post("/announcements/", response_model=AnnouncementResponse)
+async def create_announcement_endpoint(
+    announcement: AnnouncementCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Create a new classroom report with optional photo evidence (Students only)
+    Create a new announcement (Admin and Teacher only)
+    Requires authentication and ADMIN or TEACHER role.
+    """
+    if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to create announcements"
+        )
     
-    - **class_id**: ID of the class/room being reported
-    - **is_clean_before**: Whether the room was clean before use
-    - **is_clean_after**: Whether the room was clean after use
-    - **report_text**: Description of the report
-    - **photo**: Optional photo evidence (jpg, jpeg, png, gif, webp, max 10MB)
+    try:
+        return create_announcement(db, announcement)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to create announcement: {str(e)}"
+        )
+
+
+@app.get("/announcements/", response_model=list[AnnouncementResponse])
+async def get_announcements_endpoint(
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get all announcements with pagination (Admin and Teacher only)
+    Requires authentication and ADMIN or TEACHER role.
+    """
+    if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view announcements"
+        )
     
-    Requires authentication and STUDENT role.
+    try:
+        return get_announcements(db, skip=skip, limit=limit)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch announcements: {str(e)}"
+        )
+
+
+@app.get("/announcements/live", response_model=list[AnnouncementResponse])
+async def get_announcements_live_endpoint(db: Session = Depends(get_db)):
     """
-    # Check if current user is a student
-    if current_user.role != UserRole.STUDENT:
+    Get all announcements for live display (Public endpoint)
+    No authentication required - for student dashboard display.
+    """
+    try:
+        return get_announcements_live(db)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch live announcements: {str(e)}"
+        )
+
+
+class LiveEventStream(StreamingResponse):
+    """
+    Server-sent event stream for a live hub connection.
+    
+    The connection is released however the response ends, including when it
+    is rejected before the body is iterated (e.g. by /batch at
+    http.response.start), when a generator's finally would never run.
+    """
+    def __init__(self, connection: LiveConnection):
+        self.connection = connection
+        super().__init__(
+            self._events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    async def _events(self):
+        while True:
+            try:
+                message = await asyncio.wait_for(self.connection.queue.get(), SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"data: {message}\n\n"
+    
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            live_hub.disconnect(self.connection)
+
+
+@app.get("/announcements/stream")
+async def stream_announcements():
+    """
+    Stream announcement changes and urgent announcement notifications as server-sent events (Public endpoint)
+    
+    Each event's data is a JSON message as sent to the announcements topic of
+    /ws/live. {"type": "resync"} means events were dropped because the client
+    fell behind; refetch /announcements/live. Returns 503 when the server is at
+    its live connection limit.
+    """
+    connection = live_hub.connect()
+    if connection is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many live connections, try again later"
+        )
+    live_hub.subscribe(connection, [ANNOUNCEMENTS_TOPIC])
+    return LiveEventStream(connection)
+
+
+@app.get("/announcements/{announcement_id}", response_model=AnnouncementResponse)
+async def get_announcement_endpoint(
+    announcement_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get a specific announcement by ID (Admin and Teacher only)
+    Requires authentication and ADMIN or TEACHER role.
+    """
+    if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view announcements"
+        )
+    
+    announcement = get_announcement(db, announcement_id)
+    if not announcement:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Announcement not found"
+        )
+    return announcement
+
+
+@app.put("/announcements/{announcement_id}", response_model=AnnouncementResponse)
+async def update_announcement_endpoint(
+    announcement_id: int,
+    announcement: AnnouncementCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Update an announcement (Admin and Teacher only)
+    Requires authentication and ADMIN or TEACHER role.
+    """
+    if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to update announcements"
+        )
+    
+    updated_announcement = update_announcement(db, announcement_id, announcement)
+    if not updated_announcement:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Announcement not found"
+        )
+    return updated_announcement
+
+
+@app.delete("/announcements/{announcement_id}")
+async def delete_announcement_endpoint(
+    announcement_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Delete an announcement (Admin and Teacher only)
+    Requires authentication and ADMIN or TEACHER role.
+    """
+    if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to delete announcements"
+        )
+    
+    if not delete_announcement(db, announcement_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Announcement not found"
+        )
+    return {"message": "Announcement deleted successfully"}
+
+
+# Classroom Report endpoints
+
+@app.post("/reports/", response_model=ClassroomReportResponse, status_code=status.HTTP_201_CREATED)
+async def create_classroom_report_endpoint(
+    class_id: int = Form(...),
+    is_clean_before: bool = Form(...),
+    is_clean_after: bool = Form(...),
+    report_text: str = Form(...),
+    photo: Optional[UploadFile] = File(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Create a new classroom report with optional photo evidence (Students only)
+    
+    - **class_id**: ID of the class/room being reported
+    - **is_clean_before**: Whether the room was clean before use
+    - **is_clean_after**: Whether the room was clean after use
+    - **report_text**: Description of the report
+    - **photo**: Optional photo evidence (jpg, jpeg, png, gif, webp, max 10MB)
+    
+    Requires authentication and STUDENT role.
+    """
+    # Check if current user is a student
+    if current_user.role != UserRole.STUDENT:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to create classroom reports"
+        )
+    
+    photo_url = None
+    
+    # Handle photo upload if provided
+    if photo:
+        # Validate file type
+        file_extension = os.path.splitext(photo.filename)[1].lower()
+        if file_extension not in ALLOWED_EXTENSIONS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
+            )
+        
+        # Validate file size
+        if photo.size and photo.size > MAX_FILE_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB"
+            )
+        
+        # Generate unique filename
+        file_id = str(uuid.uuid4())
+        filename = f"{file_id}{file_extension}"
+        file_path = os.path.join(UPLOAD_DIR, filename)
+        
+        try:
+            # Validate the image headers and save it without metadata
+            await save_uploaded_image(photo.file, file_path)
+            
+            # Generate URL (in production, this would be a proper URL)
+            photo_url = f"/uploads/{filename}"
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to save photo: {str(e)}"
+            )
+    
+    return await create_report_for_user(
+        db,
+        current_user=current_user,
+        class_id=class_id,
+        is_clean_before=is_clean_before,
+        is_clean_after=is_clean_after,
+        report_text=report_text,
+        photo_url=photo_url
+    )
+
+
+async def create_report_for_user(
+    db: Session,
+    current_user: User,
+    class_id: int,
+    is_clean_before: bool,
+    is_clean_after: bool,
+    report_text: str,
+    photo_url: Optional[str]
+) -> ClassroomReport:
+    """
+    Create a classroom report once its photo (if any) has been stored.
+    
+    Shared by the single-request upload and the resumable upload finalize step.
+    """
+    # Fingerprint the photo for near-duplicate detection (never blocks the report)
+    photo_hash = None
+    if photo_url:
+        photo_path = os.path.join(UPLOAD_DIR, photo_url.rsplit("/", 1)[-1])
+        photo_hash = await asyncio.to_thread(try_compute_dhash, photo_path)
+    
+    # Create report data
+    report_data = ClassroomReportCreate(
+        class_id=class_id,
+        is_clean_before=is_clean_before,
+        is_clean_after=is_clean_after,
+        report_text=report_text,
+        photo_url=photo_url
+    )
+    
+    try:
+        new_report = create_classroom_report(db, report_in=report_data, reporter_id=current_user.id, photo_hash=photo_hash)
+        return new_report
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to create classroom report: {str(e)}"
+        )
+
+
+@app.get("/reports/", response_model=list[ClassroomReportResponse])
+async def get_classroom_reports_endpoint(
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get all classroom reports (Admin and Teacher only)
+    
+    - **skip**: Number of reports to skip (for pagination)
+    - **limit**: Maximum number of reports to return
+    
+    Requires authentication and ADMIN or TEACHER role.
+    """
+    if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view classroom reports"
+        )
+    
+    try:
+        reports = get_classroom_reports(db, skip=skip, limit=limit)
+        return reports
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch classroom reports: {str(e)}"
+        )
+
+
+@app.get("/reports/my", response_model=list[ClassroomReportResponse])
+async def get_my_classroom_reports_endpoint(
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get classroom reports created by the current user (Students only)
+    
+    - **skip**: Number of reports to skip (for pagination)
+    - **limit**: Maximum number of reports to return
+    
+    Requires authentication and STUDENT role.
+    """
+    if current_user.role != UserRole.STUDENT:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view classroom reports"
+        )
+    
+    try:
+        reports = get_classroom_reports_by_reporter(db, reporter_id=current_user.id, skip=skip, limit=limit)
+        return reports
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch classroom reports: {str(e)}"
+        )
+
+
+@app.get("/reports/class/{class_id}", response_model=list[ClassroomReportResponse])
+async def get_classroom_reports_by_class_endpoint(
+    class_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get classroom reports for a specific class (Admin and Teacher only)
+    
+    - **class_id**: ID of the class
+    - **skip**: Number of reports to skip (for pagination)
+    - **limit**: Maximum number of reports to return
+    
+    Requires authentication and ADMIN or TEACHER role.
+    """
+    if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view classroom reports"
+        )
+    
+    try:
+        reports = get_classroom_reports_by_class(db, class_id=class_id, skip=skip, limit=limit)
+        return reports
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch classroom reports: {str(e)}"
+        )
+
+
+# Resumable report photo uploads
+#
+# Protocol:
+#   1. POST /reports/uploads                      -> create a session, returns upload_id
+#   2. PUT  /reports/uploads/{upload_id}?offset=N -> append raw bytes at offset N
+#   3. GET  /reports/uploads/{upload_id}          -> current offset (resume point)
+#   4. POST /reports/uploads/{upload_id}/complete -> create the report from the assembled file
+
+def get_partial_upload_path(upload_id: str) -> str:
+    """Get the on-disk path of a partial upload"""
+    return os.path.join(UPLOAD_PARTIAL_DIR, f"{upload_id}.part")
+
+
+def upload_session_response(upload_session) -> UploadSessionResponse:
+    """Build the client-facing view of an upload session"""
+    return UploadSessionResponse(
+        upload_id=upload_session.id,
+        filename=upload_session.filename,
+        offset=upload_session.received_bytes,
+        total_size=upload_session.total_size,
+        expires_at=upload_session.expires_at
+    )
+
+
+def get_owned_upload_session(db: Session, upload_id: str, current_user: User):
+    """Get a live upload session for the current user or raise 404"""
+    upload_session = get_upload_session(db, upload_id=upload_id, user_id=current_user.id)
+    if not upload_session:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload session not found or expired"
+        )
+    return upload_session
+
+
+def sweep_upload_sessions() -> int:
+    """
+    Expire stale upload sessions and reclaim their partial chunks.
+    
+    Partial files with no matching session (e.g. left behind by a crash or a
+    deleted user) are reclaimed as well.
+    
+    Returns:
+        int: Number of partial files removed
+    """
+    db = SessionLocal()
+    try:
+        delete_expired_upload_sessions(db, now=datetime.utcnow())
+        live_ids = set(get_upload_session_ids(db))
+    finally:
+        db.close()
+    
+    removed = 0
+    with os.scandir(UPLOAD_PARTIAL_DIR) as entries:
+        for entry in entries:
+            upload_id, extension = os.path.splitext(entry.name)
+            if extension != ".part" or upload_id in live_ids:
+                continue
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+async def run_periodically(job, interval_seconds: int, label: str):
+    """Run a blocking maintenance job in a worker thread for the app's lifetime"""
+    while True:
+        try:
+            processed = await asyncio.to_thread(job)
+            if processed:
+                print(f"{label}: processed {processed} item(s)")
+        except Exception as e:
+            print(f"Error in {label}: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+@app.post("/reports/uploads", response_model=UploadSessionResponse, status_code=status.HTTP_201_CREATED)
+async def create_report_upload_session_endpoint(
+    upload_in: UploadSessionCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Start a resumable photo upload for a classroom report (Students only)
+    
+    - **filename**: Original filename (jpg, jpeg, png, gif, webp)
+    - **total_size**: Size of the complete file in bytes (max 10MB)
+    
+    Requires authentication and STUDENT role.
+    """
+    if current_user.role != UserRole.STUDENT:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to create classroom reports"
+        )
+    
+    file_extension = os.path.splitext(upload_in.filename)[1].lower()
+    if file_extension not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
+        )
+    
+    if upload_in.total_size > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB"
+        )
+    
+    upload_id = uuid.uuid4().hex
+    try:
+        # Create the empty partial file up front so chunks can be written in place
+        async with aiofiles.open(get_partial_upload_path(upload_id), 'wb'):
+            pass
+        
+        upload_session = create_upload_session(
+            db,
+            upload_id=upload_id,
+            user_id=current_user.id,
+            filename=upload_in.filename,
+            total_size=upload_in.total_size,
+            expires_at=datetime.utcnow() + UPLOAD_SESSION_TTL
+        )
+        return upload_session_response(upload_session)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to create upload session: {str(e)}"
+        )
+
+
+@app.get("/reports/uploads/{upload_id}", response_model=UploadSessionResponse)
+async def get_report_upload_session_endpoint(
+    upload_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get the current offset of a resumable upload (Owner only)
+    
+    Clients call this after a dropped connection and resume from **offset**.
+    
+    Requires authentication.
+    """
+    upload_session = get_owned_upload_session(db, upload_id, current_user)
+    return upload_session_response(upload_session)
+
+
+@app.put("/reports/uploads/{upload_id}", response_model=UploadSessionResponse)
+async def upload_report_chunk_endpoint(
+    upload_id: str,
+    offset: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Append a chunk to a resumable upload (Owner only)
+    
+    - **offset**: Byte offset of this chunk; must equal the session's current offset
+    - **body**: Raw chunk bytes (application/octet-stream)
+    
+    Returns 409 with the current offset if the chunk does not start where the
+    previous one ended.
+    
+    Requires authentication.
+    """
+    upload_session = get_owned_upload_session(db, upload_id, current_user)
+    
+    if offset != upload_session.received_bytes:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "message": "Chunk offset does not match the upload offset",
+                "offset": upload_session.received_bytes
+            }
+        )
+    
+    remaining = upload_session.total_size - offset
+    written = 0
+    try:
+        async with aiofiles.open(get_partial_upload_path(upload_id), 'r+b') as f:
+            await f.seek(offset)
+            async for chunk in request.stream():
+                if not chunk:
+                    continue
+                if written + len(chunk) > remaining:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Chunk extends past the declared file size"
+                    )
+                await f.write(chunk)
+                written += len(chunk)
+    except HTTPException:
+        raise
+    except ClientDisconnect:
+        # Keep what arrived so the client can resume from there
+        if written:
+            advance_upload_session(db, upload_id, expected_offset=offset, new_offset=offset + written, expires_at=datetime.utcnow() + UPLOAD_SESSION_TTL)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Upload interrupted; resume from the session offset"
+        )
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload session not found or expired"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to store chunk: {str(e)}"
+        )
+    
+    new_offset = offset + written
+    if not advance_upload_session(db, upload_id, expected_offset=offset, new_offset=new_offset, expires_at=datetime.utcnow() + UPLOAD_SESSION_TTL):
+        db.refresh(upload_session)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "message": "Upload offset changed while the chunk was being written",
+                "offset": upload_session.received_bytes
+            }
+        )
+    
+    db.refresh(upload_session)
+    return upload_session_response(upload_session)
+
+
+@app.post("/reports/uploads/{upload_id}/complete", response_model=ClassroomReportResponse, status_code=status.HTTP_201_CREATED)
+async def complete_report_upload_endpoint(
+    upload_id: str,
+    class_id: int = Form(...),
+    is_clean_before: bool = Form(...),
+    is_clean_after: bool = Form(...),
+    report_text: str = Form(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Finalize a resumable upload and create the classroom report (Students only)
+    
+    - **upload_id**: ID of a fully uploaded session
+    - **class_id**: ID of the class/room being reported
+    - **is_clean_before**: Whether the room was clean before use
+    - **is_clean_after**: Whether the room was clean after use
+    - **report_text**: Description of the report
+    
+    Requires authentication and STUDENT role.
+    """
+    if current_user.role != UserRole.STUDENT:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to create classroom reports"
+        )
+    
+    upload_session = get_owned_upload_session(db, upload_id, current_user)
+    
+    if upload_session.received_bytes != upload_session.total_size:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "message": "Upload is incomplete",
+                "offset": upload_session.received_bytes
+            }
+        )
+    
+    # Check the report before touching the upload, so a bad form can be corrected and resent
+    try:
+        ClassroomReportCreate(class_id=class_id, is_clean_before=is_clean_before, is_clean_after=is_clean_after, report_text=report_text)
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    if get_class(db, class_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Class with ID {class_id} not found"
+        )
+    
+    # Validate the assembled file and copy it, without metadata, into the served uploads directory
+    file_extension = os.path.splitext(upload_session.filename)[1].lower()
+    filename = f"{uuid.uuid4()}{file_extension}"
+    photo_path = os.path.join(UPLOAD_DIR, filename)
+    partial_path = get_partial_upload_path(upload_id)
+    try:
+        with open(partial_path, 'rb') as partial_file:
+            await save_uploaded_image(partial_file, photo_path)
+    except HTTPException:
+        # A rejected image can never become valid by resuming, so drop the session
+        delete_upload_session(db, upload_id)
+        os.remove(partial_path)
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to save photo: {str(e)}"
+        )
+    
+    try:
+        report = await create_report_for_user(
+            db,
+            current_user=current_user,
+            class_id=class_id,
+            is_clean_before=is_clean_before,
+            is_clean_after=is_clean_after,
+            report_text=report_text,
+            photo_url=f"/uploads/{filename}"
+        )
+    except HTTPException:
+        # Leave the session in place so the finalize can be retried
+        if os.path.exists(photo_path):
+            os.remove(photo_path)
+        raise
+    
+    # The report is committed; only now is the upload itself no longer needed
+    delete_upload_session(db, upload_id)
+    os.remove(partial_path)
+    return report
+
+
+# Upload storage maintenance (Admin only)
+
+def iter_upload_batches(batch_size: int):
+    """Stream the uploads directory as batches of (filename, stat) pairs"""
+    batch = []
+    with os.scandir(UPLOAD_DIR) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            batch.append((entry.name, entry.stat()))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def sweep_orphaned_uploads(grace_period: timedelta = UPLOAD_ORPHAN_GRACE_PERIOD) -> int:
+    """
+    Delete uploaded files no longer referenced by any user or classroom report.
+    
+    The uploads directory is cross-referenced against the database one batch
+    at a time, so memory stays flat however many files have accumulated.
+    
+    Args:
+        grace_period: Files modified more recently than this are left alone
+        
+    Returns:
+        int: Number of files deleted
+    """
+    cutoff = (datetime.now() - grace_period).timestamp()
+    removed = 0
+    
+    db = SessionLocal()
+    try:
+        for batch in iter_upload_batches(UPLOAD_GC_BATCH_SIZE):
+            candidates = {f"/uploads/{name}": name for name, stat in batch if stat.st_mtime < cutoff}
+            if not candidates:
+                continue
+            
+            referenced = get_referenced_upload_urls(db, list(candidates))
+            for url, name in candidates.items():
+                if url in referenced:
+                    continue
+                try:
+                    os.remove(os.path.join(UPLOAD_DIR, name))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+    finally:
+        db.close()
+    return removed
+
+
+def build_storage_usage_report(db: Session, top: int) -> dict:
+    """Aggregate upload storage by category and by owning user"""
+    files = {}
+    for batch in iter_upload_batches(UPLOAD_GC_BATCH_SIZE):
+        for name, stat in batch:
+            files[name] = stat.st_size
+    
+    categories = {
+        "profile_picture": {"files": 0, "bytes": 0},
+        "report_photo": {"files": 0, "bytes": 0},
+    }
+    users = {}
+    referenced = set()
+    
+    for url, user_id, username, category in iter_upload_references(db):
+        name = url.rsplit("/", 1)[-1]
+        size = files.get(name)
+        if size is None:
+            continue  # Row points at a file that is already gone
+        
+        categories[category]["files"] += 1
+        categories[category]["bytes"] += size
+        
+        user_usage = users.setdefault(user_id, {
+            "user_id": user_id,
+            "username": username,
+            "profile_picture_bytes": 0,
+            "report_photo_bytes": 0,
+            "total_bytes": 0
+        })
+        user_usage[f"{category}_bytes"] += size
+        user_usage["total_bytes"] += size
+        referenced.add(name)
+    
+    unreferenced = [size for name, size in files.items() if name not in referenced]
+    
+    return {
+        "total_files": len(files),
+        "total_bytes": sum(files.values()),
+        "categories": categories,
+        "unreferenced": {"files": len(unreferenced), "bytes": sum(unreferenced)},
+        "users": sorted(users.values(), key=lambda u: u["total_bytes"], reverse=True)[:top],
+        "generated_at": datetime.utcnow().isoformat()
+    }
+
+
+@app.get("/admin/storage/usage")
+async def get_storage_usage_endpoint(
+    top: int = 50,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get storage used by uploaded files per category and per user (Admin only)
+    
+    - **top**: Number of heaviest users to include
+    
+    Files not referenced by any user or report are reported as **unreferenced**;
+    the background sweeper deletes them once they are past the grace period.
+    
+    Requires authentication and ADMIN role.
+    """
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view storage usage"
+        )
+    
+    try:
+        return await asyncio.to_thread(build_storage_usage_report, db, top)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to build storage usage report: {str(e)}"
+        )
+
+
+@app.post("/admin/storage/sweep")
+async def sweep_orphaned_uploads_endpoint(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Run the orphaned upload sweeper immediately (Admin only)
+    
+    Requires authentication and ADMIN role.
+    """
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to sweep uploads"
+        )
+    
+    try:
+        removed = await asyncio.to_thread(sweep_orphaned_uploads)
+        return {"message": "Orphaned uploads swept successfully", "files_removed": removed}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to sweep uploads: {str(e)}"
+        )
+
+
+# Classroom report photo archive
+
+class ZipStreamBuffer:
+    """
+    Write-only, unseekable sink for zipfile.ZipFile.
+    
+    zipfile falls back to data descriptors when it cannot seek, so the archive
+    can be emitted front to back; whatever has been written so far is handed to
+    the HTTP response with drain().
+    """
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+    
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+    
+    def tell(self) -> int:
+        return self._offset
+    
+    def flush(self):
+        pass
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+PHOTO_ARCHIVE_MANIFEST_FIELDS = [
+    "report_id", "class_id", "class_name", "reporter_id", "reporter_username",
+    "is_clean_before", "is_clean_after", "report_text", "created_at", "photo_file"
+]
+
+
+def get_report_photo_path(report) -> Optional[str]:
+    """Get the on-disk path of a report's photo if it still exists"""
+    if not report.photo_url:
+        return None
+    path = os.path.join(UPLOAD_DIR, report.photo_url.rsplit("/", 1)[-1])
+    return path if os.path.isfile(path) else None
+
+
+def get_report_photo_archive_name(report) -> str:
+    """Stable file name for a report's photo inside the archive"""
+    extension = os.path.splitext(report.photo_url)[1].lower()
+    return f"photos/{report.id}_{report.created_at:%Y%m%d_%H%M%S}{extension}"
+
+
+def iter_class_report_pages(db: Session, class_id: int, start: Optional[datetime], end: Optional[datetime]):
+    """Walk a class's reports one keyset page at a time"""
+    after_id = 0
+    while True:
+        page = get_classroom_reports_by_class_after(
+            db, class_id=class_id, after_id=after_id, limit=PHOTO_ARCHIVE_PAGE_SIZE, start=start, end=end
+        )
+        if not page:
+            return
+        yield page
+        after_id = page[-1][0].id
+
+
+async def stream_class_report_photos(request: Request, class_obj: Class, start: Optional[datetime], end: Optional[datetime]):
+    """
+    Stream a ZIP of a class's report photos plus a manifest.csv.
+    
+    Reports are read in two keyset-paginated passes (manifest, then photos) and
+    photos are copied in fixed-size blocks, so memory use does not depend on
+    how many reports or how large the photos are. Nothing touches disk besides
+    the photos being read. The stream stops as soon as the client disconnects.
+    """
+    buffer = ZipStreamBuffer()
+    db = SessionLocal()
+    try:
+        with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+            # Pass 1: manifest of every report in range
+            manifest_info = zipfile.ZipInfo("manifest.csv", date_time=datetime.utcnow().timetuple()[:6])
+            manifest_info.compress_type = zipfile.ZIP_DEFLATED
+            with archive.open(manifest_info, mode="w", force_zip64=True) as manifest:
+                text = io.TextIOWrapper(manifest, encoding="utf-8", newline="")
+                writer = csv.writer(text)
+                writer.writerow(PHOTO_ARCHIVE_MANIFEST_FIELDS)
+                for page in iter_class_report_pages(db, class_obj.id, start, end):
+                    for report, reporter_username in page:
+                        writer.writerow([
+                            report.id, class_obj.id, class_obj.name, report.reporter_id, reporter_username,
+                            report.is_clean_before, report.is_clean_after, report.report_text,
+                            report.created_at.isoformat(),
+                            get_report_photo_archive_name(report) if get_report_photo_path(report) else ""
+                        ])
+                    text.flush()
+                    yield buffer.drain()
+                    if await request.is_disconnected():
+                        return
+                text.flush()
+                text.detach()
+            yield buffer.drain()
+            
+            # Pass 2: the photos themselves, stored uncompressed (already compressed images)
+            for page in iter_class_report_pages(db, class_obj.id, start, end):
+                for report, _ in page:
+                    photo_path = get_report_photo_path(report)
+                    if not photo_path:
+                        continue
+                    if await request.is_disconnected():
+                        return
+                    
+                    info = zipfile.ZipInfo(get_report_photo_archive_name(report), date_time=report.created_at.timetuple()[:6])
+                    info.compress_type = zipfile.ZIP_STORED
+                    async with aiofiles.open(photo_path, "rb") as photo_file:
+                        with archive.open(info, mode="w", force_zip64=True) as entry:
+                            while True:
+                                block = await photo_file.read(PHOTO_ARCHIVE_READ_SIZE)
+                                if not block:
+                                    break
+                                entry.write(block)
+                                yield buffer.drain()
+                    yield buffer.drain()
+        
+        # Central directory
+        yield buffer.drain()
+    finally:
+        db.close()
+
+
+@app.get("/reports/class/{class_id}/photos.zip")
+async def download_class_report_photos_endpoint(
+    class_id: int,
+    request: Request,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Download every report photo for a class as a streamed ZIP (Admin and Teacher only)
+    
+    - **class_id**: ID of the class/room
+    - **start**: Only include reports created at or after this time (optional)
+    - **end**: Only include reports created before this time (optional)
+    
+    The archive contains photos/ plus a manifest.csv of report metadata and is
+    built on the fly while it downloads.
+    
+    Requires authentication and ADMIN or TEACHER role.
+    """
+    if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view classroom reports"
+        )
+    
+    if start and end and end <= start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="End time must be after start time"
+        )
+    
+    class_obj = get_class(db, class_id)
+    if not class_obj:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Class not found"
+        )
+    db.expunge(class_obj)
+    
+    filename = f"{class_obj.code}_report_photos.zip"
+    return StreamingResponse(
+        stream_class_report_photos(request, class_obj, start, end),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+# Room utilization analytics (Admin only)
+
+@app.get("/admin/analytics/room-utilization")
+async def get_room_utilization_endpoint(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    room_number: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Room occupancy, concurrency, turnaround and cleanliness analytics (Admin only)
+    
+    - **start**: Start of the period, rounded down to Monday 00:00 UTC (defaults to 12 weeks ago)
+    - **end**: End of the period, rounded up to the next Monday (defaults to the end of this week)
+    - **room_number**: Only this room (optional)
+    
+    For each room: overall utilization, booked hours, peak concurrent bookings,
+    hourly_utilization[weekday][hour] averaged over the weeks, same-day turnaround
+    gaps between bookings, and cleanliness outcomes of reports filed during its bookings.
+    
+    Requires authentication and ADMIN role.
+    """
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view room analytics"
+        )
+    
+    end = to_naive_utc(end) if end else week_start(datetime.utcnow()) + WEEK
+    start = to_naive_utc(start) if start else end - WEEK * ROOM_ANALYTICS_DEFAULT_WEEKS
+    if end <= start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="End time must be after start time"
+        )
+    
+    first_week = week_start(start)
+    last_week = week_start(end - timedelta(microseconds=1))
+    week_count = (last_week - first_week) // WEEK + 1
+    if week_count > ROOM_ANALYTICS_MAX_WEEKS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Period cannot exceed {ROOM_ANALYTICS_MAX_WEEKS} weeks"
+        )
+    weeks = [first_week + WEEK * index for index in range(week_count)]
+    
+    try:
+        rooms = [room_number] if room_number else get_room_numbers(db)
+        summaries = get_room_utilization(
+            rooms,
+            weeks,
+            lambda load_start, load_end: get_room_usage_data(db, load_start, load_end, room_numbers=[room_number] if room_number else None)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to compute room analytics: {str(e)}"
+        )
+    
+    return {
+        "start": first_week,
+        "end": first_week + WEEK * week_count,
+        "weeks": week_count,
+        "rooms": summaries
+    }
+
+
+# Timetable generation (Admin only)
+
+timetable_tasks = set()
+
+
+def timetable_slot_times(request: TimetableJobCreate) -> List[tuple]:
+    """(start, end) times of day for each slot of the weekly grid"""
+    day_start = datetime.combine(request.term_start, request.day_start)
+    day_end = datetime.combine(request.term_start, request.day_end)
+    slot = timedelta(minutes=request.slot_minutes)
+    slot_count = int((day_end - day_start) / slot)
+    return [((day_start + slot * index).time(), (day_start + slot * (index + 1)).time()) for index in range(slot_count)]
+
+
+def timetable_term(request: TimetableJobCreate) -> tuple:
+    """
+    (first week's Monday, term start, term end) of a timetable request.
+    
+    Week 0 runs from term_start to the end of its week, so no meeting lands
+    on a weekday before the term starts.
+    """
+    term_start = datetime.combine(request.term_start, datetime.min.time())
+    first_week = week_start(term_start)
+    return first_week, term_start, first_week + WEEK * request.weeks
+
+
+def build_timetable_problem(db: Session, request: TimetableJobCreate) -> TimetableProblem:
+    """
+    Turn a timetable request into the solver's weekly grid.
+    
+    Rooms booked, and teachers teaching elsewhere, at a slot in any week of
+    the term are blocked at that slot, so applying the result cannot clash.
+    """
+    slots = timetable_slot_times(request)
+    if not slots:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The teaching day is shorter than one slot"
+        )
+    
+    requirements = {requirement.class_id: requirement for requirement in request.classes}
+    teachers = dict(db.query(Class.id, Class.teacher_id).all())
+    missing = sorted(set(requirements) - set(teachers))
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Classes not found: {', '.join(str(class_id) for class_id in missing)}"
+        )
+    
+    meetings = [
+        Meeting(class_id, teachers[class_id], requirement.slots_per_meeting)
+        for class_id, requirement in requirements.items()
+        for _ in range(requirement.meetings_per_week)
+    ]
+    if max(meeting.length for meeting in meetings) > len(slots):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="A meeting is longer than the teaching day"
+        )
+    
+    def overlapping_slots(start_time, end_time):
+        return [index for index, (slot_start, slot_end) in enumerate(slots) if slot_start < end_time and start_time < slot_end]
+    
+    day_index = {weekday: index for index, weekday in enumerate(request.days)}
+    room_index_by_number = {room: index for index, room in enumerate(request.rooms)}
+    involved_teachers = {meeting.teacher_id for meeting in meetings if meeting.teacher_id is not None}
+    
+    blocked_rooms, teacher_unavailable = set(), set()
+    _, term_start, term_end = timetable_term(request)
+    bookings, _ = get_room_usage_data(db, term_start, term_end)
+    for room_number, class_id, start_time, end_time in bookings:
+        day = day_index.get(start_time.weekday())
+        if day is None:
+            continue
+        booking_end = end_time.time() if end_time.date() == start_time.date() else datetime.max.time()
+        for slot in overlapping_slots(start_time.time(), booking_end):
+            if room_number in room_index_by_number:
+                blocked_rooms.add((room_index_by_number[room_number], day, slot))
+            if teachers.get(class_id) in involved_teachers:
+                teacher_unavailable.add((teachers[class_id], day, slot))
+    
+    for teacher_id, windows in request.teacher_availability.items():
+        for weekday, day in day_index.items():
+            for slot, (slot_start, slot_end) in enumerate(slots):
+                if not any(window.weekday == weekday and window.start <= slot_start and slot_end <= window.end for window in windows):
+                    teacher_unavailable.add((teacher_id, day, slot))
+    
+    return TimetableProblem(len(request.days), len(slots), len(request.rooms), meetings, blocked_rooms, teacher_unavailable)
+
+
+def timetable_result(request: TimetableJobCreate, problem: TimetableProblem, solution) -> dict:
+    """Describe a solution as weekly meetings plus its objective"""
+    slots = timetable_slot_times(request)
+    meetings = []
+    for meeting, (day, start, room) in sorted(zip(problem.meetings, solution.placements), key=lambda pair: (pair[1][0], pair[1][1], pair[1][2])):
+        meetings.append({
+            "class_id": meeting.class_id,
+            "teacher_id": meeting.teacher_id,
+            "room_number": request.rooms[room],
+            "weekday": request.days[day],
+            "start_time": slots[start][0].strftime("%H:%M"),
+            "end_time": slots[start + meeting.length - 1][1].strftime("%H:%M")
+        })
+    return {
+        "feasible": solution.hard_violations == 0,
+        "objective": {
+            "hard_violations": solution.hard_violations,
+            "room_changes": solution.room_changes,
+            "teacher_gap_slots": solution.teacher_gaps,
+            "same_day_repeats": solution.same_day_repeats
+        },
+        "iterations": solution.iterations,
+        "meetings": meetings
+    }
+
+
+async def run_timetable_job(job, request: TimetableJobCreate, problem: TimetableProblem):
+    """Solve off the event loop and record the outcome on the job"""
+    job.status = "running"
+    try:
+        solution = await asyncio.to_thread(solve_timetable, problem, request.time_limit_seconds, request.seed, job.cancelled)
+        job.result = timetable_result(request, problem, solution)
+        job.status = "completed"
+    except Exception as e:
+        job.error = str(e)
+        job.status = "failed"
+    finally:
+        job.finished_at = datetime.utcnow()
+
+
+def timetable_job_response(job) -> dict:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+        "result": job.result,
+        "error": job.error
+    }
+
+
+@app.post("/admin/timetable/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def create_timetable_job_endpoint(
+    request: TimetableJobCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Start generating a conflict-free weekly timetable in the background (Admin only)
+    
+    - **term_start** / **weeks**: Term the schedules are for
+    - **rooms**: Rooms the generator may use
+    - **classes**: class_id, meetings_per_week and slots_per_meeting for each class
+    - **teacher_availability**: Per teacher ID, weekday/start/end windows they can teach in
+    - **days**, **day_start**, **day_end**, **slot_minutes**: The weekly grid
+    - **time_limit_seconds**: Search budget
+    
+    Teachers come from each class's teacher_id. Existing bookings in the term are
+    respected. Poll GET /admin/timetable/jobs/{job_id} for the result, then apply it.
+    
+    Requires authentication and ADMIN role.
+    """
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to generate timetables"
+        )
+    
+    problem = build_timetable_problem(db, request)
+    job = timetable_jobs.create(current_user.id)
+    job.request = request
+    task = asyncio.create_task(run_timetable_job(job, request, problem))
+    timetable_tasks.add(task)
+    task.add_done_callback(timetable_tasks.discard)
+    return timetable_job_response(job)
+
+
+@app.get("/admin/timetable/jobs/{job_id}")
+async def get_timetable_job_endpoint(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get a timetable job's status and, once completed, its meetings and objective (Admin only)
+    Requires authentication and ADMIN role.
+    """
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to generate timetables"
+        )
+    
+    job = timetable_jobs.get(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Timetable job not found"
+        )
+    return timetable_job_response(job)
+
+
+@app.post("/admin/timetable/jobs/{job_id}/apply")
+async def apply_timetable_job_endpoint(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Create the Schedule rows of a completed, feasible timetable for every week of its term (Admin only)
+    
+    All rows are created in one transaction; nothing is created if any booking now clashes.
+    
+    Requires authentication and ADMIN role.
+    """
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to generate timetables"
+        )
+    
+    job = timetable_jobs.get(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Timetable job not found"
+        )
+    if job.status != "completed" or not job.result["feasible"]:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to create classroom reports"
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Only a completed, conflict-free timetable can be applied"
         )
     
-    photo_url = None
-    
-    # Handle photo upload if provided
-    if photo:
-        # Validate file type
-        file_extension = os.path.splitext(photo.filename)[1].lower()
-        if file_extension not in ALLOWED_EXTENSIONS:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
-            )
-        
-        # Validate file size
-        if photo.size and photo.size > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB"
-            )
-        
-        # Generate unique filename
-        file_id = str(uuid.uuid4())
-        filename = f"{file_id}{file_extension}"
-        file_path = os.path.join(UPLOAD_DIR, filename)
-        
-        try:
-            # Save file
-            async with aiofiles.open(file_path, 'wb') as f:
-                content = await photo.read()
-                await f.write(content)
-            
-            # Generate URL (in production, this would be a proper URL)
-            photo_url = f"/uploads/{filename}"
-            
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to save photo: {str(e)}"
-            )
-    
-    # Create report data
-    report_data = ClassroomReportCreate(
-        class_id=class_id,
-        is_clean_before=is_clean_before,
-        is_clean_after=is_clean_after,
-        report_text=report_text,
-        photo_url=photo_url
-    )
+    request = job.request
+    first_week, term_start, _ = timetable_term(request)
+    schedules_in = []
+    for week in range(request.weeks):
+        for meeting in job.result["meetings"]:
+            day = (first_week + WEEK * week + timedelta(days=meeting["weekday"])).date()
+            if day < term_start.date():
+                continue
+            schedules_in.append(ScheduleCreate(
+                class_id=meeting["class_id"],
+                start_time=datetime.combine(day, datetime.strptime(meeting["start_time"], "%H:%M").time()),
+                end_time=datetime.combine(day, datetime.strptime(meeting["end_time"], "%H:%M").time()),
+                room_number=meeting["room_number"]
+            ))
     
     try:
-        new_report = create_classroom_report(db, report_in=report_data, reporter_id=current_user.id)
-        return new_report
-    except ValueError as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=str(e)
-        )
+        schedules = create_schedules_batch(db, schedules_in)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to create classroom report: {str(e)}"
+            detail=f"Failed to apply timetable: {str(e)}"
         )
+    
+    job.status = "applied"
+    return {"message": "Timetable applied successfully", "schedules_created": len(schedules)}
 
 
-@app.get("/reports/", response_model=list[ClassroomReportResponse])
-async def get_classroom_reports_endpoint(
-    skip: int = 0,
+# Duplicate photo review (Admin only)
+
+@app.get("/admin/reports/duplicate-photos")
+async def get_duplicate_report_photos_endpoint(
+    max_distance: int = 4,
     limit: int = 100,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Get all classroom reports (Admin and Teacher only)
+    List groups of classroom reports whose photos are near-duplicates (Admin only)
     
-    - **skip**: Number of reports to skip (for pagination)
-    - **limit**: Maximum number of reports to return
+    - **max_distance**: Maximum Hamming distance between photo hashes (0 = identical hash)
+    - **limit**: Maximum number of groups to return (largest groups first)
     
-    Requires authentication and ADMIN or TEACHER role.
+    Each group lists the reports sharing the photo with their class and reporter,
+    so reuse across classes or by different students stands out.
+    
+    Requires authentication and ADMIN role.
     """
-    if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
+    if current_user.role != UserRole.ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to view classroom reports"
+            detail="Not authorized to review classroom report photos"
+        )
+    
+    if max_distance < 0 or max_distance > MAX_DUPLICATE_DISTANCE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"max_distance must be between 0 and {MAX_DUPLICATE_DISTANCE}"
         )
     
     try:
-        reports = get_classroom_reports(db, skip=skip, limit=limit)
-        return reports
+        rows = get_report_photo_hashes(db)
+        report_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        hashes = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+        
+        groups = await asyncio.to_thread(find_near_duplicate_groups, hashes, max_distance)
+        groups.sort(key=len, reverse=True)
+        groups = [report_ids[group].tolist() for group in groups[:limit]]
+        
+        details = {
+            report.id: (report, class_obj, reporter)
+            for report, class_obj, reporter in get_classroom_reports_with_details(db, [rid for group in groups for rid in group])
+        }
+        
+        result = []
+        for group in groups:
+            reports = []
+            for report_id in group:
+                if report_id not in details:
+                    continue
+                report, class_obj, reporter = details[report_id]
+                reports.append({
+                    "report_id": report.id,
+                    "class_id": class_obj.id,
+                    "class_name": class_obj.name,
+                    "reporter_id": reporter.id,
+                    "reporter_username": reporter.username,
+                    "photo_url": report.photo_url,
+                    "created_at": report.created_at
+                })
+            if len(reports) < 2:
+                continue
+            result.append({
+                "report_count": len(reports),
+                "class_count": len({r["class_id"] for r in reports}),
+                "reporter_count": len({r["reporter_id"] for r in reports}),
+                "reports": reports
+            })
+        
+        return {
+            "max_distance": max_distance,
+            "hashed_reports": len(rows),
+            "groups": result
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to fetch classroom reports: {str(e)}"
+            detail=f"Failed to find duplicate photos: {str(e)}"
         )
 
 
-@app.get("/reports/my", response_model=list[ClassroomReportResponse])
-async def get_my_classroom_reports_endpoint(
-    skip: int = 0,
-    limit: int = 100,
+@app.post("/admin/counters/reconcile")
+async def reconcile_counters_endpoint(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Get classroom reports created by the current user (Students only)
+    Recompute the denormalized class and assignment counters from the source tables (Admin only)
     
-    - **skip**: Number of reports to skip (for pagination)
-    - **limit**: Maximum number of reports to return
+    Returns how many classes and assignments had drifted. The same check can be
+    run from the command line with `python counters.py`.
     
-    Requires authentication and STUDENT role.
+    Requires authentication and ADMIN role.
     """
-    if current_user.role != UserRole.STUDENT:
+    if current_user.role != UserRole.ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to view classroom reports"
+            detail="Not authorized to reconcile counters"
         )
     
     try:
-        reports = get_classroom_reports_by_reporter(db, reporter_id=current_user.id, skip=skip, limit=limit)
-        return reports
+        return reconcile_counters(db)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to fetch classroom reports: {str(e)}"
+            detail=f"Failed to reconcile counters: {str(e)}"
         )
 
 
-@app.get("/reports/class/{class_id}", response_model=list[ClassroomReportResponse])
-async def get_classroom_reports_by_class_endpoint(
-    class_id: int,
-    skip: int = 0,
-    limit: int = 100,
+@app.post("/admin/reports/photo-hashes/backfill")
+async def backfill_report_photo_hashes_endpoint(
+    limit: int = 500,
+    after_id: int = 0,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Get classroom reports for a specific class (Admin and Teacher only)
+    Compute photo hashes for reports created before hashing existed (Admin only)
     
-    - **class_id**: ID of the class
-    - **skip**: Number of reports to skip (for pagination)
-    - **limit**: Maximum number of reports to return
+    - **limit**: Maximum number of reports to process in this call
+    - **after_id**: Only process reports with a larger ID (pass back **next_after_id** to continue)
     
-    Requires authentication and ADMIN or TEACHER role.
+    Photos that are missing or cannot be decoded are skipped and counted as failed.
+    
+    Requires authentication and ADMIN role.
     """
-    if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
+    if current_user.role != UserRole.ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to view classroom reports"
+            detail="Not authorized to backfill photo hashes"
         )
     
     try:
-        reports = get_classroom_reports_by_class(db, class_id=class_id, skip=skip, limit=limit)
-        return reports
+        reports = get_reports_missing_photo_hash(db, after_id=after_id, limit=limit)
+        
+        hashed = 0
+        failed = 0
+        for report in reports:
+            photo_path = os.path.join(UPLOAD_DIR, report.photo_url.rsplit("/", 1)[-1])
+            photo_hash = await asyncio.to_thread(try_compute_dhash, photo_path)
+            if photo_hash is None:
+                failed += 1
+                continue
+            report.photo_hash = photo_hash
+            hashed += 1
+        db.commit()
+        
+        return {
+            "hashed": hashed,
+            "failed": failed,
+            "next_after_id": reports[-1].id if reports else None
+        }
     except Exception as e:
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to fetch classroom reports: {str(e)}"
+            detail=f"Failed to backfill photo hashes: {str(e)}"
         )
 
 
@@ -1998,6 +4208,9 @@ async def get_class_by_id(
             "code": class_obj.code,
             "description": class_obj.description,
             "teacher_id": class_obj.teacher_id,
+            "student_count": class_obj.student_count,
+            "assignment_count": class_obj.assignment_count,
+            "submission_count": class_obj.submission_count,
             "created_at": class_obj.created_at
         }
         
@@ -2034,16 +4247,9 @@ async def get_teacher_classes_with_metrics(
         # Get classes assigned to the teacher
         teacher_classes = get_classes_by_teacher(db, teacher_id=current_user.id)
         
-        # Calculate metrics
+        # Calculate metrics from the denormalized class counters
         total_classes = len(teacher_classes)
-        total_students = 0
-        
-        # Count total students across all teacher's classes
-        for class_obj in teacher_classes:
-            student_count = db.query(Enrollment).filter(
-                Enrollment.class_id == class_obj.id
-            ).count()
-            total_students += student_count
+        total_students = sum(class_obj.student_count for class_obj in teacher_classes)
         
         # Convert classes to response format
         class_responses = []
@@ -2052,7 +4258,10 @@ async def get_teacher_classes_with_metrics(
                 'id': class_obj.id,
                 'name': class_obj.name,
                 'code': class_obj.code,
-                'teacher_id': class_obj.teacher_id
+                'teacher_id': class_obj.teacher_id,
+                'student_count': class_obj.student_count,
+                'assignment_count': class_obj.assignment_count,
+                'submission_count': class_obj.submission_count
             }
             class_responses.append(class_dict)
         
@@ -2324,16 +4533,225 @@ async def get_student_assignments(
             detail=f"Failed to fetch student assignments: {str(e)}"
         )
 
+@app.get("/me/calendar")
+async def get_my_calendar(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    since: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get the current user's schedule occurrences in a window, for any role
+    
+    - **start**: Start of the window (defaults to today, 00:00 UTC)
+    - **end**: End of the window (defaults to seven days after start)
+    - **since**: Only return schedules and rules changed after this time (optional);
+      pass the previous response's sync_time to fetch incrementally
+    
+    Students see their enrolled classes, teachers the classes they teach and
+    admins every class. Recurring schedules are expanded into occurrences within
+    the window; occurrences have a rule_id and no id. Incremental fetches return
+    changed entries plus every entry of classes joined since, and "removed" as
+    {"type", "id"}: a schedule, a schedule_rule (drop all its occurrences) or a
+    class (drop everything from it). Occurrences returned for a rule replace all
+    of that rule's occurrences the client holds.
+    
+    Requires authentication.
+    """
+    start = to_naive_utc(start) if start else datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    end = to_naive_utc(end) if end else start + MY_CALENDAR_DEFAULT_WINDOW
+    if end <= start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="End time must be after start time"
+        )
+    if end - start > LIVE_SCHEDULE_MAX_WINDOW:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Time window cannot exceed {LIVE_SCHEDULE_MAX_WINDOW.days} days"
+        )
+    
+    sync_time = datetime.utcnow() - MY_CALENDAR_SINCE_OVERLAP
+    try:
+        schedules = get_user_calendar(db, current_user, start, end, since=since)
+        removed = get_user_calendar_removals(db, current_user, start, end, since) if since else []
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch calendar: {str(e)}"
+        )
+    
+    return {
+        "start": start,
+        "end": end,
+        "since": to_naive_utc(since) if since else None,
+        "sync_time": sync_time,
+        "schedules": schedules,
+        "removed": removed
+    }
+
+
+def encode_sync_cursor(sync_time: datetime) -> str:
+    return base64.urlsafe_b64encode(sync_time.isoformat().encode()).decode().rstrip("=")
+
+
+def decode_sync_cursor(cursor: str) -> datetime:
+    """Raises ValueError for a cursor not issued by encode_sync_cursor"""
+    try:
+        value = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError("Invalid sync cursor")
+    return datetime.fromisoformat(value)
+
+
+@app.get("/me/sync")
+async def sync_my_dashboard(
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get the dashboard rows created, updated or deleted since a sync cursor, for any role
+    
+    - **cursor**: The previous response's cursor; omit for a full sync
+    
+    Returns changed assignments, submissions (with grades), schedules,
+    schedule rules and announcements, plus deleted rows as {"type", "id"}.
+    A deleted "class" means the client should drop everything from that class.
+    Rows may repeat across consecutive syncs, so clients upsert by id. When the
+    cursor is older than the tombstone retention, or omitted, "reset" is true:
+    the response holds the full current state and the client replaces its copy.
+    
+    Requires authentication.
+    """
+    since = None
+    if cursor:
+        try:
+            since = decode_sync_cursor(cursor)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid sync cursor"
+            )
+    
+    now = datetime.utcnow()
+    if since is not None and since < now - SYNC_TOMBSTONE_RETENTION:
+        since = None
+    try:
+        changes = get_sync_changes(db, current_user, since, now)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to sync dashboard: {str(e)}"
+        )
+    
+    return {
+        "cursor": encode_sync_cursor(now - MY_SYNC_CURSOR_OVERLAP),
+        "reset": since is None,
+        "assignments": [AssignmentResponse.model_validate(a) for a in changes["assignments"]],
+        "submissions": [SubmissionResponse.model_validate(s) for s in changes["submissions"]],
+        "schedules": [ScheduleResponse.model_validate(s) for s in changes["schedules"]],
+        "schedule_rules": [ScheduleRuleResponse.model_validate(r) for r in changes["schedule_rules"]],
+        "announcements": [AnnouncementResponse.model_validate(a) for a in changes["announcements"]],
+        "deleted": changes["deleted"]
+    }
+
+
+@app.get("/me/bootstrap")
+async def bootstrap_my_dashboard(
+    request: Request,
+    sections: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get everything the current user's dashboard shows on load, for any role
+    
+    - **sections**: Comma-separated sections to load (optional; defaults to all for the role)
+    
+    Students get classes, assignments, grades, schedules and announcements;
+    teachers classes, assignments, schedules, announcements and metrics; admins
+    classes, schedules, announcements and metrics. The user profile is always
+    included. All sections come in this one response and each carries an ETag; send
+    the ETags you hold in If-None-Match and unchanged sections come back as
+    {"etag", "not_modified": true} without data, or 304 if none changed.
+    
+    Requires authentication.
+    """
+    try:
+        names = select_sections(current_user.role, [name.strip() for name in sections.split(",") if name.strip()] if sections else None)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    known_etags = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",") if tag.strip()]
+    try:
+        payload = load_dashboard(db, current_user, names, known_etags, datetime.utcnow())
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to load dashboard: {str(e)}"
+        )
+    
+    user_data = jsonable_encoder(UserResponse.model_validate(current_user))
+    user_etag = section_etag("user", user_data)
+    payload = {"user": {"etag": user_etag, "not_modified": True} if user_etag in known_etags else {"etag": user_etag, "data": user_data}, **payload}
+    if all(section.get("not_modified") for section in payload.values()):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    return {"role": current_user.role.value, "sections": payload}
+
+
+@app.post("/batch")
+async def batch_requests(
+    batch: BatchRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Run several GET requests in one call
+    
+    - **requests**: Up to 50 sub-requests, each {"id", "path"}; path may include a query string
+    
+    Sub-requests run in order through this API with the caller's credentials,
+    sharing one authentication and one database session. Each result has the
+    sub-request's id, status, content_type and parsed JSON body. A failing
+    sub-request does not fail the batch. Routes that do not answer with JSON
+    (streams, downloads) get 415, responses over 1 MB 413, and a sub-request
+    running over 10 seconds 504, with the rest of the batch not run (503).
+    
+    Requires authentication.
+    """
+    try:
+        results = await run_batch(request.app, request.scope, [sub.dict() for sub in batch.requests], current_user, db)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to run batch: {str(e)}"
+        )
+    
+    return {"responses": results}
+
+
 @app.get("/students/me/schedule")
 async def get_student_schedule(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Get schedule for the current student
     
+    - **start**: Only include schedules ending after this time (optional)
+    - **end**: Only include schedules starting before this time (optional)
+    
     Returns:
-        List of schedules for the student's enrolled classes
+        List of schedules for the student's enrolled classes, with recurring
+        schedules expanded into occurrences within the window
     
     Requires authentication and STUDENT role.
     """
@@ -2344,37 +4762,14 @@ async def get_student_schedule(
             detail="Not authorized to view student schedule"
         )
     
+    if start and end and end <= start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="End time must be after start time"
+        )
+    
     try:
-        # Get classes the student is enrolled in
-        enrollments = db.query(Enrollment).filter(Enrollment.student_id == current_user.id).all()
-        class_ids = [enrollment.class_id for enrollment in enrollments]
-        
-        if not class_ids:
-            return []
-        
-        # Get schedules for those classes
-        schedules = db.query(Schedule).filter(Schedule.class_id.in_(class_ids)).all()
-        
-        # Convert to response format
-        schedule_responses = []
-        for schedule in schedules:
-            # Get class information
-            class_obj = db.query(Class).filter(Class.id == schedule.class_id).first()
-            class_name = class_obj.name if class_obj else f"Class {schedule.class_id}"
-            
-            schedule_response = ScheduleResponse(
-                id=schedule.id,
-                title=schedule.title,
-                description=schedule.description,
-                start_time=schedule.start_time,
-                end_time=schedule.end_time,
-                class_id=schedule.class_id,
-                class_name=class_name,
-                created_at=schedule.created_at
-            )
-            schedule_responses.append(schedule_response)
-        
-        return schedule_responses
+        return get_student_schedule_enriched(db, current_user.id, start=start, end=end)
         
     except Exception as e:
         raise HTTPException(
@@ -2403,35 +4798,7 @@ async def get_student_grades(
         )
     
     try:
-        # Get all submissions for the student
-        submissions = db.query(Submission).filter(Submission.student_id == current_user.id).all()
-        
-        # Convert to response format with assignment and class information
-        grade_responses = []
-        for submission in submissions:
-            # Get assignment information
-            assignment = db.query(Assignment).filter(Assignment.id == submission.assignment_id).first()
-            if not assignment:
-                continue
-                
-            # Get class information
-            class_obj = db.query(Class).filter(Class.id == assignment.class_id).first()
-            class_name = class_obj.name if class_obj else f"Class {assignment.class_id}"
-            
-            grade_response = {
-                "id": submission.id,
-                "assignment_id": submission.assignment_id,
-                "assignment_name": assignment.name,
-                "class_id": assignment.class_id,
-                "class_name": class_name,
-                "grade": submission.grade,
-                "time_spent_minutes": submission.time_spent_minutes,
-                "submitted_at": submission.submitted_at,
-                "is_graded": submission.grade is not None
-            }
-            grade_responses.append(grade_response)
-        
-        return grade_responses
+        return get_grades_for_student(db, current_user.id)
         
     except Exception as e:
         raise HTTPException(
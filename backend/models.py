@@ -1,11 +1,12 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Enum, Text, DateTime, Float, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, Enum, Text, DateTime, Float, Boolean, Index, LargeBinary, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.sqltypes import Enum as SQLEnum
 import enum
-from typing import Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel, validator
-from datetime import datetime
+from datetime import date, datetime, time
 from database import Base
+from recurrence import parse_rrule
 
 class UserRole(enum.Enum):
     ADMIN = "admin"
@@ -26,8 +27,11 @@ class User(Base):
     # Relationships with cascading deletion
     classes_taught = relationship("Class", back_populates="teacher", cascade="all, delete-orphan")
     enrollments = relationship("Enrollment", back_populates="student", cascade="all, delete-orphan")
+    waitlist_entries = relationship("ClassWaitlistEntry", back_populates="student", cascade="all, delete-orphan")
     assignments_created = relationship("Assignment", back_populates="creator", cascade="all, delete-orphan")
     submissions = relationship("Submission", back_populates="student", cascade="all, delete-orphan")
+    upload_sessions = relationship("UploadSession", back_populates="user", cascade="all, delete-orphan")
+    notification_deliveries = relationship("NotificationDelivery", back_populates="user", cascade="all, delete-orphan")
 
 class Class(Base):
     __tablename__ = "classes"
@@ -36,13 +40,21 @@ class Class(Base):
     name = Column(String, unique=True, nullable=False)
     code = Column(String, unique=True, index=True, nullable=False)
     teacher_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    capacity = Column(Integer, nullable=True)  # Seats for self-enrollment and the admin import; None means unlimited
+
+    # Denormalized counts, maintained by counters.py
+    student_count = Column(Integer, nullable=False, default=0, server_default="0")
+    assignment_count = Column(Integer, nullable=False, default=0, server_default="0")
+    submission_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     # Relationships with cascading deletion
     teacher = relationship("User", back_populates="classes_taught")
     enrollments = relationship("Enrollment", back_populates="class_", cascade="all, delete-orphan")
     assignments = relationship("Assignment", back_populates="class_", cascade="all, delete-orphan")
     schedules = relationship("Schedule", back_populates="class_", cascade="all, delete-orphan")
+    schedule_rules = relationship("ScheduleRule", back_populates="class_", cascade="all, delete-orphan")
     classroom_reports = relationship("ClassroomReport", back_populates="class_", cascade="all, delete-orphan")
+    waitlist = relationship("ClassWaitlistEntry", back_populates="class_", cascade="all, delete-orphan")
 
 class Enrollment(Base):
     __tablename__ = "enrollments"
@@ -50,11 +62,35 @@ class Enrollment(Base):
     id = Column(Integer, primary_key=True, index=True)
     class_id = Column(Integer, ForeignKey("classes.id"), nullable=False)
     student_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=func.now(), nullable=False)
 
     # Relationships
     class_ = relationship("Class", back_populates="enrollments")
     student = relationship("User", back_populates="enrollments")
 
+    # Serves per-student class lookups such as the /me/calendar scope; the
+    # unique (class_id, student_id) index is the bulk import's ON CONFLICT target
+    __table_args__ = (
+        Index("ix_enrollments_student_id_class_id", "student_id", "class_id"),
+        Index("uq_enrollments_class_id_student_id", "class_id", "student_id", unique=True),
+    )
+
+class ClassWaitlistEntry(Base):
+    __tablename__ = "class_waitlist"
+
+    id = Column(Integer, primary_key=True, index=True)  # Increasing, so it orders the queue
+    class_id = Column(Integer, ForeignKey("classes.id"), nullable=False)
+    student_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    # Relationships
+    class_ = relationship("Class", back_populates="waitlist")
+    student = relationship("User", back_populates="waitlist_entries")
+
+    __table_args__ = (
+        Index("uq_class_waitlist_class_id_student_id", "class_id", "student_id", unique=True),
+    )
+
 class Assignment(Base):
     __tablename__ = "assignments"
 
@@ -64,6 +100,11 @@ class Assignment(Base):
     class_id = Column(Integer, ForeignKey("classes.id"), nullable=False)
     creator_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
+
+    # Denormalized counts, maintained by counters.py
+    submission_count = Column(Integer, nullable=False, default=0, server_default="0")
+    graded_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     # Relationships with cascading deletion
     class_ = relationship("Class", back_populates="assignments")
@@ -75,6 +116,7 @@ class ClassBase(BaseModel):
     name: str
     code: str
     teacher_id: Optional[int] = None
+    capacity: Optional[int] = None
 
 class ClassCreate(ClassBase):
     @validator('name')
@@ -88,10 +130,29 @@ class ClassCreate(ClassBase):
         if len(v) < 3:
             raise ValueError('Class code must be at least 3 characters long')
         return v.upper()  # Convert to uppercase
+    
+    @validator('capacity')
+    def validate_capacity(cls, v):
+        if v is not None and v < 1:
+            raise ValueError('Capacity must be at least 1')
+        return v
+
+class ClassEnrollRequest(BaseModel):
+    code: str
+
+    @validator('code')
+    def validate_code(cls, v):
+        v = v.strip().upper()  # Codes are stored uppercase
+        if not v:
+            raise ValueError('Class code is required')
+        return v
 
 class ClassResponse(ClassBase):
     id: int
     teacher_id: Optional[int] = None
+    student_count: int = 0
+    assignment_count: int = 0
+    submission_count: int = 0
 
     model_config = {"from_attributes": True}
 
@@ -143,6 +204,8 @@ class AssignmentResponse(AssignmentBase):
     id: int
     creator_id: int
     created_at: datetime
+    submission_count: int = 0
+    graded_count: int = 0
 
     model_config = {"from_attributes": True}
 
@@ -196,6 +259,153 @@ class ScheduleEnrichedResponse(ScheduleBase):
 
     model_config = {"from_attributes": True}
 
+# Pydantic schemas for ScheduleRule (recurring schedules)
+class ScheduleRuleBase(BaseModel):
+    class_id: int
+    start_time: datetime  # Start of the first occurrence
+    end_time: datetime  # End of the first occurrence; sets every occurrence's length
+    room_number: str
+    rrule: str  # e.g. "FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20261218"
+    exdates: List[datetime] = []  # Occurrence starts to skip
+    status: str = "Occupied"
+
+class ScheduleRuleCreate(ScheduleRuleBase):
+    @validator('class_id')
+    def validate_class_id(cls, v):
+        if v <= 0:
+            raise ValueError('Class ID must be a positive integer')
+        return v
+    
+    @validator('room_number')
+    def validate_room_number(cls, v):
+        if not v or len(v.strip()) < 1:
+            raise ValueError('Room number cannot be empty')
+        return v.strip()
+    
+    @validator('status')
+    def validate_status(cls, v):
+        valid_statuses = ['Occupied', 'Clean', 'Needs Cleaning']
+        if v not in valid_statuses:
+            raise ValueError(f'Status must be one of: {", ".join(valid_statuses)}')
+        return v
+    
+    @validator('end_time')
+    def validate_end_time(cls, v, values):
+        if 'start_time' in values and v <= values['start_time']:
+            raise ValueError('End time must be after start time')
+        return v
+    
+    @validator('rrule')
+    def validate_rrule(cls, v):
+        parse_rrule(v)
+        return v.strip()
+
+class ScheduleRuleResponse(ScheduleRuleBase):
+    id: int
+
+    model_config = {"from_attributes": True}
+
+    @validator('exdates', pre=True)
+    def split_exdates(cls, v):
+        # Stored as comma-separated ISO timestamps
+        if isinstance(v, str):
+            return [item for item in v.split(',') if item]
+        return v or []
+
+# Pydantic schemas for timetable generation
+class TimetableClassRequirement(BaseModel):
+    class_id: int
+    meetings_per_week: int
+    slots_per_meeting: int = 1  # Meeting length in grid slots
+
+    @validator('meetings_per_week')
+    def validate_meetings_per_week(cls, v):
+        if not 1 <= v <= 14:
+            raise ValueError('Meetings per week must be between 1 and 14')
+        return v
+
+    @validator('slots_per_meeting')
+    def validate_slots_per_meeting(cls, v):
+        if not 1 <= v <= 8:
+            raise ValueError('Slots per meeting must be between 1 and 8')
+        return v
+
+class TeacherAvailabilityWindow(BaseModel):
+    weekday: int  # 0 = Monday
+    start: time
+    end: time
+
+    @validator('weekday')
+    def validate_weekday(cls, v):
+        if not 0 <= v <= 6:
+            raise ValueError('Weekday must be between 0 (Monday) and 6 (Sunday)')
+        return v
+
+    @validator('end')
+    def validate_end(cls, v, values):
+        if 'start' in values and v <= values['start']:
+            raise ValueError('End time must be after start time')
+        return v
+
+class TimetableJobCreate(BaseModel):
+    term_start: date  # First teaching day; its week is week 0, without the days before it
+    weeks: int = 1  # Calendar weeks of Schedule rows to create when applied, counting week 0
+    rooms: List[str]
+    classes: List[TimetableClassRequirement]
+    teacher_availability: Dict[int, List[TeacherAvailabilityWindow]] = {}  # Teachers not listed are always available
+    days: List[int] = [0, 1, 2, 3, 4]
+    day_start: time = time(8, 0)
+    day_end: time = time(17, 0)
+    slot_minutes: int = 60
+    time_limit_seconds: float = 10
+    seed: Optional[int] = None
+
+    @validator('weeks')
+    def validate_weeks(cls, v):
+        if not 1 <= v <= 26:
+            raise ValueError('Weeks must be between 1 and 26')
+        return v
+
+    @validator('rooms')
+    def validate_rooms(cls, v):
+        rooms = list(dict.fromkeys(room.strip() for room in v if room and room.strip()))
+        if not rooms:
+            raise ValueError('At least one room is required')
+        return rooms
+
+    @validator('classes')
+    def validate_classes(cls, v):
+        if not v:
+            raise ValueError('At least one class is required')
+        if len({requirement.class_id for requirement in v}) != len(v):
+            raise ValueError('Each class can only be listed once')
+        return v
+
+    @validator('days')
+    def validate_days(cls, v):
+        days = sorted(set(v))
+        if not days or any(not 0 <= day <= 6 for day in days):
+            raise ValueError('Days must be weekdays between 0 (Monday) and 6 (Sunday)')
+        return days
+
+    @validator('day_end')
+    def validate_day_end(cls, v, values):
+        if 'day_start' in values and v <= values['day_start']:
+            raise ValueError('Day end must be after day start')
+        return v
+
+    @validator('slot_minutes')
+    def validate_slot_minutes(cls, v):
+        if not 15 <= v <= 240:
+            raise ValueError('Slot length must be between 15 and 240 minutes')
+        return v
+
+    @validator('time_limit_seconds')
+    def validate_time_limit(cls, v):
+        if not 1 <= v <= 120:
+            raise ValueError('Time limit must be between 1 and 120 seconds')
+        return v
+
 # Pydantic schemas for Announcement
 class AnnouncementBase(BaseModel):
     title: str
@@ -258,11 +468,19 @@ class Submission(Base):
     grade = Column(Float, nullable=True)  # For teacher to fill
     time_spent_minutes = Column(Integer, nullable=False)  # Core AI data input for engagement
     submitted_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Bumped on every update
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
 
     # Relationships
     assignment = relationship("Assignment", back_populates="submissions")
     student = relationship("User", back_populates="submissions")
 
+    # One submission per student and assignment; also the ON CONFLICT target
+    __table_args__ = (
+        Index("uq_submissions_assignment_id_student_id", "assignment_id", "student_id", unique=True),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
 class Schedule(Base):
     __tablename__ = "schedules"
 
@@ -272,10 +490,39 @@ class Schedule(Base):
     end_time = Column(DateTime, nullable=False)
     room_number = Column(String, nullable=False)
     status = Column(String, nullable=False, default="Occupied")  # 'Occupied', 'Clean', 'Needs Cleaning'
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
 
     # Relationships
     class_ = relationship("Class", back_populates="schedules")
 
+    # Room lookups for conflict checks; PostgreSQL additionally gets a GiST
+    # exclusion constraint on (room_number, tsrange(start_time, end_time)) via migration.
+    # (start_time, room_number) serves the time-windowed live display,
+    # (end_time, start_time) its "still running at start" bound, and
+    # (class_id, start_time) the per-user calendar.
+    __table_args__ = (
+        Index("ix_schedules_room_number_start_time", "room_number", "start_time"),
+        Index("ix_schedules_start_time_room_number", "start_time", "room_number"),
+        Index("ix_schedules_end_time_start_time", "end_time", "start_time"),
+        Index("ix_schedules_class_id_start_time", "class_id", "start_time"),
+    )
+
+class ScheduleRule(Base):
+    __tablename__ = "schedule_rules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    class_id = Column(Integer, ForeignKey("classes.id"), nullable=False, index=True)
+    start_time = Column(DateTime, nullable=False)  # First occurrence
+    end_time = Column(DateTime, nullable=False)
+    room_number = Column(String, nullable=False)
+    rrule = Column(String, nullable=False)
+    exdates = Column(Text, nullable=False, default="")  # Comma-separated ISO timestamps
+    status = Column(String, nullable=False, default="Occupied")
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
+
+    # Relationships
+    class_ = relationship("Class", back_populates="schedule_rules")
+
 class Announcement(Base):
     __tablename__ = "announcements"
 
@@ -284,6 +531,66 @@ class Announcement(Base):
     content = Column(Text, nullable=False)
     date_posted = Column(DateTime, default=datetime.utcnow, nullable=False)
     is_urgent = Column(Boolean, default=False, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
+
+class NotificationOutbox(Base):
+    __tablename__ = "notification_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    event = Column(String, nullable=False)  # e.g. "urgent_announcement"
+    announcement_id = Column(Integer, nullable=True)
+    payload = Column(Text, nullable=False)  # JSON, as delivered to recipients
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    fanned_out_at = Column(DateTime, nullable=True, index=True)  # Set once a delivery row exists per recipient
+    skipped_recipients = Column(Integer, nullable=True)  # Users left out at fan-out because their username is not an email address
+
+    deliveries = relationship("NotificationDelivery", back_populates="outbox", cascade="all, delete-orphan")
+
+    # One outbox row per announcement, so making it urgent again does not notify everyone twice
+    __table_args__ = (
+        Index("uq_notification_outbox_event_announcement_id", "event", "announcement_id", unique=True),
+    )
+
+class NotificationDelivery(Base):
+    __tablename__ = "notification_deliveries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    outbox_id = Column(Integer, ForeignKey("notification_outbox.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    channel = Column(String, nullable=False)  # "email"
+    status = Column(String, nullable=False, default="pending")  # pending, sending, sent or failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # Retry time, or lease expiry while sending
+    sent_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    outbox = relationship("NotificationOutbox", back_populates="deliveries")
+    user = relationship("User", back_populates="notification_deliveries")
+
+    # One delivery per recipient and channel, so a repeated fan-out adds nothing;
+    # the dispatcher claims due rows by (status, next_attempt_at)
+    __table_args__ = (
+        Index("uq_notification_deliveries_outbox_user_channel", "outbox_id", "user_id", "channel", unique=True),
+        Index("ix_notification_deliveries_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+class LiveEvent(Base):
+    __tablename__ = "live_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    origin = Column(String, nullable=False)  # Worker process that committed it and already pushed it itself
+    payload = Column(Text, nullable=False)  # JSON, as dispatched by live_hub
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+class SyncTombstone(Base):
+    __tablename__ = "sync_tombstones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    entity = Column(String, nullable=False)  # e.g. "assignment", "submission", "enrollment"; see tombstones.py
+    entity_id = Column(Integer, nullable=False)
+    class_id = Column(Integer, nullable=True, index=True)  # Class the deleted row belonged to, if any
+    user_id = Column(Integer, nullable=True, index=True)  # Submission owner, unenrolled student or class teacher
+    deleted_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
 
 class ClassroomReport(Base):
     __tablename__ = "classroom_reports"
@@ -295,8 +602,65 @@ class ClassroomReport(Base):
     is_clean_after = Column(Boolean, nullable=False)
     report_text = Column(Text, nullable=False)
     photo_url = Column(String, nullable=True)  # URL to uploaded photo evidence
+    photo_hash = Column(BigInteger, nullable=True, index=True)  # 64-bit dHash of the photo, for near-duplicate search
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     # Relationships
     class_ = relationship("Class", back_populates="classroom_reports")
-    reporter = relationship("User")
\ No newline at end of file
+    reporter = relationship("User")
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+
+    id = Column(String, primary_key=True, index=True)  # Opaque upload ID handed to the client
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    filename = Column(String, nullable=False)
+    total_size = Column(Integer, nullable=False)
+    received_bytes = Column(Integer, nullable=False, default=0)  # Current committed offset
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    # Relationships
+    user = relationship("User", back_populates="upload_sessions")
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner = Column(String, nullable=False)  # Username of the token the key was sent with
+    key = Column(String, nullable=False)  # Client-chosen Idempotency-Key header value
+    method = Column(String, nullable=False)
+    path = Column(String, nullable=False)
+    request_hash = Column(String, nullable=True)  # SHA-256 of the request body, if fully read
+    status_code = Column(Integer, nullable=True)  # None while the first request is in flight
+    content_type = Column(String, nullable=True)
+    response_body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    __table_args__ = (
+        Index("uq_idempotency_keys_owner_key", "owner", "key", unique=True),
+    )
+
+# Pydantic schemas for resumable uploads
+class UploadSessionCreate(BaseModel):
+    filename: str
+    total_size: int
+
+    @validator('filename')
+    def validate_filename(cls, v):
+        if not v or len(v.strip()) < 1:
+            raise ValueError('Filename cannot be empty')
+        return v.strip()
+
+    @validator('total_size')
+    def validate_total_size(cls, v):
+        if v <= 0:
+            raise ValueError('Total size must be a positive integer')
+        return v
+
+class UploadSessionResponse(BaseModel):
+    upload_id: str
+    filename: str
+    offset: int
+    total_size: int
+    expires_at: datetime
@@ -0,0 +1,345 @@
+"""
+Urgent announcement notifications through a transactional outbox.
+
+create_announcement writes a NotificationOutbox row in the announcement's
+own transaction, so the request only pays for one extra INSERT. A background
+dispatcher then works through the outbox:
+
+1. Fan-out: one INSERT ... SELECT creates a pending email delivery per
+   recipient. Users have no separate email address, so the recipients are
+   the users whose username is an email address (contains "@"); everyone
+   else gets no email, and how many were skipped is logged and kept in
+   NotificationOutbox.skipped_recipients. The unique (outbox_id, user_id,
+   channel) index makes a repeated fan-out after a crash add nothing.
+2. Delivery: due deliveries are claimed DELIVERY_CHUNK_SIZE at a time by a
+   conditional UPDATE that leases them for DELIVERY_LEASE, so concurrent
+   workers never claim the same row. Each chunk is sent over one SMTP
+   connection and recorded in one transaction. Failures are retried with
+   exponential backoff up to MAX_DELIVERY_ATTEMPTS. A slow SMTP server
+   cannot outlast the lease: sending stops while MAX_SEND_SECONDS of it are
+   left and the unsent deliveries are handed back without using up an
+   attempt, so no other worker re-claims a chunk that is still being sent.
+   A worker that dies mid-chunk leaves its lease to expire and the chunk is
+   retried, so at most one chunk per crash can be sent twice; the Message-ID
+   is stable per delivery so mail clients can drop such repeats.
+
+Every worker also polls the outbox for new urgent announcements and pushes
+them to its live WebSocket and SSE subscribers.
+
+Fanned-out outbox rows and their deliveries are pruned after
+NOTIFICATION_RETENTION by sweep_notifications.
+"""
+import json
+import os
+import smtplib
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, literal, select, update
+from sqlalchemy.orm import Session
+
+from crud import dialect_insert
+from database import SessionLocal
+from live_hub import live_hub
+from models import NotificationDelivery, NotificationOutbox, User
+
+# Local SMTP stand-in by default, e.g. `python -m aiosmtpd -n -l localhost:1025`
+SMTP_HOST = os.environ.get("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "1025"))
+SMTP_SENDER = os.environ.get("SMTP_SENDER", "ClassTrack <no-reply@classtrack.edu>")
+SMTP_TIMEOUT_SECONDS = 10
+# Longest one send can take: MAIL, RCPT, DATA, the message and QUIT each wait up to the timeout
+MAX_SEND_SECONDS = 5 * SMTP_TIMEOUT_SECONDS
+
+FAN_OUT_BATCH_SIZE = 10
+DELIVERY_CHUNK_SIZE = 200
+MAX_CHUNKS_PER_RUN = 50
+MAX_DELIVERY_ATTEMPTS = 5
+DELIVERY_RETRY_BASE = timedelta(minutes=1)
+DELIVERY_LEASE = timedelta(minutes=5)
+
+# Outbox rows can commit out of ID order, so the relay re-reads this far back
+URGENT_RELAY_LOOKBACK = timedelta(minutes=1)
+
+# Outbox rows and their deliveries are kept this long, well past the last retry
+NOTIFICATION_RETENTION = timedelta(days=30)
+
+# Email goes to users whose username is an email address
+EMAIL_RECIPIENT = User.username.contains("@", autoescape=True)
+
+
+def fan_out_outbox(db: Session, now: datetime) -> int:
+    """
+    Create a pending email delivery per recipient for outbox rows not yet fanned out.
+
+    Only users whose username is an email address are recipients. The number
+    of users skipped is printed and stored on the outbox row.
+
+    Args:
+        db: Database session
+        now: Current time; deliveries are due immediately
+
+    Returns:
+        int: Number of deliveries created
+    """
+    created = 0
+    pending = (
+        db.query(NotificationOutbox)
+        .filter(NotificationOutbox.fanned_out_at.is_(None))
+        .order_by(NotificationOutbox.id)
+        .limit(FAN_OUT_BATCH_SIZE)
+        .all()
+    )
+    for outbox in pending:
+        outbox_id = outbox.id
+        recipients = select(
+            literal(outbox_id), User.id, literal("email"), literal("pending"), literal(0), literal(now)
+        ).where(EMAIL_RECIPIENT)
+        try:
+            created += db.execute(
+                dialect_insert(db, NotificationDelivery)
+                .from_select(["outbox_id", "user_id", "channel", "status", "attempts", "next_attempt_at"], recipients)
+                .on_conflict_do_nothing(index_elements=["outbox_id", "user_id", "channel"])
+            ).rowcount
+            skipped = db.scalar(select(func.count(User.id)).where(~EMAIL_RECIPIENT))
+            outbox.skipped_recipients = skipped
+            outbox.fanned_out_at = now
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        if skipped:
+            print(f"Notification outbox {outbox_id}: skipped {skipped} user(s) without an email username")
+    return created
+
+
+def claim_deliveries(db: Session, now: datetime, limit: int = DELIVERY_CHUNK_SIZE) -> List[int]:
+    """
+    Lease due deliveries: pending ones whose retry time has come and sending
+    ones whose lease expired.
+
+    Args:
+        db: Database session
+        now: Current time
+        limit: Maximum number of deliveries to claim
+
+    Returns:
+        List[int]: IDs of the claimed deliveries
+    """
+    due = (
+        NotificationDelivery.status.in_(("pending", "sending")),
+        NotificationDelivery.next_attempt_at <= now
+    )
+    candidates = select(NotificationDelivery.id).where(*due).order_by(NotificationDelivery.id).limit(limit)
+    try:
+        # Re-checking the due condition in the UPDATE keeps a row from being claimed twice
+        claimed = db.execute(
+            update(NotificationDelivery)
+            .where(NotificationDelivery.id.in_(candidates.scalar_subquery()), *due)
+            .values(status="sending", attempts=NotificationDelivery.attempts + 1, next_attempt_at=now + DELIVERY_LEASE)
+            .returning(NotificationDelivery.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        db.commit()
+        return claimed
+    except Exception:
+        db.rollback()
+        raise
+
+
+def finish_deliveries(db: Session, sent_ids: List[int], failures: List[Tuple[int, int, str]], now: datetime, released: List[int] = ()):
+    """
+    Record the outcome of a claimed chunk.
+
+    Args:
+        db: Database session
+        sent_ids: Deliveries that were sent
+        failures: (delivery ID, attempts so far, error) for deliveries that failed
+        now: Current time
+        released: Deliveries not attempted before the lease ran short; due again
+            at once, and their claim does not count as an attempt
+    """
+    try:
+        if released:
+            db.execute(
+                update(NotificationDelivery)
+                .where(NotificationDelivery.id.in_(released))
+                .values(status="pending", attempts=NotificationDelivery.attempts - 1, next_attempt_at=now)
+                .execution_options(synchronize_session=False)
+            )
+        if sent_ids:
+            db.execute(
+                update(NotificationDelivery)
+                .where(NotificationDelivery.id.in_(sent_ids))
+                .values(status="sent", sent_at=now, last_error=None)
+                .execution_options(synchronize_session=False)
+            )
+        for delivery_id, attempts, error in failures:
+            exhausted = attempts >= MAX_DELIVERY_ATTEMPTS
+            db.execute(
+                update(NotificationDelivery)
+                .where(NotificationDelivery.id == delivery_id)
+                .values(
+                    status="failed" if exhausted else "pending",
+                    next_attempt_at=now + DELIVERY_RETRY_BASE * (2 ** (attempts - 1)),
+                    last_error=error[:1000]
+                )
+                .execution_options(synchronize_session=False)
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def build_email(recipient: str, delivery_id: int, payload: dict) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = SMTP_SENDER
+    message["To"] = recipient
+    message["Subject"] = f"[Urgent] {payload['title']}"
+    message["Message-ID"] = f"<notification-{delivery_id}@classtrack.edu>"
+    message.set_content(payload["content"])
+    return message
+
+
+def deliver_chunk(db: Session, delivery_ids: List[int], now: datetime) -> int:
+    """
+    Send claimed email deliveries over one SMTP connection, within their lease.
+
+    Args:
+        db: Database session
+        delivery_ids: Claimed delivery IDs
+        now: Time of the claim, when the lease started
+
+    Returns:
+        int: Number of emails sent
+    """
+    rows = (
+        db.query(NotificationDelivery.id, NotificationDelivery.attempts, User.username, NotificationOutbox.payload)
+        .join(User, User.id == NotificationDelivery.user_id)
+        .join(NotificationOutbox, NotificationOutbox.id == NotificationDelivery.outbox_id)
+        .filter(NotificationDelivery.id.in_(delivery_ids))
+        .order_by(NotificationDelivery.id)
+        .all()
+    )
+    db.rollback()  # End the read transaction while talking to the SMTP server
+
+    # Once the lease expires another worker may claim these rows, so every send must finish before it
+    send_until = time.monotonic() + (now + DELIVERY_LEASE - datetime.utcnow()).total_seconds() - MAX_SEND_SECONDS
+    sent_ids = []
+    failures = []
+    released = []
+    try:
+        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT_SECONDS) as smtp:
+            for delivery_id, attempts, recipient, payload in rows:
+                if time.monotonic() >= send_until:
+                    released.append(delivery_id)
+                    continue
+                try:
+                    smtp.send_message(build_email(recipient, delivery_id, json.loads(payload)))
+                    sent_ids.append(delivery_id)
+                except smtplib.SMTPRecipientsRefused as e:
+                    failures.append((delivery_id, MAX_DELIVERY_ATTEMPTS, str(e)))
+                except smtplib.SMTPResponseException as e:
+                    failures.append((delivery_id, attempts, str(e)))
+    except (OSError, smtplib.SMTPException) as e:
+        # Connection lost; whatever was not sent is retried later
+        done = set(sent_ids) | {failure[0] for failure in failures} | set(released)
+        failures.extend((delivery_id, attempts, str(e)) for delivery_id, attempts, _, _ in rows if delivery_id not in done)
+
+    finish_deliveries(db, sent_ids, failures, datetime.utcnow(), released)
+    return len(sent_ids)
+
+
+def dispatch_notifications() -> int:
+    """Fan out new outbox rows and send due deliveries; returns how many were sent"""
+    db = SessionLocal()
+    try:
+        fan_out_outbox(db, datetime.utcnow())
+        sent = 0
+        for _ in range(MAX_CHUNKS_PER_RUN):
+            now = datetime.utcnow()
+            claimed = claim_deliveries(db, now)
+            if not claimed:
+                break
+            sent += deliver_chunk(db, claimed, now)
+        return sent
+    finally:
+        db.close()
+
+
+def delete_expired_notifications(db: Session, created_before: datetime) -> int:
+    """
+    Delete fanned-out outbox rows created before a cutoff, with their deliveries.
+
+    Args:
+        db: Database session
+        created_before: Remove outbox rows older than this time
+
+    Returns:
+        int: Number of outbox rows removed
+    """
+    expired = select(NotificationOutbox.id).where(
+        NotificationOutbox.created_at < created_before,
+        NotificationOutbox.fanned_out_at.isnot(None)
+    )
+    try:
+        db.query(NotificationDelivery).filter(
+            NotificationDelivery.outbox_id.in_(expired.scalar_subquery())
+        ).delete(synchronize_session=False)
+        removed = db.query(NotificationOutbox).filter(
+            NotificationOutbox.id.in_(expired.scalar_subquery())
+        ).delete(synchronize_session=False)
+        db.commit()
+        return removed
+    except Exception:
+        db.rollback()
+        raise
+
+
+def sweep_notifications() -> int:
+    """Delete outbox rows past NOTIFICATION_RETENTION; returns how many were removed"""
+    db = SessionLocal()
+    try:
+        return delete_expired_notifications(db, datetime.utcnow() - NOTIFICATION_RETENTION)
+    finally:
+        db.close()
+
+
+class UrgentAnnouncementRelay:
+    """Pushes urgent announcements from the outbox to this worker's live subscribers"""
+
+    def __init__(self):
+        self._seen: Dict[int, datetime] = {}
+        self._started = False
+
+    def poll(self) -> int:
+        """Publish urgent outbox rows not seen before; returns how many"""
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(NotificationOutbox.id, NotificationOutbox.payload, NotificationOutbox.created_at)
+                .filter(NotificationOutbox.event == "urgent_announcement", NotificationOutbox.created_at > now - URGENT_RELAY_LOOKBACK)
+                .order_by(NotificationOutbox.id)
+                .all()
+            )
+        finally:
+            db.close()
+
+        new_rows = [row for row in rows if row.id not in self._seen]
+        for row in new_rows:
+            self._seen[row.id] = row.created_at
+        self._seen = {outbox_id: created_at for outbox_id, created_at in self._seen.items() if created_at > now - 2 * URGENT_RELAY_LOOKBACK}
+        if not self._started:
+            # Rows from before startup were pushed by whoever was running then
+            self._started = True
+            return 0
+        if new_rows:
+            live_hub.publish([{"type": "urgent_announcement", "announcement": json.loads(row.payload)} for row in new_rows])
+        return len(new_rows)
+
+
+urgent_relay = UrgentAnnouncementRelay()
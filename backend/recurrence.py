@@ -0,0 +1,179 @@
+"""
+Recurrence rules for schedules.
+
+Supports the subset of RFC 5545 RRULE that timetables need:
+FREQ=DAILY|WEEKLY with INTERVAL, BYDAY, and either UNTIL or COUNT.
+Exception dates are applied on top. Occurrences are generated lazily and
+only for the requested window; expanded windows are kept in a bounded LRU
+cache keyed by the rule's full definition, so editing a rule never serves
+stale occurrences.
+"""
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Iterator, NamedTuple, Optional, Tuple
+
+EXPANSION_CACHE_SIZE = 1024
+MAX_RULE_COUNT = 1000
+
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+
+class RecurrenceRule(NamedTuple):
+    freq: str
+    interval: int
+    byday: Tuple[int, ...]
+    until: Optional[datetime]
+    count: Optional[int]
+
+
+def _parse_until(value: str) -> datetime:
+    value = value.rstrip("Z")
+    for fmt in ("%Y%m%dT%H%M%S", "%Y%m%d"):
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        # A date-only UNTIL includes the whole day
+        return parsed if fmt != "%Y%m%d" else datetime.combine(parsed.date(), time.max)
+    raise ValueError(f"Invalid UNTIL value: {value}")
+
+
+@lru_cache(maxsize=256)
+def parse_rrule(text: str, strict: bool = True) -> RecurrenceRule:
+    """
+    Parse an RRULE string such as ``FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20261218``.
+
+    ``strict=False`` skips the checks added after rules were first stored, so
+    rules saved before them can still be expanded and exported.
+
+    Raises:
+        ValueError: If the rule is malformed or uses unsupported parts
+    """
+    text = text.strip()
+    if text.upper().startswith("RRULE:"):
+        text = text[len("RRULE:"):]
+
+    parts = {}
+    for part in filter(None, text.split(";")):
+        key, separator, value = part.partition("=")
+        if not separator or not value:
+            raise ValueError(f"Invalid RRULE part: {part}")
+        parts[key.strip().upper()] = value.strip().upper()
+
+    unsupported = set(parts) - {"FREQ", "INTERVAL", "BYDAY", "UNTIL", "COUNT"}
+    if unsupported:
+        raise ValueError(f"Unsupported RRULE parts: {', '.join(sorted(unsupported))}")
+
+    freq = parts.get("FREQ")
+    if freq not in ("DAILY", "WEEKLY"):
+        raise ValueError("RRULE FREQ must be DAILY or WEEKLY")
+
+    try:
+        interval = int(parts.get("INTERVAL", "1"))
+        count = int(parts["COUNT"]) if "COUNT" in parts else None
+    except ValueError:
+        raise ValueError("RRULE INTERVAL and COUNT must be integers")
+    if interval < 1:
+        raise ValueError("RRULE INTERVAL must be at least 1")
+    if count is not None and not 1 <= count <= MAX_RULE_COUNT:
+        raise ValueError(f"RRULE COUNT must be between 1 and {MAX_RULE_COUNT}")
+
+    until = _parse_until(parts["UNTIL"]) if "UNTIL" in parts else None
+    if until is not None and count is not None:
+        raise ValueError("RRULE cannot have both UNTIL and COUNT")
+
+    byday = ()
+    if "BYDAY" in parts:
+        try:
+            byday = tuple(sorted({WEEKDAYS.index(day) for day in parts["BYDAY"].split(",")}))
+        except ValueError:
+            raise ValueError(f"RRULE BYDAY must use {', '.join(WEEKDAYS)}")
+    if strict and freq == "DAILY" and byday and interval % 7 == 0:
+        # Every occurrence falls on DTSTART's weekday, so BYDAY either repeats it or never matches
+        raise ValueError("RRULE with FREQ=DAILY and BYDAY cannot have an INTERVAL that is a multiple of 7; use FREQ=WEEKLY")
+
+    return RecurrenceRule(freq, interval, byday, until, count)
+
+
+def format_rrule(text: str) -> str:
+    """
+    Render a stored rule as an iCalendar RRULE value.
+
+    UNTIL is written as a UTC date-time, as RFC 5545 requires when DTSTART is one.
+    """
+    rule = parse_rrule(text, strict=False)
+    parts = [f"FREQ={rule.freq}"]
+    if rule.interval != 1:
+        parts.append(f"INTERVAL={rule.interval}")
+    if rule.byday:
+        parts.append("BYDAY=" + ",".join(WEEKDAYS[day] for day in rule.byday))
+    if rule.until is not None:
+        parts.append("UNTIL=" + rule.until.strftime("%Y%m%dT%H%M%SZ"))
+    if rule.count is not None:
+        parts.append(f"COUNT={rule.count}")
+    return ";".join(parts)
+
+
+def iter_occurrences(rule: RecurrenceRule, dtstart: datetime, duration: timedelta, window_start: datetime, window_end: datetime) -> Iterator[datetime]:
+    """
+    Yield the start of every occurrence that overlaps [window_start, window_end).
+
+    Without COUNT the iteration jumps straight to the period containing the
+    window, so cost depends on the window size, not on how far it is from
+    ``dtstart``. With COUNT every earlier occurrence has to be counted, which
+    MAX_RULE_COUNT bounds.
+    """
+    if rule.freq == "WEEKLY":
+        period_start = dtstart.date() - timedelta(days=dtstart.weekday())
+        period = timedelta(weeks=rule.interval)
+        offsets = rule.byday or (dtstart.weekday(),)
+    else:
+        period_start = dtstart.date()
+        period = timedelta(days=rule.interval)
+        offsets = (0,)
+
+    first_period = 0
+    if rule.count is None:
+        # An occurrence starting before window_start - duration cannot reach the window
+        earliest = (window_start - duration).date()
+        first_period = max(0, (earliest - period_start).days // period.days)
+
+    seen = 0
+    start_time = dtstart.time()
+    period_index = first_period
+    while True:
+        day_zero: date = period_start + period * period_index
+        for offset in offsets:
+            day = day_zero + timedelta(days=offset)
+            occurrence = datetime.combine(day, start_time)
+            # Bounds come before any skip, so days BYDAY filters out still end the iteration
+            if rule.until is not None and occurrence > rule.until:
+                return
+            if occurrence >= window_end:
+                return
+            if rule.freq == "DAILY" and rule.byday and day.weekday() not in rule.byday:
+                continue
+            if occurrence < dtstart:
+                continue
+            seen += 1
+            if rule.count is not None and seen > rule.count:
+                return
+            if occurrence + duration > window_start:
+                yield occurrence
+        period_index += 1
+
+
+@lru_cache(maxsize=EXPANSION_CACHE_SIZE)
+def expand_occurrences(rrule: str, dtstart: datetime, duration: timedelta, exdates: Tuple[datetime, ...], window_start: datetime, window_end: datetime) -> Tuple[datetime, ...]:
+    """
+    Occurrence starts of a rule within a window, minus its exception dates.
+
+    Every argument is part of the cache key, so a changed rule or window is
+    simply a different entry; least recently used windows are evicted.
+    """
+    excluded = set(exdates)
+    return tuple(
+        occurrence
+        for occurrence in iter_occurrences(parse_rrule(rrule, strict=False), dtstart, duration, window_start, window_end)
+        if occurrence not in excluded
+    )
@@ -0,0 +1,255 @@
+"""
+Room utilization analytics.
+
+Bookings (single schedules plus recurring occurrences) are swept per room
+and ISO week with NumPy: start/end events are sorted once, a cumulative sum
+gives the concurrency level between events, and integrating the "in use"
+step function at hour boundaries yields occupancy per hour of the week.
+Cleanliness reports are attributed to the room their class was booked in
+when the report was filed.
+
+Results are cached per (room, week) and reused until schedules or reports
+change, so re-running a term report only computes weeks that moved.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+import change_tracking
+
+WEEK = timedelta(weeks=1)
+WEEK_SECONDS = int(WEEK.total_seconds())
+HOURS_PER_WEEK = 7 * 24
+DAY_SECONDS = 24 * 60 * 60
+
+# A report counts for the booking it was filed in, or one that ended up to this long before
+REPORT_ATTRIBUTION_WINDOW = timedelta(hours=2)
+
+USAGE_CACHE_SIZE = 4096
+USAGE_CACHE_MAX_AGE_SECONDS = 300  # Bounds staleness from writes made by other worker processes
+
+
+class RoomWeekUsage(NamedTuple):
+    occupied_seconds: np.ndarray  # Seconds in use for each of the 168 hours of the week
+    booking_count: int
+    peak_concurrency: int
+    gap_minutes: np.ndarray  # Same-day turnaround gaps between bookings
+    report_count: int
+    clean_before: int
+    clean_after: int
+    left_dirty: int  # Clean before use but not after
+
+
+def week_start(value: datetime) -> datetime:
+    """Monday 00:00 of the week containing value"""
+    return datetime.combine(value.date() - timedelta(days=value.weekday()), datetime.min.time())
+
+
+def sweep_intervals(starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, int, np.ndarray]:
+    """
+    Sweep one room-week of intervals given as seconds from the week start.
+
+    Returns:
+        Tuple of occupied seconds per hour of the week, peak concurrency,
+        and same-day gaps (minutes) between consecutive busy periods
+    """
+    if len(starts) == 0:
+        return np.zeros(HOURS_PER_WEEK), 0, np.empty(0)
+
+    times = np.concatenate([starts, ends])
+    deltas = np.concatenate([np.ones(len(starts)), -np.ones(len(ends))])
+    # At equal times apply ends before starts, so back-to-back bookings never count as concurrent
+    order = np.lexsort((deltas, times))
+    times, deltas = times[order], deltas[order]
+    level = np.cumsum(deltas)
+    peak = int(level.max())
+
+    in_use = np.minimum(level[:-1], 1)
+    integral = np.concatenate([[0.0], np.cumsum(in_use * np.diff(times))])
+    edges = np.arange(HOURS_PER_WEEK + 1) * 3600.0
+    occupied = np.diff(np.interp(edges, times, integral))
+
+    # A gap opens wherever a start comes after every earlier booking has ended
+    order = np.argsort(starts, kind="stable")
+    sorted_starts = starts[order]
+    busy_until = np.maximum.accumulate(ends[order])
+    gap_seconds = sorted_starts[1:] - busy_until[:-1]
+    same_day = (busy_until[:-1] // DAY_SECONDS) == (sorted_starts[1:] // DAY_SECONDS)
+    gaps = gap_seconds[(gap_seconds > 0) & same_day] / 60.0
+    return occupied, peak, gaps
+
+
+def attribute_reports(booking_class: np.ndarray, booking_start: np.ndarray, booking_end: np.ndarray, report_class: np.ndarray, report_time: np.ndarray) -> np.ndarray:
+    """
+    Index of the booking each report belongs to, or -1.
+
+    That is the latest booking of the report's class that started at or before
+    the report and ended no more than REPORT_ATTRIBUTION_WINDOW before it.
+    Bookings and reports are matched in one searchsorted over (class, start) keys.
+    """
+    if len(booking_class) == 0 or len(report_class) == 0:
+        return np.full(len(report_class), -1)
+
+    order = np.lexsort((booking_start, booking_class))
+    booking_keys = (booking_class[order] << 34) + booking_start[order]
+    report_keys = (report_class << 34) + report_time
+    position = np.searchsorted(booking_keys, report_keys, side="right") - 1
+
+    clipped = np.clip(position, 0, None)
+    matched = order[clipped]
+    valid = (
+        (position >= 0)
+        & (booking_class[matched] == report_class)
+        & (report_time <= booking_end[matched] + int(REPORT_ATTRIBUTION_WINDOW.total_seconds()))
+    )
+    return np.where(valid, matched, -1)
+
+
+def compute_room_weeks(bookings: Sequence[Tuple[str, int, datetime, datetime]], reports: Sequence[Tuple[int, datetime, bool, bool]], weeks: List[datetime], rooms: Iterable[str]) -> Dict[Tuple[str, datetime], RoomWeekUsage]:
+    """
+    Compute usage for every (room, week) pair.
+
+    Args:
+        bookings: (room_number, class_id, start_time, end_time) rows overlapping the weeks
+        reports: (class_id, created_at, is_clean_before, is_clean_after) rows filed in the weeks
+        weeks: Week starts (Mondays) to compute
+        rooms: Rooms to compute, including ones with no bookings
+
+    Returns:
+        Dict mapping (room_number, week_start) to its usage
+    """
+    origin = weeks[0] - WEEK  # Keeps every relative time positive
+    room_names = sorted(set(rooms))
+    room_ids = {room: index for index, room in enumerate(room_names)}
+
+    bookings = [booking for booking in bookings if booking[0] in room_ids]
+    booking_room = np.array([room_ids[booking[0]] for booking in bookings], dtype=np.int64)
+    booking_class = np.array([booking[1] for booking in bookings], dtype=np.int64)
+    booking_start = np.array([(booking[2] - origin).total_seconds() for booking in bookings], dtype=np.int64)
+    booking_end = np.array([(booking[3] - origin).total_seconds() for booking in bookings], dtype=np.int64)
+
+    report_class = np.array([report[0] for report in reports], dtype=np.int64)
+    report_time = np.array([(report[1] - origin).total_seconds() for report in reports], dtype=np.int64)
+    report_before = np.array([report[2] for report in reports], dtype=bool)
+    report_after = np.array([report[3] for report in reports], dtype=bool)
+    report_booking = attribute_reports(booking_class, booking_start, booking_end, report_class, report_time)
+    attributed = report_booking >= 0
+    report_room = booking_room[report_booking[attributed]] if attributed.any() else np.empty(0, dtype=np.int64)
+    report_week = report_time[attributed] // WEEK_SECONDS
+    report_before, report_after = report_before[attributed], report_after[attributed]
+
+    results = {}
+    for week in weeks:
+        week_offset = int((week - origin).total_seconds())
+        week_index = week_offset // WEEK_SECONDS
+        in_week = (booking_start < week_offset + WEEK_SECONDS) & (booking_end > week_offset)
+        for room, room_id in room_ids.items():
+            selected = in_week & (booking_room == room_id)
+            starts = np.clip(booking_start[selected] - week_offset, 0, WEEK_SECONDS).astype(float)
+            ends = np.clip(booking_end[selected] - week_offset, 0, WEEK_SECONDS).astype(float)
+            occupied, peak, gaps = sweep_intervals(starts, ends)
+
+            room_reports = (report_room == room_id) & (report_week == week_index)
+            before, after = report_before[room_reports], report_after[room_reports]
+            results[(room, week)] = RoomWeekUsage(
+                occupied_seconds=occupied,
+                booking_count=int(selected.sum()),
+                peak_concurrency=peak,
+                gap_minutes=gaps,
+                report_count=int(room_reports.sum()),
+                clean_before=int(before.sum()),
+                clean_after=int(after.sum()),
+                left_dirty=int((before & ~after).sum())
+            )
+    return results
+
+
+class RoomUsageCache:
+    """Bounded LRU of RoomWeekUsage keyed by (room, week), tagged with the data generations"""
+
+    def __init__(self, max_size: int = USAGE_CACHE_SIZE):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, datetime], Tuple[Tuple[int, int], float, RoomWeekUsage]]" = OrderedDict()
+        self.max_size = max_size
+
+    def get_many(self, keys: List[Tuple[str, datetime]], generations: Tuple[int, int], now: float) -> Dict[Tuple[str, datetime], RoomWeekUsage]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry and entry[0] == generations and now - entry[1] < USAGE_CACHE_MAX_AGE_SECONDS:
+                    self._entries.move_to_end(key)
+                    found[key] = entry[2]
+        return found
+
+    def put_many(self, usage: Dict[Tuple[str, datetime], RoomWeekUsage], generations: Tuple[int, int], now: float):
+        with self._lock:
+            for key, value in usage.items():
+                self._entries[key] = (generations, now, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+usage_cache = RoomUsageCache()
+
+
+def summarize_room(room_number: str, usages: List[RoomWeekUsage]) -> dict:
+    """Combine a room's weekly usage into one report"""
+    occupied = np.sum([usage.occupied_seconds for usage in usages], axis=0)
+    hourly = occupied / (3600.0 * len(usages))
+    gaps = np.concatenate([usage.gap_minutes for usage in usages])
+    report_count = sum(usage.report_count for usage in usages)
+
+    return {
+        "room_number": room_number,
+        "utilization": round(float(occupied.sum()) / (WEEK_SECONDS * len(usages)), 4),
+        "booked_hours": round(float(occupied.sum()) / 3600.0, 2),
+        "booking_count": sum(usage.booking_count for usage in usages),
+        "peak_concurrency": max(usage.peak_concurrency for usage in usages),
+        # hourly_utilization[weekday][hour], Monday first, averaged over the weeks
+        "hourly_utilization": np.round(hourly.reshape(7, 24), 3).tolist(),
+        "turnaround_minutes": {
+            "count": int(len(gaps)),
+            "min": round(float(gaps.min()), 1) if len(gaps) else None,
+            "median": round(float(np.median(gaps)), 1) if len(gaps) else None,
+            "mean": round(float(gaps.mean()), 1) if len(gaps) else None
+        },
+        "cleanliness": {
+            "report_count": report_count,
+            "clean_before_rate": round(sum(usage.clean_before for usage in usages) / report_count, 3) if report_count else None,
+            "clean_after_rate": round(sum(usage.clean_after for usage in usages) / report_count, 3) if report_count else None,
+            "left_dirty": sum(usage.left_dirty for usage in usages)
+        }
+    }
+
+
+def get_room_utilization(rooms: List[str], weeks: List[datetime], load_usage_data: Callable[[datetime, datetime], Tuple[list, list]]) -> List[dict]:
+    """
+    Utilization report per room over whole weeks, computing only uncached room-weeks.
+
+    Args:
+        rooms: Rooms to report on
+        weeks: Week starts (Mondays) covered by the report
+        load_usage_data: Loads (bookings, reports) for [start, end); only called on a cache miss
+
+    Returns:
+        List[dict]: One summary per room
+    """
+    now = time.monotonic()
+    generations = (change_tracking.generation("schedules"), change_tracking.generation("reports"))
+    keys = [(room, week) for room in rooms for week in weeks]
+    usage = usage_cache.get_many(keys, generations, now)
+
+    missing_weeks = sorted({week for room, week in keys if (room, week) not in usage})
+    if missing_weeks:
+        bookings, reports = load_usage_data(missing_weeks[0], missing_weeks[-1] + WEEK)
+        computed = compute_room_weeks(bookings, reports, missing_weeks, rooms)
+        usage_cache.put_many(computed, generations, now)
+        usage.update(computed)
+
+    return [summarize_room(room, [usage[(room, week)] for week in weeks]) for room in rooms]
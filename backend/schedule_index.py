@@ -0,0 +1,242 @@
+"""
+In-memory per-room interval index for schedule conflict checks.
+
+Postgres enforces non-overlapping room bookings with a GiST exclusion
+constraint on tsrange(start_time, end_time). SQLite has no range index, so
+each room's bookings are kept here as a list sorted by start time; an overlap
+query bisects to the only window that can intersect the requested range
+instead of scanning the room's whole term.
+
+The same index answers availability queries. Each room also keeps its
+bookings merged into disjoint busy blocks plus a max segment tree over the
+gaps between them, so "is this range free" is one bisect and "next free slot
+of length N" is a bisect plus one tree descent.
+"""
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    """Normalize a datetime to the naive UTC form stored in the database"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class _MaxSegmentTree:
+    """Max segment tree over gap lengths, searchable for the first gap >= a threshold"""
+
+    def __init__(self, values: List[float]):
+        self.size = 1
+        while self.size < max(len(values), 1):
+            self.size *= 2
+        self.tree = [float("-inf")] * (2 * self.size)
+        self.tree[self.size:self.size + len(values)] = values
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def first_at_least(self, low: int, threshold: float) -> Optional[int]:
+        """Smallest index >= low whose value is >= threshold"""
+        return self._search(1, 0, self.size, low, threshold)
+
+    def _search(self, node: int, node_low: int, node_high: int, low: int, threshold: float) -> Optional[int]:
+        if node_high <= low or self.tree[node] < threshold:
+            return None
+        if node_high - node_low == 1:
+            return node_low
+        middle = (node_low + node_high) // 2
+        found = self._search(2 * node, node_low, middle, low, threshold)
+        if found is None:
+            found = self._search(2 * node + 1, middle, node_high, low, threshold)
+        return found
+
+
+class _RoomBookings:
+    """Bookings for one room, sorted by (start, schedule_id)"""
+
+    def __init__(self):
+        self.entries: List[Tuple[datetime, int, datetime]] = []
+        self.max_duration = timedelta(0)
+        # Disjoint busy blocks (sorted) and the gaps between them
+        self.busy_starts: List[datetime] = []
+        self.busy_ends: List[datetime] = []
+        self._gaps: Optional[_MaxSegmentTree] = None
+
+    def add(self, schedule_id: int, start: datetime, end: datetime):
+        insort(self.entries, (start, schedule_id, end))
+        self.max_duration = max(self.max_duration, end - start)
+        self._merge_busy(start, end)
+
+    def remove(self, schedule_id: int, start: datetime, end: datetime):
+        position = bisect_left(self.entries, (start, schedule_id, end))
+        if position < len(self.entries) and self.entries[position][1] == schedule_id:
+            del self.entries[position]
+            # Removing a booking can split a merged block, so rebuild this room's blocks
+            self.busy_starts, self.busy_ends, self._gaps = [], [], None
+            for entry_start, _, entry_end in self.entries:
+                self._merge_busy(entry_start, entry_end)
+
+    def _merge_busy(self, start: datetime, end: datetime):
+        # Blocks touching or overlapping [start, end) are folded into one
+        low = bisect_left(self.busy_ends, start)
+        high = bisect_right(self.busy_starts, end)
+        if low < high:
+            start = min(start, self.busy_starts[low])
+            end = max(end, self.busy_ends[high - 1])
+        self.busy_starts[low:high] = [start]
+        self.busy_ends[low:high] = [end]
+        self._gaps = None
+
+    def _gap_tree(self) -> _MaxSegmentTree:
+        # Gap k lies between busy block k and block k + 1
+        if self._gaps is None:
+            self._gaps = _MaxSegmentTree([
+                (self.busy_starts[k + 1] - self.busy_ends[k]).total_seconds()
+                for k in range(len(self.busy_starts) - 1)
+            ])
+        return self._gaps
+
+    def is_free(self, start: datetime, end: datetime) -> bool:
+        # Only the last block starting before `end` can reach into the range
+        block = bisect_left(self.busy_starts, end) - 1
+        return block < 0 or self.busy_ends[block] <= start
+
+    def next_free(self, after: datetime, duration: timedelta) -> datetime:
+        """Earliest start >= after of a free slot at least `duration` long"""
+        block = bisect_right(self.busy_starts, after) - 1
+        if block >= 0 and self.busy_ends[block] > after:
+            candidate, gap = self.busy_ends[block], block
+        else:
+            candidate, gap = after, block
+        next_block = gap + 1
+        if next_block >= len(self.busy_starts) or self.busy_starts[next_block] - candidate >= duration:
+            return candidate
+        # The gap right after `candidate` is too short; find the first long-enough one after it
+        found = self._gap_tree().first_at_least(gap + 1, duration.total_seconds())
+        if found is None or found >= len(self.busy_starts) - 1:
+            return self.busy_ends[-1]
+        return self.busy_ends[found]
+
+    def overlapping(self, start: datetime, end: datetime) -> List[int]:
+        # A booking overlaps [start, end) iff it starts before `end` and ends after `start`.
+        # No booking is longer than max_duration, so anything starting before
+        # start - max_duration has already ended.
+        low = bisect_left(self.entries, (start - self.max_duration,))
+        high = bisect_left(self.entries, (end,))
+        return [schedule_id for _, schedule_id, booking_end in self.entries[low:high] if booking_end > start]
+
+
+class RoomIntervalIndex:
+    """
+    Thread-safe map of room number to its sorted bookings.
+
+    Rooms are loaded from the database the first time they are queried and
+    kept in step by the schedule CRUD functions after each commit.
+    Availability queries need every room, so they load the whole table at
+    once. Both a single room and the full snapshot are reloaded once they are
+    older than ``max_age`` seconds, to pick up writes made by other worker
+    processes.
+    """
+
+    def __init__(self, max_age: float = 60):
+        self._lock = threading.Lock()
+        self._rooms: Dict[str, _RoomBookings] = {}
+        self._bookings: Dict[int, Tuple[str, datetime, datetime]] = {}
+        self.max_age = max_age
+        self._full_loaded_at: Optional[float] = None
+        self._room_loaded_at: Dict[str, float] = {}
+
+    def needs_full_load(self) -> bool:
+        with self._lock:
+            return self._full_loaded_at is None or time.monotonic() - self._full_loaded_at > self.max_age
+
+    def load_all(self, rows: Iterable[Tuple[int, str, datetime, datetime]]):
+        """Replace the whole index with (schedule_id, room_number, start_time, end_time) rows"""
+        rooms: Dict[str, _RoomBookings] = {}
+        bookings: Dict[int, Tuple[str, datetime, datetime]] = {}
+        for schedule_id, room_number, start, end in rows:
+            rooms.setdefault(room_number, _RoomBookings()).add(schedule_id, start, end)
+            bookings[schedule_id] = (room_number, start, end)
+        with self._lock:
+            self._rooms, self._bookings = rooms, bookings
+            self._full_loaded_at = time.monotonic()
+            self._room_loaded_at.clear()
+
+    def has_room(self, room_number: str) -> bool:
+        """Whether the room is loaded and its bookings are younger than ``max_age``"""
+        with self._lock:
+            if room_number not in self._rooms:
+                return False
+            loaded_at = max(self._room_loaded_at.get(room_number, float("-inf")), self._full_loaded_at or float("-inf"))
+            return time.monotonic() - loaded_at <= self.max_age
+
+    def load_room(self, room_number: str, rows: Iterable[Tuple[int, datetime, datetime]]):
+        """Replace a room's bookings with (schedule_id, start_time, end_time) rows"""
+        bookings = _RoomBookings()
+        for schedule_id, start, end in rows:
+            bookings.add(schedule_id, start, end)
+        with self._lock:
+            for _, schedule_id, _ in self._rooms.get(room_number, _RoomBookings()).entries:
+                self._bookings.pop(schedule_id, None)
+            self._rooms[room_number] = bookings
+            self._room_loaded_at[room_number] = time.monotonic()
+            for start, schedule_id, end in bookings.entries:
+                self._bookings[schedule_id] = (room_number, start, end)
+
+    def overlapping(self, room_number: str, start: datetime, end: datetime, exclude_id: Optional[int] = None) -> List[int]:
+        """IDs of bookings in a loaded room that overlap [start, end)"""
+        with self._lock:
+            bookings = self._rooms.get(room_number)
+            if bookings is None:
+                return []
+            return [schedule_id for schedule_id in bookings.overlapping(start, end) if schedule_id != exclude_id]
+
+    def upsert(self, schedule_id: int, room_number: str, start: datetime, end: datetime):
+        """Record a committed booking, moving it if its room or times changed"""
+        with self._lock:
+            self._discard(schedule_id)
+            bookings = self._rooms.get(room_number)
+            if bookings is None and self._full_loaded_at is not None:
+                # Every room is tracked after a full load, including brand-new ones
+                bookings = self._rooms[room_number] = _RoomBookings()
+            if bookings is not None:
+                bookings.add(schedule_id, start, end)
+                self._bookings[schedule_id] = (room_number, start, end)
+
+    def discard(self, schedule_id: int):
+        with self._lock:
+            self._discard(schedule_id)
+
+    def room_numbers(self) -> List[str]:
+        with self._lock:
+            return sorted(self._rooms)
+
+    def free_rooms(self, start: datetime, end: datetime) -> Dict[str, bool]:
+        """Map each loaded room to whether it is free for all of [start, end)"""
+        with self._lock:
+            return {room_number: bookings.is_free(start, end) for room_number, bookings in sorted(self._rooms.items())}
+
+    def next_free_slot(self, room_number: str, after: datetime, duration: timedelta) -> Optional[datetime]:
+        """Start of the room's next free slot of at least `duration`, or None if the room is not loaded"""
+        with self._lock:
+            bookings = self._rooms.get(room_number)
+            return bookings.next_free(after, duration) if bookings is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+            self._bookings.clear()
+            self._full_loaded_at = None
+            self._room_loaded_at.clear()
+
+    def _discard(self, schedule_id: int):
+        previous = self._bookings.pop(schedule_id, None)
+        if previous is not None:
+            room_number, start, end = previous
+            self._rooms[room_number].remove(schedule_id, start, end)
+
+
+room_index = RoomIntervalIndex()
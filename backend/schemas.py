@@ -1,5 +1,5 @@
 from pydantic import BaseModel, validator
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -58,5 +58,34 @@ class SubmissionResponse(BaseModel):
     grade: Optional[float] = None
     time_spent_minutes: int
     submitted_at: datetime
+    version: int = 1
 
-    model_config = {"from_attributes": True}
\ No newline at end of file
+    model_config = {"from_attributes": True}
+
+
+# Bulk grading schemas
+MAX_BULK_GRADES = 500
+
+class SubmissionGradeItem(BaseModel):
+    submission_id: int
+    grade: float
+    expected_version: int
+
+    @validator('grade')
+    def validate_grade(cls, v):
+        if v < 0 or v > 100:
+            raise ValueError('Grade must be a number between 0 and 100')
+        return v
+
+class BulkGradeRequest(BaseModel):
+    grades: List[SubmissionGradeItem]
+
+    @validator('grades')
+    def validate_grades(cls, v):
+        if not v:
+            raise ValueError('At least one grade is required')
+        if len(v) > MAX_BULK_GRADES:
+            raise ValueError(f'At most {MAX_BULK_GRADES} grades can be submitted at once')
+        if len({item.submission_id for item in v}) != len(v):
+            raise ValueError('Each submission can only be graded once per request')
+        return v
@@ -1,6 +1,7 @@
 import os
 import jwt
 import hashlib
+import hmac
 from typing import Optional
 from datetime import datetime, timedelta
 
@@ -39,3 +40,12 @@ def verify_token(token: str) -> Optional[str]:
         return username
     except jwt.PyJWTError:
         return None
+
+def create_calendar_feed_token(feed_kind: str, subject: str) -> str:
+    """Create the secret token that authorizes a calendar feed URL"""
+    message = f"calendar-feed:{feed_kind}:{subject}".encode()
+    return hmac.new(SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()[:32]
+
+def verify_calendar_feed_token(feed_kind: str, subject: str, token: str) -> bool:
+    """Check a calendar feed token in constant time"""
+    return hmac.compare_digest(create_calendar_feed_token(feed_kind, subject), token)
@@ -0,0 +1,61 @@
+"""
+Shared fixtures for the backend tests.
+
+Tests run against a throwaway SQLite database in a temporary working
+directory, so uploads and the database never touch the real ones. The
+seeded admin@classtrack.edu and student@classtrack.edu users exist in
+every test, with password "password123".
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+WORK_DIR = tempfile.mkdtemp(prefix="classtrack-tests-")
+os.chdir(WORK_DIR)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORK_DIR, 'test.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from database import Base, SessionLocal, engine  # noqa: E402
+
+PASSWORD = "password123"
+
+
+@pytest.fixture
+def client():
+    """A TestClient on a fresh database, with the app's startup seeding applied"""
+    Base.metadata.drop_all(bind=engine)
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def auth_headers(client, username="admin@classtrack.edu", password=PASSWORD):
+    """Log in and return the Authorization header for the user"""
+    response = client.post("/token", data={"username": username, "password": password})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def create_students(client, admin, count, prefix="student"):
+    """Provision students through /users/bulk and return their usernames"""
+    usernames = [f"{prefix}{i}@classtrack.edu" for i in range(count)]
+    response = client.post(
+        "/users/bulk",
+        json={"users": [{"username": username, "password": PASSWORD, "role": "student"} for username in usernames]},
+        headers=admin
+    )
+    assert response.status_code in (200, 201), response.text
+    return usernames
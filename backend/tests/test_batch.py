@@ -0,0 +1,23 @@
+from conftest import auth_headers
+
+
+def test_batch_runs_json_sub_requests_with_the_callers_credentials(client):
+    student = auth_headers(client, "student@classtrack.edu")
+    response = client.post("/batch", json={"requests": [
+        {"id": "me", "path": "/users/me"},
+        {"id": "admin-only", "path": "/users/"},
+        {"id": "missing", "path": "/no/such/route"}
+    ]}, headers=student)
+    assert response.status_code == 200
+    results = {result["id"]: result for result in response.json()["responses"]}
+    assert results["me"]["status"] == 200
+    assert results["me"]["body"]["username"] == "student@classtrack.edu"
+    assert results["admin-only"]["status"] == 403
+    assert results["missing"]["status"] == 404
+
+
+def test_batch_rejects_non_json_sub_requests(client):
+    admin = auth_headers(client)
+    response = client.post("/batch", json={"requests": [{"id": "feed", "path": "/announcements/stream"}, {"id": "me", "path": "/users/me"}]}, headers=admin)
+    results = response.json()["responses"]
+    assert [result["status"] for result in results] == [415, 200]
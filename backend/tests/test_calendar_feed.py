@@ -0,0 +1,68 @@
+import time
+from datetime import datetime, timedelta
+
+from calendar_feed import feed_cache
+from conftest import auth_headers
+
+TOMORROW = (datetime.utcnow() + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+
+
+def create_class(client, admin, code, capacity=None):
+    response = client.post("/classes/", json={"name": f"Class {code}", "code": code, "capacity": capacity}, headers=admin)
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+def book(client, admin, class_id, room, offset_hours=0):
+    start = TOMORROW + timedelta(hours=offset_hours)
+    response = client.post("/schedules/", json={
+        "class_id": class_id,
+        "start_time": start.isoformat(),
+        "end_time": (start + timedelta(hours=1)).isoformat(),
+        "room_number": room
+    }, headers=admin)
+    assert response.status_code == 200, response.text
+
+
+def room_feed_url(client, admin, room):
+    return client.get(f"/calendar/rooms/{room}/feed", headers=admin).json()["url"]
+
+
+def test_rebuilt_feed_keeps_its_etag(client):
+    admin = auth_headers(client)
+    book(client, admin, create_class(client, admin, "BIO101"), "A-101")
+    url = room_feed_url(client, admin, "A-101")
+    first = client.get(url)
+    assert first.status_code == 200
+    assert "DTSTAMP:" in first.text
+    time.sleep(1.1)  # DTSTAMP has one-second resolution
+    feed_cache.clear()
+    assert client.get(url, headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+
+def test_writes_elsewhere_keep_a_feed_cached(client):
+    admin = auth_headers(client)
+    class_id = create_class(client, admin, "BIO101")
+    other_class_id = create_class(client, admin, "CHE101")
+    book(client, admin, class_id, "A-101")
+    url = room_feed_url(client, admin, "A-101")
+    etag = client.get(url).headers["ETag"]
+    cached = feed_cache._entries[("room", "A-101")]
+
+    book(client, admin, other_class_id, "B-202")
+    client.get(url)
+    assert feed_cache._entries[("room", "A-101")] is cached
+
+    book(client, admin, other_class_id, "A-101", offset_hours=2)
+    assert client.get(url).headers["ETag"] != etag
+
+
+def test_student_feed_follows_enrollment(client):
+    admin = auth_headers(client)
+    student = auth_headers(client, "student@classtrack.edu")
+    book(client, admin, create_class(client, admin, "BIO101"), "A-101")
+    url = client.get("/calendar/feeds", headers=student).json()["url"]
+    assert "BIO101" not in client.get(url).text
+
+    assert client.post("/classes/enroll", json={"code": "BIO101"}, headers=student).json()["status"] == "enrolled"
+    assert "BIO101" in client.get(url).text
@@ -0,0 +1,68 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import auth_headers, create_students
+from models import Class, ClassWaitlistEntry, Enrollment, User
+
+
+def create_class(client, admin, code, capacity):
+    response = client.post("/classes/", json={"name": f"Class {code}", "code": code, "capacity": capacity}, headers=admin)
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+def enrolled_ids(db, class_id):
+    return {row.student_id for row in db.query(Enrollment.student_id).filter(Enrollment.class_id == class_id)}
+
+
+def waitlist_ids(db, class_id):
+    return [row.student_id for row in db.query(ClassWaitlistEntry.student_id).filter(ClassWaitlistEntry.class_id == class_id).order_by(ClassWaitlistEntry.id)]
+
+
+def test_self_enroll_rush_never_overfills_a_class(client, db):
+    admin = auth_headers(client)
+    class_id = create_class(client, admin, "RUSH101", capacity=20)
+    students = [auth_headers(client, username) for username in create_students(client, admin, 80)]
+
+    with ThreadPoolExecutor(16) as pool:
+        responses = list(pool.map(lambda headers: client.post("/classes/enroll", json={"code": "RUSH101"}, headers=headers), students))
+
+    statuses = [response.json()["status"] for response in responses]
+    assert statuses.count("enrolled") == 20
+    assert statuses.count("waitlisted") == 60
+    class_ = db.get(Class, class_id)
+    assert class_.student_count == len(enrolled_ids(db, class_id)) == 20
+    assert len(waitlist_ids(db, class_id)) == 60
+
+
+def test_leaving_promotes_the_head_of_the_waitlist(client, db):
+    admin = auth_headers(client)
+    class_id = create_class(client, admin, "SEAT101", capacity=1)
+    first, second, third = [auth_headers(client, username) for username in create_students(client, admin, 3)]
+    for headers in (first, second, third):
+        client.post("/classes/enroll", json={"code": "SEAT101"}, headers=headers)
+    head, behind = waitlist_ids(db, class_id)
+
+    response = client.delete(f"/classes/{class_id}/enrollment", headers=first)
+    assert response.json()["left"] == "enrollment"
+    db.expire_all()
+    assert enrolled_ids(db, class_id) == {head}
+    assert waitlist_ids(db, class_id) == [behind]
+    assert db.get(Class, class_id).student_count == 1
+
+
+def test_import_fills_free_seats_and_waitlists_the_rest(client, db):
+    admin = auth_headers(client)
+    class_id = create_class(client, admin, "IMP101", capacity=3)
+    usernames = create_students(client, admin, 6)
+    for username in usernames[:2]:
+        client.post("/classes/enroll", json={"code": "IMP101"}, headers=auth_headers(client, username))
+
+    csv_body = "".join(f"{username},IMP101\n" for username in usernames)
+    response = client.post("/admin/enrollments/import", files={"file": ("enrollments.csv", csv_body, "text/csv")}, headers=admin)
+    summary = response.json()
+    assert (summary["enrolled"], summary["waitlisted"], summary["skipped"]) == (1, 3, 2)
+
+    ids = {user.username: user.id for user in db.query(User).filter(User.username.in_(usernames))}
+    assert enrolled_ids(db, class_id) == {ids[username] for username in usernames[:3]}
+    assert waitlist_ids(db, class_id) == [ids[username] for username in usernames[3:]]
+    assert db.get(Class, class_id).student_count == 3
@@ -0,0 +1,45 @@
+import asyncio
+
+import idempotency
+from conftest import auth_headers
+from models import Class
+
+
+def create_class(client, admin, key, code="BIO101"):
+    return client.post("/classes/", json={"name": "Biology", "code": code}, headers={**admin, "Idempotency-Key": key})
+
+
+def test_retry_replays_the_stored_response(client, db):
+    admin = auth_headers(client)
+    first = create_class(client, admin, "create-bio")
+    retry = create_class(client, admin, "create-bio")
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert db.query(Class).count() == 1
+
+
+def test_key_reused_for_a_different_body_is_rejected(client):
+    admin = auth_headers(client)
+    create_class(client, admin, "create-bio")
+    assert create_class(client, admin, "create-bio", code="CHE101").status_code == 422
+
+
+def test_key_storage_runs_off_the_event_loop(client, monkeypatch):
+    calls = []
+
+    def recording(operation):
+        def wrapper(*args):
+            try:
+                asyncio.get_running_loop()
+                calls.append((operation.__name__, "event loop"))
+            except RuntimeError:
+                calls.append((operation.__name__, "thread"))
+            return operation(*args)
+        wrapper.__name__ = operation.__name__
+        return wrapper
+
+    for name in ("claim_idempotency_key", "complete_idempotency_key"):
+        monkeypatch.setattr(idempotency, name, recording(getattr(idempotency, name)))
+    create_class(client, auth_headers(client), "create-bio")
+    assert calls == [("claim_idempotency_key", "thread"), ("complete_idempotency_key", "thread")]
@@ -0,0 +1,50 @@
+import json
+from datetime import datetime, timedelta
+
+from conftest import auth_headers
+from live_hub import PROCESS_ORIGIN, LiveEventRelay, live_hub
+from models import LiveEvent
+
+TOMORROW = (datetime.utcnow() + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+
+
+def test_batched_announcement_streams_release_their_connections(client):
+    student = auth_headers(client, "student@classtrack.edu")
+    response = client.post("/batch", json={
+        "requests": [{"id": str(i), "path": "/announcements/stream"} for i in range(5)]
+    }, headers=student)
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json()["responses"]] == [415] * 5
+    assert live_hub.connection_count == 0
+
+
+def test_committed_changes_are_recorded_for_other_workers(client, db):
+    admin = auth_headers(client)
+    class_id = client.post("/classes/", json={"name": "Biology", "code": "BIO101"}, headers=admin).json()["id"]
+    client.post("/schedules/", json={
+        "class_id": class_id,
+        "start_time": TOMORROW.isoformat(),
+        "end_time": (TOMORROW + timedelta(hours=1)).isoformat(),
+        "room_number": "B-101"
+    }, headers=admin)
+    rows = db.query(LiveEvent).all()
+    assert [row.origin for row in rows] == [PROCESS_ORIGIN]
+    recorded = json.loads(rows[0].payload)
+    assert (recorded["type"], recorded["action"], recorded["_rooms"]) == ("schedule", "created", ["B-101"])
+
+
+def test_relay_pushes_events_committed_by_other_workers(client, db):
+    relay = LiveEventRelay()
+    relay.poll()
+    other = {"type": "schedule", "action": "updated", "id": 7, "changes": {"status": "Needs Cleaning"}, "_rooms": ["B-101"]}
+    own = {"type": "schedule", "action": "updated", "id": 8, "changes": {"status": "Clean"}, "_rooms": ["B-101"]}
+    with client.websocket_connect("/ws/live?topics=building:B-") as ws:
+        ws.receive_json()
+        db.add_all([
+            LiveEvent(origin="another-worker", payload=json.dumps(other)),
+            LiveEvent(origin=PROCESS_ORIGIN, payload=json.dumps(own))
+        ])
+        db.commit()
+        assert relay.poll() == 1
+        assert ws.receive_json() == {"type": "schedule", "action": "updated", "id": 7, "changes": {"status": "Needs Cleaning"}}
+        assert relay.poll() == 0
@@ -0,0 +1,73 @@
+import time
+from datetime import datetime, timedelta
+
+import notifications
+from conftest import auth_headers, create_students
+from models import NotificationDelivery, NotificationOutbox
+
+
+class SlowSMTP:
+    sent = []
+
+    def __init__(self, host, port, timeout=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def send_message(self, message):
+        time.sleep(0.1)
+        SlowSMTP.sent.append(message["To"])
+
+
+def post_urgent(client, admin):
+    response = client.post("/announcements/", json={"title": "Closure", "content": "Campus closed", "is_urgent": True}, headers=admin)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def test_toggling_urgent_does_not_fan_out_twice(client, db):
+    admin = auth_headers(client)
+    client.post("/users/bulk", json={"users": [{"username": "no-email", "password": "password123", "role": "student"}]}, headers=admin)
+    announcement_id = post_urgent(client, admin)
+    for is_urgent in (False, True):
+        client.put(f"/announcements/{announcement_id}", json={"title": "Closure", "content": "Campus closed", "is_urgent": is_urgent}, headers=admin)
+
+    assert notifications.fan_out_outbox(db, datetime.utcnow()) == 2
+    outbox = db.query(NotificationOutbox).one()
+    assert outbox.skipped_recipients == 1
+
+
+def test_sending_stops_before_the_lease_runs_out(client, db, monkeypatch):
+    admin = auth_headers(client)
+    create_students(client, admin, 8)
+    post_urgent(client, admin)
+    monkeypatch.setattr(notifications.smtplib, "SMTP", SlowSMTP)
+    monkeypatch.setattr(notifications, "MAX_SEND_SECONDS", 0)
+    monkeypatch.setattr(notifications, "DELIVERY_LEASE", timedelta(seconds=0.35))
+    SlowSMTP.sent = []
+
+    now = datetime.utcnow()
+    notifications.fan_out_outbox(db, now)
+    claimed = notifications.claim_deliveries(db, now)
+    assert len(claimed) == 10
+    sent = notifications.deliver_chunk(db, claimed, now)
+
+    assert 0 < sent < 10
+    db.expire_all()
+    released = db.query(NotificationDelivery).filter(NotificationDelivery.status == "pending").all()
+    assert len(released) == 10 - sent
+    assert all(delivery.attempts == 0 for delivery in released)
+    assert db.query(NotificationDelivery).filter(NotificationDelivery.status == "sending").count() == 0
+    assert sorted(notifications.claim_deliveries(db, datetime.utcnow())) == sorted(delivery.id for delivery in released)
+
+
+def test_expired_notifications_are_swept(client, db):
+    post_urgent(client, auth_headers(client))
+    notifications.fan_out_outbox(db, datetime.utcnow())
+    assert notifications.delete_expired_notifications(db, datetime.utcnow() - notifications.NOTIFICATION_RETENTION) == 0
+    assert notifications.delete_expired_notifications(db, datetime.utcnow() + timedelta(seconds=1)) == 1
+    assert db.query(NotificationDelivery).count() == 0
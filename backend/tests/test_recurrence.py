@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import auth_headers
+from models import Class, ScheduleRule, User
+from recurrence import expand_occurrences, iter_occurrences, parse_rrule
+
+TUESDAY = datetime(2026, 9, 1, 9, 0)
+HOUR = timedelta(hours=1)
+
+
+def test_weekly_byday_expands_within_window():
+    occurrences = expand_occurrences("FREQ=WEEKLY;BYDAY=MO,WE;COUNT=4", datetime(2026, 8, 31, 9, 0), HOUR, (), TUESDAY, TUESDAY + timedelta(days=14))
+    assert [occurrence.day for occurrence in occurrences] == [2, 7, 9]
+
+
+def test_daily_byday_with_weekly_interval_is_rejected():
+    with pytest.raises(ValueError):
+        parse_rrule("FREQ=DAILY;INTERVAL=7;BYDAY=MO")
+    with pytest.raises(ValueError):
+        parse_rrule("FREQ=DAILY;INTERVAL=14;BYDAY=TU,TH")
+    assert parse_rrule("FREQ=DAILY;INTERVAL=3;BYDAY=MO").interval == 3
+
+
+@pytest.mark.parametrize("rrule", ["FREQ=DAILY;INTERVAL=7;BYDAY=MO", "FREQ=DAILY;INTERVAL=7;BYDAY=MO;COUNT=5"])
+def test_never_matching_byday_stops_at_window_end(rrule):
+    rule = parse_rrule(rrule, strict=False)
+    assert list(iter_occurrences(rule, TUESDAY, HOUR, TUESDAY, TUESDAY + timedelta(days=365))) == []
+
+
+def test_never_matching_byday_stops_at_until():
+    rule = parse_rrule("FREQ=DAILY;INTERVAL=7;BYDAY=MO;UNTIL=20261231", strict=False)
+    assert list(iter_occurrences(rule, TUESDAY, HOUR, TUESDAY, datetime.max - timedelta(days=1))) == []
+
+
+def test_create_rule_rejects_never_matching_byday(client):
+    admin = auth_headers(client)
+    class_id = client.post("/classes/", json={"name": "Biology", "code": "BIO101"}, headers=admin).json()["id"]
+    response = client.post("/schedule-rules/", json={
+        "class_id": class_id,
+        "start_time": TUESDAY.isoformat(),
+        "end_time": (TUESDAY + HOUR).isoformat(),
+        "room_number": "A-101",
+        "rrule": "FREQ=DAILY;INTERVAL=7;BYDAY=MO"
+    }, headers=admin)
+    assert response.status_code == 422
+
+
+def test_stored_never_matching_rule_does_not_break_live_schedules(client, db):
+    teacher = db.query(User).filter(User.username == "admin@classtrack.edu").one()
+    class_ = Class(name="Biology", code="BIO101", teacher_id=teacher.id)
+    db.add(class_)
+    db.flush()
+    db.add(ScheduleRule(
+        class_id=class_.id, start_time=TUESDAY, end_time=TUESDAY + HOUR,
+        room_number="A-101", rrule="FREQ=DAILY;INTERVAL=7;BYDAY=MO", exdates=""
+    ))
+    db.commit()
+    response = client.get("/schedules/live", params={"start": TUESDAY.isoformat(), "end": (TUESDAY + timedelta(days=30)).isoformat()})
+    assert response.status_code == 200
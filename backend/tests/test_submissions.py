@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import auth_headers
+from models import Assignment, Submission
+
+
+def enrolled_assignment(client):
+    admin = auth_headers(client)
+    student = auth_headers(client, "student@classtrack.edu")
+    class_id = client.post("/classes/", json={"name": "Biology", "code": "BIO101"}, headers=admin).json()["id"]
+    client.post("/classes/enroll", json={"code": "BIO101"}, headers=student)
+    assignment = client.post("/assignments/", json={"name": "Lab report", "class_id": class_id}, headers=admin).json()
+    return admin, student, assignment["id"]
+
+
+def submit(client, student, assignment_id):
+    return client.post("/submissions/", json={"assignment_id": assignment_id, "student_id": 1, "time_spent_minutes": 30}, headers=student)
+
+
+def test_concurrent_submits_create_one_submission(client, db):
+    _, student, assignment_id = enrolled_assignment(client)
+    with ThreadPoolExecutor(8) as pool:
+        statuses = sorted(response.status_code for response in pool.map(lambda _: submit(client, student, assignment_id), range(8)))
+    assert statuses == [201] + [409] * 7
+    assert db.query(Submission).filter(Submission.assignment_id == assignment_id).count() == 1
+    assert db.get(Assignment, assignment_id).submission_count == 1
+
+
+def test_bulk_grading_rejects_stale_versions(client, db):
+    admin, student, assignment_id = enrolled_assignment(client)
+    submission = submit(client, student, assignment_id).json()
+
+    response = client.patch("/submissions/grades", json={"grades": [
+        {"submission_id": submission["id"], "grade": 90, "expected_version": submission["version"]},
+        {"submission_id": 999999, "grade": 50, "expected_version": 1}
+    ]}, headers=admin)
+    assert [result["status"] for result in response.json()["results"]] == ["updated", "not_found"]
+
+    response = client.patch("/submissions/grades", json={"grades": [
+        {"submission_id": submission["id"], "grade": 10, "expected_version": submission["version"]}
+    ]}, headers=admin)
+    assert response.json()["results"][0]["status"] == "conflict"
+    assert db.get(Submission, submission["id"]).grade == 90
+    assert db.get(Assignment, assignment_id).graded_count == 1
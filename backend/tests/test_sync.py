@@ -0,0 +1,26 @@
+from conftest import auth_headers
+
+
+def test_sync_reports_changes_and_deletions_since_the_cursor(client):
+    admin = auth_headers(client)
+    student = auth_headers(client, "student@classtrack.edu")
+    class_id = client.post("/classes/", json={"name": "Biology", "code": "BIO101"}, headers=admin).json()["id"]
+    client.post("/classes/enroll", json={"code": "BIO101"}, headers=student)
+    kept = client.post("/assignments/", json={"name": "Lab report", "class_id": class_id}, headers=admin).json()["id"]
+
+    full = client.get("/me/sync", headers=student).json()
+    assert full["reset"] is True
+    assert [assignment["id"] for assignment in full["assignments"]] == [kept]
+
+    removed = client.post("/assignments/", json={"name": "Quiz", "class_id": class_id}, headers=admin).json()["id"]
+    assert client.delete(f"/assignments/{removed}", headers=admin).status_code in (200, 204)
+
+    delta = client.get("/me/sync", params={"cursor": full["cursor"]}, headers=student).json()
+    assert delta["reset"] is False
+    assert {"type": "assignment", "id": removed} in delta["deleted"]
+    assert removed not in [assignment["id"] for assignment in delta["assignments"]]
+
+
+def test_sync_rejects_a_malformed_cursor(client):
+    student = auth_headers(client, "student@classtrack.edu")
+    assert client.get("/me/sync", params={"cursor": "not-a-cursor"}, headers=student).status_code == 400
@@ -0,0 +1,35 @@
+import threading
+import time
+
+from timetable import Meeting, TimetableProblem, solve_timetable
+
+
+def large_problem():
+    meetings = [Meeting(class_id=index % 150, teacher_id=index % 40, length=1 + index % 2) for index in range(600)]
+    return TimetableProblem(day_count=5, slots_per_day=9, room_count=30, meetings=meetings, blocked_rooms=set(), teacher_unavailable=set())
+
+
+def test_greedy_start_counts_against_the_time_limit():
+    problem = large_problem()
+    started = time.monotonic()
+    solution = solve_timetable(problem, time_limit=1, seed=1)
+    assert time.monotonic() - started < 3
+    assert len(solution.placements) == len(problem.meetings)
+    assert all(placement is not None for placement in solution.placements)
+
+
+def test_cancelled_search_returns_promptly():
+    cancelled = threading.Event()
+    cancelled.set()
+    started = time.monotonic()
+    solution = solve_timetable(large_problem(), time_limit=60, seed=1, cancelled=cancelled)
+    assert time.monotonic() - started < 2
+    assert solution.iterations == 0
+
+
+def test_small_problem_is_solved_without_conflicts():
+    meetings = [Meeting(class_id=index, teacher_id=index % 3, length=1) for index in range(12)]
+    problem = TimetableProblem(day_count=5, slots_per_day=4, room_count=2, meetings=meetings, blocked_rooms={(0, 0, 0)}, teacher_unavailable={(0, 1, 1)})
+    solution = solve_timetable(problem, time_limit=2, seed=7)
+    assert solution.hard_violations == 0
+    assert (0, 0, 0) not in solution.placements
@@ -0,0 +1,282 @@
+"""
+Weekly timetable generation by simulated annealing.
+
+Each class meeting is placed at a (day, start slot, room) of a weekly grid.
+Hard constraints (weighted heavily): a room, teacher or class is never in
+two places at once, rooms already booked stay free, and teachers only teach
+inside their availability. Soft objective: room changes per class, idle
+gaps in teachers' days, and a class meeting twice on the same day.
+
+Moves relocate one meeting or swap two meetings' times and are scored
+incrementally, so the search does hundreds of thousands of evaluations
+within its time budget.
+"""
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+HARD_WEIGHT = 1000
+ROOM_CHANGE_WEIGHT = 3
+TEACHER_GAP_WEIGHT = 1
+SAME_DAY_WEIGHT = 5
+
+Placement = Tuple[int, int, int]  # (day index, start slot, room index)
+
+
+class Meeting(NamedTuple):
+    class_id: int
+    teacher_id: Optional[int]
+    length: int  # In slots
+
+
+class TimetableProblem(NamedTuple):
+    day_count: int
+    slots_per_day: int
+    room_count: int
+    meetings: List[Meeting]
+    blocked_rooms: Set[Tuple[int, int, int]]  # (room, day, slot) already booked
+    teacher_unavailable: Set[Tuple[int, int, int]]  # (teacher_id, day, slot)
+
+
+class TimetableSolution(NamedTuple):
+    placements: List[Placement]
+    hard_violations: int
+    room_changes: int
+    teacher_gaps: int
+    same_day_repeats: int
+    iterations: int
+
+
+class _State:
+    """Occupancy counters for a full assignment, with incremental cost updates"""
+
+    def __init__(self, problem: TimetableProblem):
+        self.problem = problem
+        self.room_use = Counter()
+        self.teacher_use = Counter()
+        self.class_use = Counter()
+        self.class_days = Counter()
+        self.class_rooms: Dict[int, Counter] = {}
+        self.teacher_day_slots: Dict[Tuple[int, int], Counter] = {}
+        self.hard = 0
+        self.room_changes = 0
+        self.teacher_gaps = 0
+        self.same_day = 0
+
+    @property
+    def cost(self) -> int:
+        return (
+            HARD_WEIGHT * self.hard
+            + ROOM_CHANGE_WEIGHT * self.room_changes
+            + TEACHER_GAP_WEIGHT * self.teacher_gaps
+            + SAME_DAY_WEIGHT * self.same_day
+        )
+
+    def _teacher_gap(self, key: Tuple[int, int]) -> int:
+        slots = self.teacher_day_slots.get(key)
+        if not slots:
+            return 0
+        return (max(slots) - min(slots) + 1) - len(slots)
+
+    def apply(self, meeting: Meeting, placement: Placement, sign: int):
+        """Add (sign=1) or remove (sign=-1) a meeting at a placement"""
+        day, start, room = placement
+        for slot in range(start, start + meeting.length):
+            for counter, key in (
+                (self.room_use, (room, day, slot)),
+                (self.teacher_use, (meeting.teacher_id, day, slot)),
+                (self.class_use, (meeting.class_id, day, slot)),
+            ):
+                if counter is self.teacher_use and meeting.teacher_id is None:
+                    continue
+                before = counter[key]
+                counter[key] = before + sign
+                if (sign > 0 and before >= 1) or (sign < 0 and before >= 2):
+                    self.hard += sign
+            if (room, day, slot) in self.problem.blocked_rooms:
+                self.hard += sign
+            if meeting.teacher_id is not None and (meeting.teacher_id, day, slot) in self.problem.teacher_unavailable:
+                self.hard += sign
+
+        before = self.class_days[(meeting.class_id, day)]
+        self.class_days[(meeting.class_id, day)] = before + sign
+        if (sign > 0 and before >= 1) or (sign < 0 and before >= 2):
+            self.same_day += sign
+
+        rooms = self.class_rooms.setdefault(meeting.class_id, Counter())
+        distinct_before = len(rooms)
+        rooms[room] += sign
+        if rooms[room] == 0:
+            del rooms[room]
+        self.room_changes += max(len(rooms) - 1, 0) - max(distinct_before - 1, 0)
+
+        if meeting.teacher_id is not None:
+            key = (meeting.teacher_id, day)
+            gap_before = self._teacher_gap(key)
+            slots = self.teacher_day_slots.setdefault(key, Counter())
+            for slot in range(start, start + meeting.length):
+                slots[slot] += sign
+                if slots[slot] == 0:
+                    del slots[slot]
+            self.teacher_gaps += self._teacher_gap(key) - gap_before
+
+
+def _random_placement(problem: TimetableProblem, meeting: Meeting, rng: random.Random) -> Placement:
+    return (
+        rng.randrange(problem.day_count),
+        rng.randrange(problem.slots_per_day - meeting.length + 1),
+        rng.randrange(problem.room_count),
+    )
+
+
+def _stopped(deadline: float, cancelled: Optional[threading.Event]) -> bool:
+    return time.monotonic() >= deadline or (cancelled is not None and cancelled.is_set())
+
+
+def _greedy_start(problem: TimetableProblem, state: _State, rng: random.Random, deadline: float, cancelled: Optional[threading.Event]) -> List[Placement]:
+    """
+    Place longest meetings first, each at its cheapest placement given the ones before it.
+
+    Scanning every cell for every meeting can outlast the whole budget on a
+    large grid, so once the deadline passes or the job is cancelled the
+    remaining meetings are placed at random.
+    """
+    placements: List[Optional[Placement]] = [None] * len(problem.meetings)
+    order = sorted(range(len(problem.meetings)), key=lambda index: (-problem.meetings[index].length, rng.random()))
+    for index in order:
+        meeting = problem.meetings[index]
+        if _stopped(deadline, cancelled):
+            placements[index] = _random_placement(problem, meeting, rng)
+            state.apply(meeting, placements[index], 1)
+            continue
+        best, best_cost = None, None
+        for day in range(problem.day_count):
+            for start in range(problem.slots_per_day - meeting.length + 1):
+                for room in range(problem.room_count):
+                    placement = (day, start, room)
+                    state.apply(meeting, placement, 1)
+                    cost = state.cost
+                    state.apply(meeting, placement, -1)
+                    if best_cost is None or cost < best_cost:
+                        best, best_cost = placement, cost
+        placements[index] = best
+        state.apply(meeting, best, 1)
+    return placements
+
+
+def solve_timetable(problem: TimetableProblem, time_limit: float, seed: Optional[int] = None, cancelled: Optional[threading.Event] = None) -> TimetableSolution:
+    """
+    Search for a low-cost weekly timetable within a time budget.
+
+    Args:
+        problem: Grid size, meetings and blocked cells
+        time_limit: Seconds to search for, including the greedy start
+        seed: Random seed, for reproducible runs
+        cancelled: Stops the search early when set
+
+    Returns:
+        TimetableSolution: Best placements found and their objective terms
+    """
+    rng = random.Random(seed)
+    state = _State(problem)
+    if not problem.meetings:
+        return TimetableSolution([], 0, 0, 0, 0, 0)
+    if problem.slots_per_day < max(meeting.length for meeting in problem.meetings):
+        raise ValueError("A meeting is longer than the teaching day")
+
+    deadline = time.monotonic() + time_limit
+    placements = _greedy_start(problem, state, rng, deadline, cancelled)
+    best = (state.cost, list(placements), state.hard, state.room_changes, state.teacher_gaps, state.same_day)
+
+    start_temperature, end_temperature = 20.0, 0.05
+    iterations = 0
+    now = time.monotonic()
+    while now < deadline and best[0] > 0 and not (cancelled and cancelled.is_set()):
+        # Check the clock every 256 moves; cooling follows the elapsed fraction of the budget
+        if iterations % 256 == 0:
+            now = time.monotonic()
+            progress = 1 - max(deadline - now, 0) / time_limit
+            temperature = start_temperature * (end_temperature / start_temperature) ** progress
+        iterations += 1
+
+        before = state.cost
+        first = rng.randrange(len(placements))
+        if len(placements) > 1 and rng.random() < 0.3:
+            # Swap the times (keeping rooms) of two meetings of the same length
+            second = rng.randrange(len(placements))
+            if second == first or problem.meetings[first].length != problem.meetings[second].length:
+                continue
+            old_first, old_second = placements[first], placements[second]
+            new_first = (old_second[0], old_second[1], old_first[2])
+            new_second = (old_first[0], old_first[1], old_second[2])
+            moves = [(first, old_first, new_first), (second, old_second, new_second)]
+        else:
+            moves = [(first, placements[first], _random_placement(problem, problem.meetings[first], rng))]
+
+        for index, old, new in moves:
+            state.apply(problem.meetings[index], old, -1)
+            state.apply(problem.meetings[index], new, 1)
+        delta = state.cost - before
+
+        if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+            for index, _, new in moves:
+                placements[index] = new
+            if state.cost < best[0]:
+                best = (state.cost, list(placements), state.hard, state.room_changes, state.teacher_gaps, state.same_day)
+        else:
+            for index, old, new in reversed(moves):
+                state.apply(problem.meetings[index], new, -1)
+                state.apply(problem.meetings[index], old, 1)
+
+    _, best_placements, hard, room_changes, teacher_gaps, same_day = best
+    return TimetableSolution(best_placements, hard, room_changes, teacher_gaps, same_day, iterations)
+
+
+# Background job registry
+
+class TimetableJob:
+    def __init__(self, created_by: int):
+        self.id = uuid.uuid4().hex
+        self.created_by = created_by
+        self.created_at = datetime.utcnow()
+        self.status = "queued"  # queued, running, completed, failed, applied
+        self.finished_at: Optional[datetime] = None
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.request = None  # the validated request, kept for apply
+        self.cancelled = threading.Event()
+
+
+class TimetableJobRegistry:
+    """In-memory jobs, newest kept; finished jobs beyond max_jobs are dropped"""
+
+    def __init__(self, max_jobs: int = 50):
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, TimetableJob] = {}
+        self.max_jobs = max_jobs
+
+    def create(self, created_by: int) -> TimetableJob:
+        job = TimetableJob(created_by)
+        with self._lock:
+            self._jobs[job.id] = job
+            finished = [old for old in self._jobs.values() if old.finished_at is not None]
+            finished.sort(key=lambda old: old.finished_at)
+            while len(self._jobs) > self.max_jobs and finished:
+                self._jobs.pop(finished.pop(0).id, None)
+        return job
+
+    def get(self, job_id: str) -> Optional[TimetableJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def running(self) -> List[TimetableJob]:
+        with self._lock:
+            return [job for job in self._jobs.values() if job.status in ("queued", "running")]
+
+
+timetable_jobs = TimetableJobRegistry()
@@ -0,0 +1,102 @@
+"""
+Tombstones for rows deleted out from under delta-sync clients.
+
+/me/sync returns rows changed since a client's cursor by their updated_at
+columns, which cannot show rows that no longer exist. Every ORM delete of a
+synced row records a SyncTombstone in the same flush, tagged with the class
+and user it concerns so each client only receives its own deletions. Writes
+that bypass the ORM unit of work call record_tombstones themselves.
+Tombstones older than SYNC_TOMBSTONE_RETENTION are pruned; a cursor older
+than that gets a full sync instead.
+"""
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import event, insert, select
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Announcement, Assignment, Class, Enrollment, Schedule, ScheduleRule, Submission, SyncTombstone
+
+SYNC_TOMBSTONE_RETENTION = timedelta(days=30)
+
+# (entity, entity ID, class ID, user ID)
+Tombstone = Tuple[str, int, Optional[int], Optional[int]]
+
+
+def record_tombstones(connection, tombstones: Iterable[Tombstone]):
+    """
+    Insert tombstones for deleted rows.
+
+    Args:
+        connection: Connection of the transaction the rows were deleted in
+        tombstones: (entity, entity ID, class ID, user ID) tuples
+    """
+    now = datetime.utcnow()
+    rows = [
+        {"entity": entity, "entity_id": entity_id, "class_id": class_id, "user_id": user_id, "deleted_at": now}
+        for entity, entity_id, class_id, user_id in tombstones
+    ]
+    if rows:
+        connection.execute(insert(SyncTombstone), rows)
+
+
+def _submission_class_id(session: Session, submission: Submission) -> Optional[int]:
+    if submission.assignment is not None:
+        return submission.assignment.class_id
+    return session.execute(select(Assignment.class_id).where(Assignment.id == submission.assignment_id)).scalar()
+
+
+def _tombstone(session: Session, instance) -> Optional[Tombstone]:
+    if isinstance(instance, Assignment):
+        return ("assignment", instance.id, instance.class_id, None)
+    if isinstance(instance, Submission):
+        return ("submission", instance.id, _submission_class_id(session, instance), instance.student_id)
+    if isinstance(instance, Schedule):
+        return ("schedule", instance.id, instance.class_id, None)
+    if isinstance(instance, ScheduleRule):
+        return ("schedule_rule", instance.id, instance.class_id, None)
+    if isinstance(instance, Announcement):
+        return ("announcement", instance.id, None, None)
+    if isinstance(instance, Enrollment):
+        return ("enrollment", instance.class_id, instance.class_id, instance.student_id)
+    if isinstance(instance, Class):
+        return ("class", instance.id, instance.id, instance.teacher_id)
+    return None
+
+
+@event.listens_for(Session, "before_flush")
+def _record_deletions(session, flush_context, instances):
+    # Read before the flush, while parents of deleted rows still exist
+    tombstones = [t for t in (_tombstone(session, instance) for instance in session.deleted) if t is not None]
+    if tombstones:
+        record_tombstones(session.connection(), tombstones)
+
+
+def delete_expired_tombstones(db: Session, deleted_before: datetime) -> int:
+    """
+    Delete tombstones recorded before a cutoff.
+
+    Args:
+        db: Database session
+        deleted_before: Remove tombstones older than this time
+
+    Returns:
+        int: Number of tombstones removed
+    """
+    try:
+        removed = db.query(SyncTombstone).filter(SyncTombstone.deleted_at < deleted_before).delete(synchronize_session=False)
+        db.commit()
+        return removed
+    except Exception:
+        db.rollback()
+        raise
+
+
+def sweep_tombstones() -> int:
+    """Delete tombstones past SYNC_TOMBSTONE_RETENTION; returns how many were removed"""
+    db = SessionLocal()
+    try:
+        return delete_expired_tombstones(db, datetime.utcnow() - SYNC_TOMBSTONE_RETENTION)
+    finally:
+        db.close()